@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Benchmark: bag-of-words construction.
+
+Compares `create_dictionaries()` + `create_mm()` with `create_sparse_bow()`
+(+ `sparse_bow_to_mm()`) on the bundled `corpus_txt`, scaled up synthetically
+by sampling fixed-size token segments from the novels.
+
+Usage:
+    python benchmarks/create_mm_benchmark.py --docs 100000 --legacy-docs 2000
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+from pathlib import Path
+
+from dariah_topics import preprocessing as pre
+
+project_path = Path(__file__).absolute().parent.parent
+
+
+def synthetic_corpus(num_docs, doc_length=300, seed=0):
+    """Returns labels and token lists for `num_docs` synthetic documents.
+
+    Documents are segments of `doc_length` tokens drawn from `corpus_txt`.
+    Drawn segments are shared, not copied, so the corpus itself costs next
+    to no memory.
+    """
+    doclist = pre.create_document_list(str(project_path.joinpath('corpus_txt')))
+    segments = []
+    for text in pre.read_from_txt(doclist):
+        tokens = list(pre.tokenize(text))
+        segments.extend(tokens[i:i + doc_length]
+                        for i in range(0, len(tokens), doc_length))
+    rng = random.Random(seed)
+    docs = [rng.choice(segments) for _ in range(num_docs)]
+    labels = ['doc{:07d}'.format(n) for n in range(num_docs)]
+    return labels, docs
+
+
+def legacy_path(labels, docs):
+    id_types, doc_ids = pre.create_dictionaries(labels, docs)
+    return pre.create_mm(labels, docs, id_types, doc_ids)
+
+
+def sparse_path(labels, docs):
+    matrix, id_types, doc_ids = pre.create_sparse_bow(labels, docs)
+    return matrix
+
+
+def sparse_path_dataframe(labels, docs):
+    return pre.sparse_bow_to_mm(sparse_path(labels, docs))
+
+
+def measure(function, *args):
+    """Returns (seconds, peak MiB). Timing and tracing are separate runs."""
+    start = time.perf_counter()
+    function(*args)
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=100000,
+                        help='number of synthetic documents (default: %(default)s)')
+    parser.add_argument('--legacy-docs', type=int, default=2000,
+                        help='number of documents for the create_dictionaries() + '
+                             'create_mm() path (default: %(default)s)')
+    parser.add_argument('--doc-length', type=int, default=300,
+                        help='tokens per synthetic document (default: %(default)s)')
+    args = parser.parse_args()
+
+    labels, docs = synthetic_corpus(args.docs, args.doc_length)
+    print("{:>9} {:<36} {:>10} {:>10}".format('docs', 'path', 'seconds', 'peak MiB'))
+    runs = [(args.legacy_docs, 'create_dictionaries + create_mm', legacy_path),
+            (args.legacy_docs, 'create_sparse_bow', sparse_path),
+            (args.legacy_docs, 'create_sparse_bow + sparse_bow_to_mm', sparse_path_dataframe),
+            (args.docs, 'create_sparse_bow', sparse_path),
+            (args.docs, 'create_sparse_bow + sparse_bow_to_mm', sparse_path_dataframe)]
+    for num_docs, name, function in runs:
+        seconds, peak = measure(function, labels[:num_docs], docs[:num_docs])
+        print("{:>9} {:<36} {:>10.2f} {:>10.1f}".format(num_docs, name, seconds, peak))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Benchmark: streaming segmentation.
+
+Writes a corpus of `--megabytes` MiB by repeating the `corpus_txt` novels
+into `--files` files and compares, per MiB of text, reading the files,
+`stream_tokens()` and `segmenter()` on the token streams (fixed-size,
+paragraph-aware and fed by `tokenize_corpus()` worker processes). It also
+reports the former character-level segmenter on a single novel, the cost of
+segmenting alone and the peak memory of segmenting one file.
+
+Tokenizing dominates; `segmenter()` itself adds little, so throughput scales
+with the number of tokenizing processes.
+
+Usage:
+    python benchmarks/segmenter_benchmark.py --megabytes 300 --files 30
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+from pathlib import Path
+
+from dariah_topics import preprocessing as pre
+from dariah_topics.doclist import PathDocList
+
+project_path = Path(__file__).absolute().parent.parent
+
+
+def legacy_segmenter(doc_txt, length=1000):
+    """`segmenter()` as of version 0.1 (characters, first document only)."""
+    doc = next(doc_txt)
+    for i, word in enumerate(doc):
+        if i % length == 0:
+            yield doc[i : i + length]
+
+
+def write_corpus(folder, megabytes, files):
+    """Writes `files` files of about `megabytes` MiB in total."""
+    doclist = pre.create_document_list(str(project_path.joinpath('corpus_txt')))
+    text = '\n\n'.join(pre.read_from_txt(doclist))
+    repeat = max(1, round(megabytes * 2**20 / files / len(text.encode('utf-8'))))
+    for n in range(files):
+        with open(str(Path(folder, 'doc{:04d}.txt'.format(n))), 'w', encoding='utf-8') as f:
+            for _ in range(repeat):
+                f.write(text)
+    return PathDocList(folder, '*.txt')
+
+
+def read_blocks(doclist):
+    for file in doclist:
+        with open(file, 'r', encoding='utf-8') as f:
+            deque(iter(lambda: f.read(2**20), ''), maxlen=0)
+
+
+def tokens_only(doclist):
+    for file in doclist:
+        deque(pre.stream_tokens(file), maxlen=0)
+
+
+def segments_fixed(doclist):
+    docs = (pre.stream_tokens(file) for file in doclist)
+    deque(pre.segmenter(docs, length=1000, doclist=doclist), maxlen=0)
+
+
+def segments_fuzzy(doclist):
+    docs = (pre.stream_tokens(file, paragraphs=True) for file in doclist)
+    deque(pre.segmenter(docs, length=1000, tolerance=0.05, doclist=doclist), maxlen=0)
+
+
+def segments_parallel(doclist, workers):
+    docs = pre.tokenize_corpus(doclist, workers=workers, chunksize=1)
+    deque(pre.segmenter(docs, length=1000, doclist=doclist), maxlen=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--megabytes', type=int, default=300,
+                        help='corpus size in MiB (default: %(default)s)')
+    parser.add_argument('--files', type=int, default=30,
+                        help='number of files (default: %(default)s)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='processes for tokenize_corpus() (default: number of CPUs)')
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    try:
+        doclist = write_corpus(folder, args.megabytes, args.files)
+        megabytes = sum(path.stat().st_size for path in doclist.full_paths()) / 2**20
+        print("{:.0f} MiB in {} files".format(megabytes, len(doclist)))
+        print("{:<40} {:>10} {:>10}".format('step', 'sec', 'MiB / sec'))
+        runs = [('read', read_blocks),
+                ('stream_tokens', tokens_only),
+                ('segmenter, 1000 tokens', segments_fixed),
+                ('segmenter, paragraphs, tolerance 5%', segments_fuzzy),
+                ('segmenter over tokenize_corpus()',
+                 lambda doclist: segments_parallel(doclist, args.workers))]
+        for name, function in runs:
+            start = time.perf_counter()
+            function(doclist)
+            seconds = time.perf_counter() - start
+            print("{:<40} {:>10.2f} {:>10.1f}".format(name, seconds, megabytes / seconds))
+        print("segments per file:", doclist.segment_counts()[0])
+
+        tokens = list(pre.stream_tokens(doclist[0]))
+        start = time.perf_counter()
+        deque(pre.segmenter([tokens], length=1000), maxlen=0)
+        seconds = time.perf_counter() - start
+        print("{:<40} {:>10.2f} {:>10.1f}".format('segmenter only, tokens of one file',
+                                                   seconds, megabytes / len(doclist) / seconds))
+
+        novel = str(project_path.joinpath('corpus_txt', 'Doyle_AStudyinScarlet.txt'))
+        size = Path(novel).stat().st_size / 2**20
+        start = time.perf_counter()
+        deque(legacy_segmenter(pre.read_from_txt([novel])), maxlen=0)
+        seconds = time.perf_counter() - start
+        print("{:<40} {:>10.2f} {:>10.1f}".format('legacy segmenter, one novel', seconds,
+                                                   size / seconds))
+
+        first = doclist[:1]
+        tracemalloc.start()
+        deque(pre.segmenter((pre.stream_tokens(file) for file in first)), maxlen=0)
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+        print("peak MiB segmenting a {:.0f} MiB file: {:.1f}".format(megabytes / len(doclist),
+                                                                     peak))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Benchmark: tokenization.
+
+Compares the former `tokenize()` implementation (pattern compiled per call,
+five `regex.sub` passes) with `Tokenizer` on the `corpus_txt` novels and
+reports time per megabyte and the peak of additional memory allocated per
+document.
+
+Usage:
+    python benchmarks/tokenize_benchmark.py --repeat 5
+"""
+
+import argparse
+import time
+import tracemalloc
+from pathlib import Path
+
+import regex
+
+from dariah_topics import preprocessing as pre
+
+project_path = Path(__file__).absolute().parent.parent
+
+
+def legacy_normalize(doc_txt, lower=True):
+    """Normalization of `tokenize()` as of version 0.1, kept for comparison."""
+    if lower:
+        doc_txt = doc_txt.lower()
+    doc_txt = regex.sub("\\.", "", doc_txt)
+    doc_txt = regex.sub("‒", " ", doc_txt)
+    doc_txt = regex.sub("–", " ", doc_txt)
+    doc_txt = regex.sub("—", " ", doc_txt)
+    return regex.sub("―", " ", doc_txt)
+
+
+def legacy_tokenize(doc_txt, expression=pre.regular_expression, lower=True):
+    """`tokenize()` as of version 0.1, kept for comparison."""
+    pattern = regex.compile(expression)
+    doc_txt = legacy_normalize(doc_txt, lower)
+    return [match.group() for match in pattern.finditer(doc_txt)]
+
+
+def copies(doc_txt, tokenizer):
+    """Number of full document copies made by `tokenizer.normalize()`."""
+    doc_txt = doc_txt.lower()
+    return 1 + sum(old in doc_txt for old, new in tokenizer.normalization)
+
+
+def measure(function, texts, repeat):
+    """Returns (seconds, peak MiB of the largest document)."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            function(text)
+    seconds = (time.perf_counter() - start) / repeat
+    peak = 0
+    for text in texts:
+        tracemalloc.start()
+        function(text)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return seconds, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='passes over the corpus (default: %(default)s)')
+    args = parser.parse_args()
+
+    doclist = pre.create_document_list(str(project_path.joinpath('corpus_txt')))
+    texts = list(pre.read_from_txt(doclist))
+    megabytes = sum(len(text.encode('utf-8')) for text in texts) / 2**20
+    tokenizer = pre.Tokenizer()
+    assert all(legacy_tokenize(text) == tokenizer.tokenize(text) for text in texts)
+
+    print("{:.1f} MiB in {} documents".format(megabytes, len(texts)))
+    print("document copies during normalization: legacy {}, Tokenizer {}".format(
+        6 * len(texts), sum(copies(text, tokenizer) for text in texts)))
+    print("{:<36} {:>12} {:>16}".format('step', 'sec / MiB', 'peak MiB / doc'))
+    runs = [('legacy normalization (5 x regex.sub)', legacy_normalize),
+            ('legacy tokenize', legacy_tokenize),
+            ('Tokenizer.normalize only', tokenizer.normalize),
+            ('Tokenizer.tokenize', tokenizer.tokenize),
+            ('list(tokenize())', lambda text: list(pre.tokenize(text)))]
+    for name, function in runs:
+        seconds, peak = measure(function, texts, args.repeat)
+        print("{:<36} {:>12.4f} {:>16.2f}".format(name, seconds / megabytes, peak))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,13 @@
 """
-The `dariah_topics` package currently offers four modules:
+The `dariah_topics` package currently offers nine modules:
 
 * `dariah_topics.preprocessing` contains preprocessing code
 * `dariah_topics.visualization` offers visualization stuff that depends on PyLDAvis
 * `dariah_topics.mallet` provides a wrapper that calls mallet
 * `dariah_topics.evaluation` provides coherence measures
+* `dariah_topics.cache` caches the results of preprocessing stages on disk
+* `dariah_topics.feature_selection` selects types by corpus and document frequency
+* `dariah_topics.vocabulary` maps types to ids and back in compact arrays
+* `dariah_topics.corpusstore` keeps a bag-of-words up to date as documents are added or removed
+* `dariah_topics.sweep` trains and scores models for a grid of topic numbers in parallel
 """
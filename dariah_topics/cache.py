@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Pipeline Cache.
+
+This module stores the results of preprocessing stages on disk, keyed by a
+hash of their inputs, so that repeated runs over an unchanged corpus skip the
+expensive steps. Provided by `DARIAH-DE`_.
+
+Keys are chained: a stage's key is computed from the keys of the stages it
+depends on and its own parameters, while the first stage is keyed by the
+fingerprints of the input files. A changed file or parameter therefore
+invalidates exactly the stages that depend on it.
+
+.. _DARIAH-DE:
+    https://de.dariah.eu
+    https://github.com/DARIAH-DE
+"""
+
+__author__ = "DARIAH-DE"
+__authors__ = "Steffen Pielstroem, Philip Duerholt, Sina Bock, Severin Simmler"
+__email__ = "pielstroem@biozentrum.uni-wuerzburg.de"
+__version__ = "0.1"
+__date__ = "2017-03-01"
+
+from dariah_topics import preprocessing as pre
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+log = logging.getLogger('cache')
+log.addHandler(logging.NullHandler())
+
+#: Part of every key; increment when a stage's output changes for the same input
+CACHE_VERSION = 1
+
+
+def digest(*parts):
+    """Hashes `parts` (strings, numbers, tuples, ...) to a hex key.
+
+    Args:
+        *parts: Values with a stable `repr()`.
+
+    Returns:
+        SHA-256 hex digest.
+    """
+    return hashlib.sha256(repr((CACHE_VERSION,) + parts).encode('utf-8')).hexdigest()
+
+
+def file_fingerprint(path, content=False):
+    """Identifies the current version of a file.
+
+    Args:
+        path (str): Path to the file.
+        content (bool): Hash the file's content instead of using its
+            modification time and size. Slower, but survives copying or
+            touching files.
+
+    Returns:
+        Tuple of absolute path and either (mtime, size) or content hash.
+    """
+    path = os.path.abspath(path)
+    if not content:
+        stat = os.stat(path)
+        return (path, stat.st_mtime_ns, stat.st_size)
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), b''):
+            sha.update(block)
+    return (path, sha.hexdigest())
+
+
+class PipelineCache:
+    """Size-bounded on-disk store of pickled stage results.
+
+    Entries are files named after their key. Reading an entry marks it as
+    recently used; when the total size exceeds `max_size`, least recently
+    used entries are deleted.
+
+    Args:
+        path (str): Cache folder, created if necessary.
+        max_size (int): Maximum total size in bytes. Defaults to 1 GiB.
+
+    Example:
+        >>> cache = PipelineCache(tempfile.mkdtemp())
+        >>> cache.memoize('square', digest('square', 4), lambda x: x * x, 4)
+        16
+        >>> digest('square', 4) in cache
+        True
+    """
+
+    def __init__(self, path, max_size=2**30):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        os.makedirs(path, exist_ok=True)
+
+    def _entry(self, key):
+        return os.path.join(self.path, key + '.pkl')
+
+    def _entries(self):
+        with os.scandir(self.path) as it:
+            return [entry for entry in it if entry.name.endswith('.pkl')]
+
+    def __contains__(self, key):
+        return os.path.exists(self._entry(key))
+
+    def __len__(self):
+        return len(self._entries())
+
+    @property
+    def size(self):
+        """Total size of all entries in bytes."""
+        self._size = sum(entry.stat().st_size for entry in self._entries())
+        return self._size
+
+    def get(self, key, default=None):
+        """Returns the value stored under `key`, or `default`."""
+        path = self._entry(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return default
+        except (EOFError, pickle.UnpicklingError):
+            log.warning("Discarding corrupt cache entry %s.", key)
+            self.discard(key)
+            return default
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return value
+
+    def put(self, key, value):
+        """Stores `value` under `key` and evicts old entries if necessary."""
+        if self._size is None:
+            self.size
+        path = self._entry(key)
+        try:
+            self._size -= os.path.getsize(path)
+        except OSError:
+            pass
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            self._size += os.path.getsize(tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        # the directory is only scanned when the running total says so
+        if self._size > self.max_size:
+            self.evict()
+
+    def discard(self, key):
+        """Removes the entry `key`, if present."""
+        try:
+            os.remove(self._entry(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self, max_size=None):
+        """Deletes least recently used entries until the cache fits `max_size`.
+
+        Args:
+            max_size (int): Defaults to the cache's `max_size`.
+        """
+        if max_size is None:
+            max_size = self.max_size
+        entries = [(entry.stat().st_mtime_ns, entry.stat().st_size, entry.path)
+                   for entry in self._entries()]
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= max_size:
+                break
+            log.debug("Evicting %s ...", path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
+
+    def clear(self):
+        """Deletes all entries."""
+        self.evict(0)
+
+    def memoize(self, stage, key, function, *args, **kwargs):
+        """Returns the cached result for `key` or computes and stores it.
+
+        Args:
+            stage (str): Stage name, for logging.
+            key (str): Key from `digest()`.
+            function (callable): Computes the result from `args` and `kwargs`.
+
+        Returns:
+            Result of `function`.
+        """
+        marker = object()
+        value = self.get(key, marker)
+        if value is not marker:
+            self.hits += 1
+            log.info("%s: using cached result.", stage)
+            return value
+        self.misses += 1
+        log.info("%s: computing ...", stage)
+        value = function(*args, **kwargs)
+        self.put(key, value)
+        return value
+
+
+def cached_tokenize(cache, doclist, content=False, workers=None, **kwargs):
+    """Reads and tokenizes TXT files, reusing tokens of unchanged files.
+
+    Args:
+        cache (PipelineCache): Cache to use.
+        doclist (list[str]): List of all documents in the corpus.
+        content (bool): Fingerprint files by content, see `file_fingerprint()`.
+        workers (int): Processes for the documents not in the cache, see
+            `preprocessing.tokenize_corpus()`.
+        **kwargs: Passed on to `preprocessing.tokenize()`.
+
+    Returns:
+        Tuple of list of token lists and a key identifying the result.
+    """
+    params = tuple(sorted(kwargs.items()))
+    keys = [digest('tokens', file_fingerprint(file, content), params) for file in doclist]
+    tokens = [cache.get(key) for key in keys]
+    missing = [n for n, doc_tokens in enumerate(tokens) if doc_tokens is None]
+    cache.hits += len(doclist) - len(missing)
+    cache.misses += len(missing)
+    log.info("Tokenizing %s of %s documents ...", len(missing), len(doclist))
+    if missing:
+        computed = pre.tokenize_corpus([doclist[n] for n in missing], workers=workers, **kwargs)
+        for n, doc_tokens in zip(missing, computed):
+            cache.put(keys[n], doc_tokens)
+            tokens[n] = doc_tokens
+    return tokens, digest('corpus', tuple(keys))
+
+
+def preprocess(doclist, cache, mfw=200, hapax=True, content=False, workers=None, **kwargs):
+    """Runs the preprocessing pipeline with every stage cached.
+
+    Stages: `tokenize_corpus()`, `create_sparse_bow()` + `sparse_bow_to_mm()`,
+    `find_stopwords()`, `find_hapax()` and `remove_features()`.
+
+    Args:
+        doclist (list[str]): List of all documents in the corpus.
+        cache (PipelineCache): Cache to use.
+        mfw (int): Number of most frequent words to remove; 0 keeps them.
+        hapax (bool): Remove hapax legomena.
+        content (bool): Fingerprint files by content, see `file_fingerprint()`.
+        workers (int): Processes for tokenizing, see `tokenize_corpus()`.
+        **kwargs: Passed on to `preprocessing.tokenize()`.
+
+    Returns:
+        Tuple of cleaned `sparse_bow` DataFrame, `id_types` and `doc_ids`.
+
+    Example:
+        >>> cache = PipelineCache('.dariah_cache')             # doctest: +SKIP
+        >>> sparse_bow, id_types, doc_ids = preprocess(doclist, cache)  # doctest: +SKIP
+    """
+    doclist = list(doclist)
+    tokens, key = cached_tokenize(cache, doclist, content, workers, **kwargs)
+    labels = list(pre.get_labels(doclist))
+
+    def bow():
+        matrix, id_types, doc_ids = pre.create_sparse_bow(labels, tokens)
+        return pre.sparse_bow_to_mm(matrix), id_types, doc_ids
+
+    key = digest('bow', key, tuple(labels))
+    sparse_bow, id_types, doc_ids = cache.memoize('create_sparse_bow', key, bow)
+
+    features = set()
+    if mfw:
+        features.update(cache.memoize('find_stopwords', digest('stopwords', key, mfw),
+                                      pre.find_stopwords, sparse_bow, id_types, mfw))
+    if hapax:
+        features.update(cache.memoize('find_hapax', digest('hapax', key),
+                                      pre.find_hapax, sparse_bow, id_types))
+    if not features:
+        return sparse_bow, id_types, doc_ids
+    sparse_bow = cache.memoize('remove_features', digest('remove', key, mfw, hapax),
+                               pre.remove_features, sparse_bow, id_types, features)
+    return sparse_bow, id_types, doc_ids
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Incremental Corpus Store.
+
+This module maintains the bag-of-words of a growing corpus on disk, provided
+by `DARIAH-DE`_. Documents can be added, re-counted and deleted without
+rebuilding the whole matrix:
+
+* type ids (kept in a `Vocabulary`) and document ids are assigned once and
+  never change or get reused;
+* only new or modified files are read, tokenized and counted;
+* deleted documents are tombstoned, i.e. keep their id but lose their counts.
+
+Row `i` of the stored matrix is the document with doc_id `i + 1`, column `j`
+the type with token_id `j + 1`, as everywhere in `dariah_topics.preprocessing`.
+
+.. _DARIAH-DE:
+    https://de.dariah.eu
+    https://github.com/DARIAH-DE
+"""
+
+__author__ = "DARIAH-DE"
+__authors__ = "Steffen Pielstroem, Philip Duerholt, Sina Bock, Severin Simmler"
+__email__ = "pielstroem@biozentrum.uni-wuerzburg.de"
+__version__ = "0.1"
+__date__ = "2017-03-01"
+
+from collections import namedtuple
+from dariah_topics import preprocessing as pre
+from dariah_topics.cache import file_fingerprint
+from dariah_topics.vocabulary import Vocabulary
+import csv
+import json
+import logging
+import numpy as np
+import os
+import shutil
+from scipy import sparse
+
+log = logging.getLogger('corpusstore')
+log.addHandler(logging.NullHandler())
+
+StoreUpdate = namedtuple('StoreUpdate', ['added', 'changed', 'deleted'])
+StoreUpdate.__doc__ = """Document ids affected by an update of a CorpusStore"""
+
+_FORMAT = 1
+
+
+class CorpusStore:
+    """Bag-of-words of a corpus that can be updated document by document.
+
+    Args:
+        path (str): Folder of the store. An existing store is loaded, else
+            the folder is created on `save()`.
+        **kwargs: Tokenizer parameters passed on to `preprocessing.tokenize()`,
+            e.g. `lower`. They are saved with the store; opening an existing
+            store with different parameters raises ValueError, as the
+            existing counts would not match.
+
+    Example:
+        >>> store = CorpusStore('grenzboten_store')             # doctest: +SKIP
+        >>> store.update(PathDocList('/mnt/data/grenzboten/txt'))  # doctest: +SKIP
+        StoreUpdate(added=[1, 2, ...], changed=[], deleted=[])
+        >>> store.save()                                        # doctest: +SKIP
+        >>> sparse_bow = store.sparse_bow()                     # doctest: +SKIP
+    """
+
+    def __init__(self, path, **kwargs):
+        self.path = path
+        self.tokenizer = kwargs
+        self.id_types = Vocabulary()
+        self._paths = []
+        self._labels = []
+        self._fingerprints = []
+        self._deleted = []
+        self._path_ids = {}
+        self._matrix = sparse.csr_matrix((0, 0), dtype=np.int64)
+        self._pending = {}
+        if os.path.exists(os.path.join(path, 'meta.json')):
+            self._load(kwargs)
+
+    def _load(self, tokenizer):
+        with open(os.path.join(self.path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta['format'] != _FORMAT:
+            raise ValueError("Unsupported store format %r." % meta['format'])
+        if tokenizer and tokenizer != meta['tokenizer']:
+            raise ValueError("Store %s was built with tokenizer parameters %r, not %r."
+                             % (self.path, meta['tokenizer'], tokenizer))
+        self.tokenizer = meta['tokenizer']
+        self.id_types = Vocabulary.load(os.path.join(self.path, 'vocabulary'))
+        with open(os.path.join(self.path, 'documents.tsv'), encoding='utf-8', newline='') as f:
+            for doc_id, path, label, mtime, size, deleted in csv.reader(f, delimiter='\t'):
+                self._append(path, label, (path, int(mtime), int(size)), deleted == '1')
+        self._matrix = pre.load_bow_npy(os.path.join(self.path, 'bow'), mmap_mode=None)
+        log.info("Loaded store with %s documents and %s types.", len(self), len(self.id_types))
+
+    def _append(self, path, label, fingerprint, deleted=False):
+        self._paths.append(path)
+        self._labels.append(label)
+        self._fingerprints.append(fingerprint)
+        self._deleted.append(deleted)
+        if not deleted:
+            self._path_ids[path] = len(self._paths)
+        return len(self._paths)
+
+    def __len__(self):
+        """Number of live (not deleted) documents."""
+        return len(self._path_ids)
+
+    def __contains__(self, path):
+        return os.path.abspath(path) in self._path_ids
+
+    @property
+    def doc_ids(self):
+        """Dictionary of label : doc_id pairs of the live documents."""
+        return {self._labels[doc_id - 1]: doc_id for doc_id in sorted(self._path_ids.values())}
+
+    def live_doc_ids(self):
+        """NumPy array of the ids of all live documents, ascending."""
+        return np.array(sorted(self._path_ids.values()), dtype=np.int64)
+
+    def _count(self, doc_ids, workers=None):
+        """Tokenizes and counts the files of `doc_ids` into `_pending`."""
+        if not doc_ids:
+            return
+        paths = [self._paths[doc_id - 1] for doc_id in doc_ids]
+        log.info("Counting %s documents ...", len(paths))
+        tokens = pre.tokenize_corpus(paths, workers=workers, **self.tokenizer)
+        for doc_id, token_ids, counts in pre.stream_bow(zip(doc_ids, tokens), self.id_types):
+            self._pending[doc_id - 1] = (token_ids - 1, counts)
+
+    def add(self, doclist, labels=None, workers=None):
+        """Adds new documents and re-counts modified ones.
+
+        Args:
+            doclist (list[str]): Paths of the documents, e.g. a `PathDocList`.
+            labels (list[str]): Labels of the documents. Defaults to
+                `doclist.labels()` if available, else the file names as in
+                `preprocessing.get_labels()`.
+            workers (int): Processes for tokenizing, see
+                `preprocessing.tokenize_corpus()`.
+
+        Returns:
+            StoreUpdate with the ids of added and changed documents.
+        """
+        paths = [os.path.abspath(path) for path in doclist]
+        if labels is None:
+            labels = doclist.labels() if hasattr(doclist, 'labels') else pre.get_labels(paths)
+        added, changed = [], []
+        for path, label in zip(paths, labels):
+            fingerprint = file_fingerprint(path)
+            doc_id = self._path_ids.get(path)
+            if doc_id is None:
+                added.append(self._append(path, label, fingerprint))
+            elif self._fingerprints[doc_id - 1] != fingerprint:
+                self._fingerprints[doc_id - 1] = fingerprint
+                self._labels[doc_id - 1] = label
+                changed.append(doc_id)
+        self._count(added + changed, workers)
+        log.debug("%s documents added, %s changed.", len(added), len(changed))
+        return StoreUpdate(added, changed, [])
+
+    def remove(self, doclist):
+        """Tombstones documents: their ids stay reserved, their counts are dropped.
+
+        Args:
+            doclist (list[str]): Paths of the documents to remove; unknown
+                paths are ignored.
+
+        Returns:
+            StoreUpdate with the ids of deleted documents.
+        """
+        deleted = []
+        for path in doclist:
+            doc_id = self._path_ids.pop(os.path.abspath(path), None)
+            if doc_id is not None:
+                self._deleted[doc_id - 1] = True
+                self._pending[doc_id - 1] = (np.zeros(0, dtype=np.int64),
+                                             np.zeros(0, dtype=np.int64))
+                deleted.append(doc_id)
+        log.debug("%s documents deleted.", len(deleted))
+        return StoreUpdate([], [], deleted)
+
+    def update(self, doclist, labels=None, workers=None):
+        """Synchronizes the store with `doclist`.
+
+        New documents are added, modified ones re-counted and documents
+        missing from `doclist` tombstoned.
+
+        Args: see `add()`
+
+        Returns:
+            StoreUpdate
+        """
+        doclist_paths = {os.path.abspath(path) for path in doclist}
+        deleted = self.remove([path for path in self._path_ids if path not in doclist_paths])
+        update = self.add(doclist, labels, workers)
+        return update._replace(deleted=deleted.deleted)
+
+    def matrix(self):
+        """Document-term matrix of all doc ids; tombstoned rows are empty.
+
+        Returns:
+            scipy.sparse.csr_matrix, row `doc_id - 1`, column `token_id - 1`.
+        """
+        shape = (len(self._paths), len(self.id_types))
+        if not self._pending and self._matrix.shape == shape:
+            return self._matrix
+        old = self._matrix.tocsr(copy=True)
+        old.resize(shape)
+        keep = np.ones(shape[0])
+        rows = np.array(sorted(self._pending), dtype=np.int64)
+        keep[rows] = 0
+        lengths = np.zeros(shape[0], dtype=np.int64)
+        lengths[rows] = [len(self._pending[row][0]) for row in rows]
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        empty = np.zeros(0, dtype=np.int64)
+        indices = np.concatenate([empty] + [self._pending[row][0] for row in rows])
+        data = np.concatenate([empty] + [self._pending[row][1] for row in rows])
+        new = sparse.csr_matrix((data, indices, indptr), shape=shape)
+        matrix = (sparse.diags(keep).dot(old) + new).astype(np.int64).tocsr()
+        matrix.eliminate_zeros()
+        matrix.sort_indices()
+        self._matrix = matrix
+        self._pending = {}
+        return matrix
+
+    def sparse_bow(self):
+        """Live documents as Multiindexed DataFrame, see `create_mm()`."""
+        sparse_bow = pre.sparse_bow_to_mm(self.matrix())
+        deleted = [doc_id for doc_id, is_deleted in enumerate(self._deleted, 1) if is_deleted]
+        if deleted:
+            sparse_bow = sparse_bow.drop(deleted, level='doc_id')
+        return sparse_bow
+
+    def _replace_folder(self, name, save, data):
+        """Saves into a new folder, as the old one may be memory-mapped."""
+        folder = os.path.join(self.path, name)
+        save(data, folder + '.tmp')
+        if os.path.exists(folder):
+            os.replace(folder, folder + '.old')
+        os.replace(folder + '.tmp', folder)
+        shutil.rmtree(folder + '.old', ignore_errors=True)
+
+    def save(self):
+        """Writes the store to its folder."""
+        matrix = self.matrix()
+        os.makedirs(self.path, exist_ok=True)
+        self._replace_folder('bow', pre.save_bow_npy, matrix)
+        self._replace_folder('vocabulary', Vocabulary.save, self.id_types)
+        with open(os.path.join(self.path, 'documents.tsv'), 'w', encoding='utf-8',
+                  newline='') as f:
+            writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+            for doc_id, (path, label, fingerprint, deleted) in enumerate(
+                    zip(self._paths, self._labels, self._fingerprints, self._deleted), 1):
+                writer.writerow([doc_id, path, label, fingerprint[1], fingerprint[2],
+                                 int(deleted)])
+        with open(os.path.join(self.path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'format': _FORMAT, 'tokenizer': self.tokenizer}, f)
+        log.info("Saved store with %s documents and %s types.", len(self), len(self.id_types))
@@ -18,12 +18,30 @@ implementations of varying powerfulness, all have the following in common:
 Segments
 --------
 
+Long documents are often split into segments of about the same number of
+tokens. `BaseDocList.flatten_segments` records how many segments each
+document has while a segmenter runs; `PathDocList.with_segment_files` then
+expects one file per segment.
+
+A `SegmentIndex` avoids both re-segmenting and segment files: it stores, in
+one offsets file per corpus, the byte range of every segment in the original
+files, so segments are read by seeking. `BaseDocList.segment_index` builds
+the index once and reloads it afterwards.
+
 """
 
 from pathlib import Path
 from itertools import zip_longest
 from abc import abstractmethod, abstractproperty
+from collections.abc import Sequence
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from copy import deepcopy
+from dariah_topics import preprocessing as pre
+import csv
+import fnmatch
+import json
+import numpy as np
+import os
 
 class BaseDocList:
     """
@@ -62,7 +80,7 @@ class BaseDocList:
         chooses.
 
         Note:
-            Subclasses may implement a method `_get_item(self, index)`, with
+            Subclasses may implement a method `_getitem(self, index)`, with
             index being integer or slice, to speed access up.
         """
         pass
@@ -84,7 +102,7 @@ class BaseDocList:
         """
         When used as an iterable, this object looks like an iterable of full paths.
         """
-        return iter(self.full_paths(as_str=True))
+        return (self.full_path(doc, as_str=True) for doc in self.get_docs())
 
     def __len__(self):
         """
@@ -96,9 +114,9 @@ class BaseDocList:
         """
         When used as a sequence, this object looks like a sequence of full paths.
         """
-        try:
+        if hasattr(self, '_getitem'):
             selection = self._getitem(index)
-        except AttributeError:
+        else:
             selection = self.get_docs()[index]
 
         if isinstance(index, slice):
@@ -182,6 +200,33 @@ class BaseDocList:
                 for segment_no in range(segment_count):
                     yield (document, segment_no)
 
+    def segment_index(self, index_file, segment_size=1000, tolerance=None, **kwargs):
+        """
+        Returns the segment index stored in `index_file`, building and saving
+        it first if the file is missing or does not match this list, the
+        parameters or the current state of the files.
+
+        The segment counts are recorded as by `flatten_segments`.
+
+        Args:
+            index_file (str): Path of the offsets file.
+            segment_size, tolerance, **kwargs: see `SegmentIndex.build`.
+
+        Returns:
+            SegmentIndex
+        """
+        index = None
+        if os.path.exists(str(index_file)):
+            try:
+                index = SegmentIndex.load(index_file, self)
+            except ValueError:
+                index = None
+        if index is None or not index.matches(segment_size, tolerance, kwargs):
+            index = SegmentIndex.build(self, segment_size, tolerance, **kwargs)
+            index.save(index_file)
+        self._segment_counts = index.segment_counts()
+        return index
+
     def segment_filenames(self,
                           format="{path.stem}.{segment:0{maxwidth}d}{path.suffix}",
                           basepath=None,
@@ -260,6 +305,10 @@ class PathDocList(BaseDocList):
         incorporated into the file names. I.e., this version does not know
         anymore about segments but rather has a file name for each segment.
 
+        Notes:
+            To read segments from the original files instead of writing one
+            file per segment, use `segment_index`.
+
         Args:
             pattern (str): A `strings.Formatter` pattern that describes how
                 to form each filename. The following formatter variables are
@@ -282,3 +331,435 @@ class PathDocList(BaseDocList):
         result.basepath = basepath
         result._files = list(self.segment_filenames(basepath='', **kwargs))
         return result
+
+
+def _folder_key(path):
+    """Identifies a folder independent of symlinks leading to it."""
+    stat = os.stat(path)
+    return stat.st_dev, stat.st_ino
+
+
+def _scan_folder(basepath, folder, pattern):
+    """
+    Lists one folder: files matching `pattern` as (relative path, size,
+    mtime) and subfolders as (relative path, folder key). Hidden entries are
+    skipped, as by `glob`. Symlinks are followed, as by `glob`.
+    """
+    files, folders = [], []
+    with os.scandir(os.path.join(basepath, folder)) as it:
+        for entry in it:
+            if entry.name.startswith('.'):
+                continue
+            relative = os.path.join(folder, entry.name) if folder else entry.name
+            if entry.is_dir():
+                folders.append((relative, _folder_key(entry.path)))
+            elif entry.is_file() and fnmatch.fnmatchcase(entry.name, pattern):
+                stat = entry.stat()
+                files.append((relative, stat.st_size, stat.st_mtime_ns))
+    return files, folders
+
+
+def _scan(basepath, pattern, recursive, workers):
+    """
+    Lists all matching files below basepath, one thread pool task per folder.
+    Each folder is scanned once, even if symlinks lead to it several times or
+    form a loop.
+    """
+    files = []
+    visited = {_folder_key(basepath)}
+    with ThreadPoolExecutor(workers or min(32, 4 * (os.cpu_count() or 1))) as executor:
+        pending = {executor.submit(_scan_folder, basepath, '', pattern)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                found, folders = future.result()
+                files.extend(found)
+                if not recursive:
+                    continue
+                for folder, key in folders:
+                    if key not in visited:
+                        visited.add(key)
+                        pending.add(executor.submit(_scan_folder, basepath, folder, pattern))
+    files.sort()
+    return files
+
+
+def _encode_strings(strings):
+    """Returns a newline terminated UTF-8 buffer and the offsets of `strings`."""
+    data = [string.encode('utf-8') + b'\n' for string in strings]
+    offsets = np.zeros(len(data) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in data], out=offsets[1:])
+    return np.frombuffer(b''.join(data), dtype=np.uint8), offsets
+
+
+class _Strings(Sequence):
+    """
+    Lazy sequence of the strings in a newline terminated UTF-8 buffer, for
+    the rows `rows` (a range).
+    """
+
+    def __init__(self, buffer, offsets, rows, convert=str):
+        self._buffer = buffer
+        self._offsets = offsets
+        self._rows = rows
+        self._convert = convert
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return _Strings(self._buffer, self._offsets, self._rows[index], self._convert)
+        row = self._rows[index]
+        string = bytes(self._buffer[self._offsets[row]:self._offsets[row + 1] - 1])
+        return self._convert(string.decode('utf-8'))
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence) or isinstance(other, str):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self):
+        return "<sequence of %d strings>" % len(self)
+
+    def __iter__(self, blocksize=65536):
+        """Decodes blocks of strings at once."""
+        rows = self._rows
+        if rows.step != 1:
+            yield from (self[n] for n in range(len(self)))
+            return
+        for start in range(rows.start, rows.stop, blocksize):
+            stop = min(start + blocksize, rows.stop)
+            block = bytes(self._buffer[self._offsets[start]:self._offsets[stop]])
+            yield from map(self._convert, block.decode('utf-8').split('\n')[:-1])
+
+
+class ManifestDocList(BaseDocList):
+    """
+    Document list backed by an on-disk manifest of path, size, modification
+    time and label of each file.
+
+    The manifest is a folder of NumPy arrays that is memory-mapped, so
+    opening even a list of millions of files takes no time, and documents
+    are only decoded while iterating. Use `build` to scan a corpus once and
+    `shard` to split it, e.g. across worker processes: shards are pickled as
+    the manifest path and their row range.
+
+    Args:
+        manifest (str): Folder written by `build`.
+        basepath (Path or str): Root directory of the files. Defaults to
+            the one the manifest was built for.
+
+    Example:
+        >>> docs = ManifestDocList.build('/mnt/data/grenzboten', 'grenzboten.manifest')  # doctest: +SKIP
+        >>> for path in docs.shard(0, 4):                     # doctest: +SKIP
+        ...     process(path)
+    """
+
+    _arrays = ('paths', 'path_offsets', 'labels', 'label_offsets', 'sizes', 'mtimes')
+
+    def __init__(self, manifest, basepath=None):
+        self.manifest = str(manifest)
+        with open(os.path.join(self.manifest, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.basepath = Path(self.meta['basepath'] if basepath is None else basepath)
+        self._segment_counts = None
+        self._data = {name: np.load(os.path.join(self.manifest, name + '.npy'), mmap_mode='r')
+                      for name in self._arrays}
+        self._rows = range(len(self._data['sizes']))
+
+    @classmethod
+    def build(cls, basepath, manifest, pattern='*.txt', recursive=True, workers=None):
+        """
+        Scans `basepath` for files and writes the manifest.
+
+        Folders are listed with `os.scandir` by a thread pool, one folder per
+        task. Like `glob`, symlinks to folders are followed; a folder reached
+        through several links is only listed once. Documents are sorted by
+        their relative path.
+
+        Args:
+            basepath (Path or str): Root directory of the corpus.
+            manifest (str): Folder to write the manifest to.
+            pattern (str): `fnmatch` pattern the file names must match.
+            recursive (bool): Include files in subfolders.
+            workers (int): Number of threads.
+
+        Returns:
+            ManifestDocList
+        """
+        files = _scan(str(basepath), pattern, recursive, workers)
+        paths = [path for path, size, mtime in files]
+        if any('\n' in path for path in paths):
+            raise ValueError("File names must not contain line breaks.")
+        arrays = {}
+        arrays['paths'], arrays['path_offsets'] = _encode_strings(paths)
+        arrays['labels'], arrays['label_offsets'] = _encode_strings(
+            os.path.splitext(os.path.basename(path))[0] for path in paths)
+        arrays['sizes'] = np.array([size for path, size, mtime in files], dtype=np.int64)
+        arrays['mtimes'] = np.array([mtime for path, size, mtime in files], dtype=np.int64)
+        os.makedirs(str(manifest), exist_ok=True)
+        for name in cls._arrays:
+            np.save(os.path.join(str(manifest), name + '.npy'), arrays[name])
+        meta = dict(basepath=str(basepath), pattern=pattern, recursive=recursive)
+        with open(os.path.join(str(manifest), 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        return cls(manifest)
+
+    def _strings(self, name, convert=str):
+        return _Strings(self._data[name], self._data[name[:-1] + '_offsets'],
+                        self._rows, convert)
+
+    def get_docs(self):
+        """Lazy sequence of the relative paths as `Path` objects."""
+        return self._strings('paths', Path)
+
+    def _getitem(self, index):
+        return self.get_docs()[index]
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __iter__(self):
+        """Full paths as strings, decoded lazily."""
+        prefix = os.path.join(str(self.basepath), '')
+        return (prefix + path for path in self._strings('paths'))
+
+    def label(self, document):
+        return Path(document).stem
+
+    def labels(self):
+        """Returns a lazy sequence of labels, as stored in the manifest."""
+        return self._strings('labels')
+
+    def sizes(self):
+        """NumPy array of the file sizes in bytes."""
+        return self._data['sizes'][self._rows.start:self._rows.stop:self._rows.step]
+
+    def mtimes(self):
+        """NumPy array of the modification times in nanoseconds."""
+        return self._data['mtimes'][self._rows.start:self._rows.stop:self._rows.step]
+
+    def shard(self, i, n):
+        """
+        Returns the `i`-th of `n` contiguous, about equally long parts.
+
+        Args:
+            i (int): Number of the shard, starting at 0.
+            n (int): Number of shards.
+        """
+        if not 0 <= i < n:
+            raise ValueError("Shard %s of %s does not exist." % (i, n))
+        result = self.copy()
+        result._rows = self._rows[i * len(self) // n:(i + 1) * len(self) // n]
+        result._segment_counts = None
+        return result
+
+    def __getstate__(self):
+        return dict(manifest=self.manifest, basepath=self.basepath, rows=self._rows,
+                    segment_counts=self._segment_counts)
+
+    def __setstate__(self, state):
+        self.__init__(state['manifest'], state['basepath'])
+        self._rows = state['rows']
+        self._segment_counts = state['segment_counts']
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _line_counts(path, tokenizer):
+    """
+    Returns byte offsets of the lines of a TXT file, the number of tokens in
+    each line and the indices of the lines that end a paragraph.
+    """
+    offsets = [0]
+    counts = []
+    paragraph_ends = []
+    in_paragraph = False
+    with open(path, 'rb') as f:
+        for line in f:
+            offsets.append(offsets[-1] + len(line))
+            text = line.decode('utf-8')
+            if text.strip():
+                counts.append(len(tokenizer.tokenize(text)))
+                in_paragraph = True
+            else:
+                counts.append(0)
+                if in_paragraph:
+                    paragraph_ends.append(len(counts) - 1)
+                in_paragraph = False
+    if in_paragraph:
+        paragraph_ends.append(len(counts))
+    return (np.array(offsets, dtype=np.int64), np.array(counts, dtype=np.int64),
+            np.array(paragraph_ends, dtype=np.int64))
+
+
+class SegmentIndex:
+    """
+    Byte ranges of the segments of all documents of a document list.
+
+    Each segment is stored as the byte range of the lines it touches plus the
+    number of tokens to skip in the first line and the number of tokens of the
+    segment, so reading a segment means seeking to its start, reading its
+    lines and tokenizing them. Segments are the same `preprocessing.segmenter`
+    produces from `preprocessing.stream_tokens`.
+
+    Notes:
+        Use `BaseDocList.segment_index` to create or load an index. Like
+        `stream_tokens`, this assumes tokens do not span line breaks.
+
+    Args:
+        doclist (BaseDocList): The documents.
+        offsets (ndarray): One row per segment with the columns `document`
+            (position in doclist), `segment`, `start`, `stop` (bytes),
+            `skip` and `count` (tokens), sorted by document and segment.
+        params (dict): `segment_size`, `tolerance` and `tokenizer` arguments.
+        fingerprints (list): Modification time and size of each file.
+    """
+
+    columns = ['document', 'segment', 'start', 'stop', 'skip', 'count']
+
+    def __init__(self, doclist, offsets, params, fingerprints):
+        self.doclist = doclist
+        self.offsets = offsets
+        self.params = params
+        self.fingerprints = fingerprints
+        self.tokenizer = pre.get_tokenizer(**params['tokenizer'])
+        # row of each document's first segment, and the number of rows
+        counts = np.bincount(offsets[:, 0], minlength=len(fingerprints))
+        self._first_rows = np.concatenate([[0], np.cumsum(counts)]).tolist()
+
+    @classmethod
+    def build(cls, doclist, segment_size=1000, tolerance=None, **kwargs):
+        """
+        Segments all documents and records the byte ranges of the segments.
+
+        Only the number of tokens per line is kept in memory, never the
+        tokens themselves.
+
+        Args:
+            doclist (BaseDocList): The documents, TXT files.
+            segment_size (int): Target size of segments in tokens.
+            tolerance (Number): If given, paragraphs (lines separated by empty
+                lines) are kept together as far as possible, see
+                `preprocessing.segment_bounds`. Otherwise segments have exactly
+                `segment_size` tokens, except the last of each document.
+            **kwargs: Passed on to `preprocessing.get_tokenizer()`.
+        """
+        tokenizer = pre.get_tokenizer(**kwargs)
+        rows = []
+        fingerprints = []
+        for number, path in enumerate(doclist.full_paths(as_str=True)):
+            fingerprints.append(_fingerprint(path))
+            line_offsets, counts, paragraph_ends = _line_counts(path, tokenizer)
+            cumulative = np.concatenate([[0], np.cumsum(counts)])
+            total = cumulative[-1]
+            if tolerance is None:
+                bounds = np.append(np.arange(0, total, segment_size), total) if total else [0]
+            else:
+                chunk_bounds = np.concatenate([[0], cumulative[paragraph_ends]])
+                bounds = pre.segment_bounds(chunk_bounds, segment_size, tolerance)
+            bounds = np.asarray(bounds, dtype=np.int64)
+            starts, stops = bounds[:-1], bounds[1:]
+            # line of the first token and line after the last token
+            first = np.searchsorted(cumulative, starts, 'right') - 1
+            after = np.searchsorted(cumulative, stops, 'left')
+            empty = starts == stops
+            rows.append(np.column_stack([
+                np.full(len(starts), number), np.arange(len(starts)),
+                np.where(empty, 0, line_offsets[first]),
+                np.where(empty, 0, line_offsets[after]),
+                np.where(empty, 0, starts - cumulative[first]), stops - starts]))
+        offsets = np.concatenate([np.zeros((0, 6), dtype=np.int64)] + rows).astype(np.int64)
+        params = dict(segment_size=segment_size, tolerance=tolerance, tokenizer=kwargs)
+        return cls(doclist, offsets, params, fingerprints)
+
+    def matches(self, segment_size, tolerance, tokenizer):
+        """True if the index was built with these parameters."""
+        return self.params == dict(segment_size=segment_size, tolerance=tolerance,
+                                   tokenizer=tokenizer)
+
+    def save(self, index_file):
+        """
+        Writes the index to one TSV file, the parameters and file
+        fingerprints as JSON in its first line.
+        """
+        meta = dict(params=self.params, documents=[
+            [str(document)] + fingerprint
+            for document, fingerprint in zip(self.doclist.get_docs(), self.fingerprints)])
+        with open(str(index_file), 'w', encoding='utf-8', newline='') as f:
+            f.write('# ' + json.dumps(meta) + '\n')
+            writer = csv.writer(f, delimiter='\t', lineterminator='\n')
+            writer.writerow(self.columns)
+            writer.writerows(self.offsets.tolist())
+
+    @classmethod
+    def load(cls, index_file, doclist):
+        """
+        Reads an index written by `save`.
+
+        Raises:
+            ValueError: if the documents of `doclist` or their files differ
+                from the ones the index was built for.
+        """
+        with open(str(index_file), encoding='utf-8') as f:
+            meta = json.loads(f.readline()[2:])
+            offsets = np.loadtxt(f, dtype=np.int64, delimiter='\t', skiprows=1, ndmin=2)
+        documents = [str(document) for document in doclist.get_docs()]
+        if documents != [entry[0] for entry in meta['documents']]:
+            raise ValueError("Segment index %s was built for other documents." % index_file)
+        paths = doclist.full_paths(as_str=True)
+        if [_fingerprint(path) for path in paths] != [entry[1:] for entry in meta['documents']]:
+            raise ValueError("Documents changed since segment index %s was built." % index_file)
+        offsets = offsets.reshape(-1, len(cls.columns))
+        return cls(doclist, offsets, meta['params'], [entry[1:] for entry in meta['documents']])
+
+    def __len__(self):
+        """Number of segments in the corpus."""
+        return len(self.offsets)
+
+    def segment_counts(self):
+        """Returns the number of segments of each document."""
+        return np.diff(self._first_rows).tolist()
+
+    def _read(self, f, start, stop, skip, count):
+        f.seek(start)
+        tokens = self.tokenizer.tokenize(f.read(stop - start).decode('utf-8'))
+        return tokens[skip:skip + count]
+
+    def read_segment(self, document, segment_no):
+        """
+        Reads the tokens of one segment.
+
+        Args:
+            document (int): Position of the document in the document list.
+            segment_no (int): Number of the segment in the document.
+
+        Returns:
+            List of tokens.
+        """
+        if not 0 <= document < len(self.fingerprints):
+            raise IndexError("No document %s in the index." % document)
+        first, end = self._first_rows[document:document + 2]
+        if not 0 <= segment_no < end - first:
+            raise IndexError("Document %s has no segment %s." % (document, segment_no))
+        row = first + segment_no
+        start, stop, skip, count = self.offsets[row, 2:].tolist()
+        with open(self.doclist.full_path(self.doclist.get_docs()[document], as_str=True),
+                  'rb') as f:
+            return self._read(f, start, stop, skip, count)
+
+    def __iter__(self):
+        """
+        Yields the tokens of all segments in order, opening each file once.
+        """
+        rows = self.offsets.tolist()
+        position = 0
+        for number, path in enumerate(self.doclist.full_paths(as_str=True)):
+            with open(path, 'rb') as f:
+                while position < len(rows) and rows[position][0] == number:
+                    yield self._read(f, *rows[position][2:])
+                    position += 1
@@ -14,12 +14,18 @@ __email__ = "severin.simmler@stud-mail.uni-wuerzburg.de"
 __version__ = "0.1"
 __date__ = "2017-01-31"
 
+from array import array
 from bs4 import BeautifulSoup
 from dariah_topics import preprocessing as pre
 import itertools
+import json
 import math
+import numpy as np
+import os
 import pandas as pd
+from scipy import sparse
 import urllib.request as urllib
+import warnings
 import wikipedia
 
 
@@ -43,33 +49,178 @@ def topic_segmenter(model, type2id, num_topics, permutation=False):
             bigrams.append(list(itertools.combinations(tokens, 2)))
     return bigrams
 
+class InvertedIndex:
+    """Document-frequency index for coherence measures.
+
+    The posting list of each token, i.e. the sorted numbers of the documents
+    containing it, is a column of a sparse CSC matrix. Co-document counts for
+    any number of token pairs are answered with one sparse matrix product.
+
+    Use the `from_documents()` or `from_sparse_bow()` constructors, or
+    `load()` an index persisted with `save()`.
+
+    Args:
+        matrix: scipy.sparse CSC matrix with one row per document and one
+            column per token, holding 1 for each occurrence.
+        tokens (list): Token for each column; empty columns may be None.
+    """
+
+    def __init__(self, matrix, tokens):
+        self.matrix = sparse.csc_matrix(matrix)
+        self.tokens = list(tokens)
+        self.columns = {token: column for column, token in enumerate(self.tokens) if token}
+        self.num_docs = self.matrix.shape[0]
+
+    @classmethod
+    def from_documents(cls, corpus, tokens=None):
+        """Builds the index from an iterable of tokenized documents.
+
+        Args:
+            corpus: Iterable of documents, each an iterable of tokens.
+            tokens (Iterable): If given, only these tokens are indexed.
+        """
+        if tokens is not None:
+            tokens = list(dict.fromkeys(tokens))
+            columns = {token: column for column, token in enumerate(tokens)}
+        else:
+            columns = {}
+        rows = array('q')
+        cols = array('q')
+        num_docs = 0
+        for num_docs, document in enumerate(corpus, 1):
+            types = set(document)
+            if tokens is None:
+                for token in types:
+                    cols.append(columns.setdefault(token, len(columns)))
+                rows.extend([num_docs - 1] * len(types))
+            else:
+                present = [columns[token] for token in types.intersection(columns)]
+                cols.extend(present)
+                rows.extend([num_docs - 1] * len(present))
+        if tokens is None:
+            tokens = list(columns)
+        matrix = sparse.csc_matrix((np.ones(len(rows), dtype=np.int32),
+                                    (np.frombuffer(rows, dtype=np.int64),
+                                     np.frombuffer(cols, dtype=np.int64))),
+                                   shape=(num_docs, len(tokens)))
+        return cls(matrix, tokens)
+
+    @classmethod
+    def from_sparse_bow(cls, matrix, type_dictionary):
+        """Builds the index from a document-term matrix.
+
+        Args:
+            matrix: Output of `preprocessing.create_sparse_bow()`.
+            type_dictionary (dict): Dictionary with token : id pairs.
+        """
+        tokens = [None] * matrix.shape[1]
+        for token, token_id in type_dictionary.items():
+            if token_id <= len(tokens):
+                tokens[token_id - 1] = token
+        occurrences = (sparse.csc_matrix(matrix) > 0).astype(np.int32)
+        return cls(occurrences, tokens)
+
+    def save(self, path):
+        """Persists the index in folder `path`.
+
+        Note:
+            The posting lists are stored as binary NumPy arrays (see
+            `preprocessing.save_bow_npy()`), the tokens in `tokens.txt`.
+        """
+        pre.save_bow_npy(self.matrix.T, path)
+        with open(os.path.join(path, 'tokens.txt'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(token or '' for token in self.tokens))
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Loads an index persisted with `save()`.
+
+        Args:
+            path (str): Folder passed to `save()`.
+            mmap_mode (str): See `preprocessing.load_bow_npy()`. By default,
+                posting lists are memory-mapped, so loading is instant.
+        """
+        matrix = pre.load_bow_npy(path, mmap_mode).T
+        with open(os.path.join(path, 'tokens.txt'), encoding='utf-8') as f:
+            tokens = f.read().split('\n')
+        return cls(matrix, tokens)
+
+    def __len__(self):
+        return self.num_docs
+
+    def __contains__(self, token):
+        return token in self.columns
+
+    def posting(self, token):
+        """Returns the sorted array of document numbers containing `token`."""
+        column = self.columns.get(token)
+        if column is None:
+            return np.zeros(0, dtype=self.matrix.indices.dtype)
+        start, end = self.matrix.indptr[column], self.matrix.indptr[column + 1]
+        return self.matrix.indices[start:end]
+
+    def __getitem__(self, token):
+        return set(self.posting(token).tolist())
+
+    def document_frequency(self, tokens):
+        """Returns the number of documents containing each of `tokens`."""
+        frequencies = np.append(np.diff(self.matrix.indptr), 0)
+        missing = len(frequencies) - 1
+        return frequencies[[self.columns.get(token, missing) for token in tokens]]
+
+    def pair_counts(self, tokens1, tokens2):
+        """Counts documents for token pairs `(tokens1[i], tokens2[i])`.
+
+        Returns:
+            Three NumPy arrays: document frequencies of `tokens1`, of
+            `tokens2` and the number of documents containing both.
+        """
+        tokens1 = list(tokens1)
+        tokens = tokens1 + list(tokens2)
+        unique = list(dict.fromkeys(token for token in tokens if token in self.columns))
+        submatrix = self.matrix[:, [self.columns[token] for token in unique]]
+        # tokens not in the index point to the padded zero row and column
+        cooccurrence = np.pad((submatrix.T @ submatrix).toarray(), (0, 1))
+        positions = {token: n for n, token in enumerate(unique)}
+        positions = np.array([positions.get(token, len(unique)) for token in tokens],
+                             dtype=np.int64)
+        positions1, positions2 = positions[:len(tokens1)], positions[len(tokens1):]
+        return (cooccurrence[positions1, positions1],
+                cooccurrence[positions2, positions2],
+                cooccurrence[positions1, positions2])
+
+    def co_document_frequency(self, tokens1, tokens2):
+        """Returns the number of documents containing both `tokens1[i]` and `tokens2[i]`."""
+        return self.pair_counts(tokens1, tokens2)[2]
+
+def _bigram_counts(segmented_topics, index):
+    """Returns document frequencies of both tokens and of each bigram as lists."""
+    bigrams = [bigram for topic in segmented_topics for bigram in topic]
+    counts = index.pair_counts([t1 for t1, t2 in bigrams], [t2 for t1, t2 in bigrams])
+    return tuple(count.tolist() for count in counts)
+
 def token_probability(corpus, segmented_topics):
-    score = pd.Series()
-    tokens = set()
-    for topic in segmented_topics:
-        for t1, t2 in topic:
-            tokens.add(t1)
-            tokens.add(t2)
-    for token in tokens:
-        temp_score = set()
-        for n, document in enumerate(corpus):
-            if token in document:
-                temp_score.add(n)
-        score[token] = temp_score
-    return score
+    """Builds an `InvertedIndex` for all tokens in `segmented_topics`.
+
+    Args:
+        corpus: Iterable of tokenized documents.
+        segmented_topics: Output of `topic_segmenter()`.
+
+    Returns:
+        InvertedIndex. `index[token]` is the set of documents containing token.
+    """
+    tokens = [token for topic in segmented_topics for bigram in topic for token in bigram]
+    return InvertedIndex.from_documents(corpus, tokens)
 
 def calculate_umass(segmented_topics, token_probability, corpus, num_topics, top_words=10, e=0.1):
     pre_umass = []
     n = len(corpus)
     N = top_words*num_topics
-    for topic in segmented_topics:
-        for topic_bigram in topic:
-            t1 = token_probability[topic_bigram[0]]
-            t2 = token_probability[topic_bigram[1]]
-            collocation = t1.intersection(t2)
-            numerator = len(collocation)/n + e
-            denominator = len(t2)/n
-            pre_umass.append(math.log(numerator/denominator))
+    t1_counts, t2_counts, collocations = _bigram_counts(segmented_topics, token_probability)
+    for t2, collocation in zip(t2_counts, collocations):
+        numerator = collocation/n + e
+        denominator = t2/n
+        pre_umass.append(math.log(numerator/denominator))
     return (2/(N*(N-1)))*sum(pre_umass)
 
 def wikipedia_table_crawler(wiki_url='https://en.wikipedia.org/wiki/Wikipedia:5000', total_columns=15, select_cell=1):
@@ -103,23 +254,74 @@ def wikipedia_crawler(wiki_list, size=5000):
             pass
     return wiki_corpus
 
+def reference_corpus(doclist, path, workers=None, chunksize=None, rebuild=False, **kwargs):
+    """Builds or loads an offline reference corpus index.
+
+    Note:
+        On the first call, the text files in `doclist` (e.g. articles
+        extracted from a Wikipedia dump, or `create_document_list()` of any
+        folder) are tokenized in parallel with
+        `preprocessing.tokenize_corpus()` and indexed; the index is saved in
+        `path`. Later calls just load it, unless the files (paths,
+        modification times and sizes) or the tokenizer options differ from
+        the ones recorded in `reference.json` next to the index. Pass the
+        result as `corpus` and `score` to
+        `calculate_pointwise_mutual_information()`.
+
+    Args:
+        doclist (list[str]): List of TXT files of the reference corpus.
+        path (str): Folder of the persisted index.
+        workers (int): Number of tokenizer processes, see `tokenize_corpus()`.
+        chunksize (int): Documents per worker task, see `tokenize_corpus()`.
+        rebuild (bool): If True, rebuild the index even if it exists.
+        **kwargs: Passed on to `preprocessing.tokenize()`.
+
+    Returns:
+        InvertedIndex over the whole vocabulary of the reference corpus.
+    """
+    fingerprint = _reference_fingerprint(doclist, kwargs)
+    fingerprint_file = os.path.join(path, 'reference.json')
+    if not rebuild and os.path.exists(os.path.join(path, 'tokens.txt')) \
+            and os.path.exists(fingerprint_file):
+        with open(fingerprint_file, encoding='utf-8') as f:
+            if json.load(f) == fingerprint:
+                return InvertedIndex.load(path)
+    documents = pre.tokenize_corpus(doclist, workers=workers, chunksize=chunksize, **kwargs)
+    index = InvertedIndex.from_documents(documents)
+    index.save(path)
+    with open(fingerprint_file, 'w', encoding='utf-8') as f:
+        json.dump(fingerprint, f)
+    return index
+
+def _reference_fingerprint(doclist, kwargs):
+    """Sorted paths with modification time and size, and the tokenizer options."""
+    documents = []
+    for document in sorted(map(str, doclist)):
+        stat = os.stat(document)
+        documents.append([document, stat.st_mtime_ns, stat.st_size])
+    return dict(documents=documents, tokenizer=kwargs)
+
 def calculate_pointwise_mutual_information(segmented_topics, corpus, score, e=0.1, normalize=False):
+    """Calculates (normalized) PMI for all bigrams of `segmented_topics`.
+
+    Note:
+        `score` is an `InvertedIndex`, e.g. from `token_probability()` or
+        `reference_corpus()`; in the latter case the index can also be
+        passed as `corpus`.
+    """
     PMI = []
     n = len(corpus)
-    try:
-        for topic in segmented_topics:
-            for topic_bigram in topic:
-                t1 = score[topic_bigram[0]]
-                t2 = score[topic_bigram[1]]
-                collocation = t1.intersection(t2)
-                numerator = len(collocation)/n + e
-                denominator = (len(t1)/n) * (len(t2)/n)
-                if normalize:
-                    PMI.append(math.log(numerator/denominator)/-math.log(numerator))
-                else:
-                    PMI.append(math.log(numerator/denominator))
-    except ZeroDivisionError:
-        PMI.append(0)
+    t1_counts, t2_counts, collocations = _bigram_counts(segmented_topics, score)
+    for t1, t2, collocation in zip(t1_counts, t2_counts, collocations):
+        numerator = collocation/n + e
+        denominator = (t1/n) * (t2/n)
+        try:
+            if normalize:
+                PMI.append(math.log(numerator/denominator)/-math.log(numerator))
+            else:
+                PMI.append(math.log(numerator/denominator))
+        except ZeroDivisionError:
+            PMI.append(0)
     return PMI
 
 def calculate_uci(PMI, corpus, num_topics, top_words=10):
@@ -127,3 +329,75 @@ def calculate_uci(PMI, corpus, num_topics, top_words=10):
     N = num_topics*top_words
     score = (2/(N*(N-1)))*sum(PMI)
     return score
+
+def top_term_ids(model, num_topics, top_words=10):
+    """Returns the ids of the `top_words` most probable terms of each topic.
+
+    Args:
+        model: Gensim model offering `get_topic_terms()`.
+        num_topics (int): Number of topics.
+        top_words (int): Number of terms per topic.
+
+    Returns:
+        NumPy array with one row per topic, most probable term first.
+    """
+    return np.array([[term_id for term_id, probability in model.get_topic_terms(topic, top_words)]
+                     for topic in range(num_topics)], dtype=np.int64)
+
+def topic_coherence(doc_term_matrix, topic_terms, e=0.1, permutation=False):
+    """Calculates UMass, UCI and NPMI coherence of all topics at once.
+
+    The document co-occurrence counts of all top words are computed with
+    one sparse matrix product on the document-term matrix; scores of the
+    word pairs are then calculated as array operations, using the same
+    formulas as `calculate_umass()` and
+    `calculate_pointwise_mutual_information()`.
+
+    Pairs whose score is undefined, e.g. because one word does not occur in
+    any document, are ignored; a topic without any defined pair scores NaN.
+
+    Args:
+        doc_term_matrix: scipy.sparse matrix with one row per document and
+            one column per term id, e.g. from `preprocessing.load_bow_npy()`.
+        topic_terms: Array of term ids with one row per topic, e.g. from
+            `top_term_ids()`.
+        e (float): Smoothing added to the joint probability.
+        permutation (bool): Score all ordered word pairs instead of
+            combinations, see `topic_segmenter()`.
+
+    Returns:
+        Two dictionaries with the keys 'umass', 'uci' and 'npmi': the first
+        maps to NumPy arrays with the mean pair score of each topic, the
+        second to the mean over all topics.
+    """
+    topic_terms = np.asarray(topic_terms, dtype=np.int64)
+    top_words = topic_terms.shape[1]
+    unique, inverse = np.unique(topic_terms, return_inverse=True)
+    inverse = inverse.reshape(topic_terms.shape)
+
+    occurrences = (sparse.csc_matrix(doc_term_matrix)[:, unique] > 0).astype(np.int64)
+    cooccurrence = (occurrences.T @ occurrences).toarray()
+    n = doc_term_matrix.shape[0]
+
+    if permutation:
+        first, second = np.nonzero(~np.eye(top_words, dtype=bool))
+    else:
+        first, second = np.triu_indices(top_words, 1)
+    words1, words2 = inverse[:, first], inverse[:, second]
+    probability = np.diag(cooccurrence) / n
+    p1, p2 = probability[words1], probability[words2]
+    joint = cooccurrence[words1, words2] / n + e
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pmi = np.log(joint / (p1 * p2))
+        scores = dict(umass=np.log(joint / p2), uci=pmi, npmi=pmi / -np.log(joint))
+
+    per_topic = {}
+    overall = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        for measure, values in scores.items():
+            values[~np.isfinite(values)] = np.nan
+            per_topic[measure] = np.nanmean(values, axis=1)
+            overall[measure] = float(np.nanmean(per_topic[measure]))
+    return per_topic, overall
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Feature Selection.
+
+This module selects the types to keep in a document-term matrix by their
+frequencies, provided by `DARIAH-DE`_. Corpus and document frequencies are
+computed once with `numpy.bincount()`; stopwords (most frequent words),
+hapax legomena, document frequency thresholds and a vocabulary size limit
+are then combined into one boolean mask, which is applied with a single
+column slice.
+
+Column `j` stands for the type with token_id `j + 1`, as everywhere in
+`dariah_topics.preprocessing`.
+
+.. _DARIAH-DE:
+    https://de.dariah.eu
+    https://github.com/DARIAH-DE
+"""
+
+__author__ = "DARIAH-DE"
+__authors__ = "Steffen Pielstroem, Philip Duerholt, Sina Bock, Severin Simmler"
+__email__ = "pielstroem@biozentrum.uni-wuerzburg.de"
+__version__ = "0.1"
+__date__ = "2017-03-01"
+
+from collections import namedtuple
+from dariah_topics.vocabulary import Vocabulary
+import logging
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+log = logging.getLogger('feature_selection')
+log.addHandler(logging.NullHandler())
+
+FeatureFrequencies = namedtuple('FeatureFrequencies',
+                                ['corpus_frequency', 'document_frequency', 'num_docs'])
+FeatureFrequencies.__doc__ = """Frequencies of each type (index = token_id - 1)
+
+    corpus_frequency: number of tokens of the type in the whole corpus
+    document_frequency: number of documents containing the type
+    num_docs: number of documents
+"""
+
+
+def feature_frequencies(sparse_bow, num_types=None):
+    """Computes corpus and document frequency of every type.
+
+    Args:
+        sparse_bow: scipy.sparse document-term matrix, e.g. from
+            `create_sparse_bow()`, or the Multiindexed DataFrame from
+            `create_mm()` / `sparse_bow_to_mm()`.
+        num_types (int): Length of the result. Defaults to the number of
+            columns, or the largest token_id for DataFrames.
+
+    Returns:
+        FeatureFrequencies
+    """
+    if isinstance(sparse_bow, pd.DataFrame):
+        doc_id = sparse_bow.index.get_level_values('doc_id').to_numpy(dtype=np.int64)
+        token_id = sparse_bow.index.get_level_values('token_id').to_numpy(dtype=np.int64)
+        counts = sparse_bow[0].to_numpy(dtype=np.int64)
+        # token_id 0 marks empty documents
+        present = token_id > 0
+        columns, counts = token_id[present] - 1, counts[present]
+        num_docs = len(np.unique(doc_id))
+        if num_types is None:
+            num_types = token_id.max(initial=0)
+    else:
+        matrix = sparse.csr_matrix(sparse_bow)
+        columns, counts = matrix.indices, matrix.data
+        num_docs = matrix.shape[0]
+        if num_types is None:
+            num_types = matrix.shape[1]
+    corpus_frequency = np.bincount(columns, weights=counts, minlength=num_types)
+    document_frequency = np.bincount(columns, weights=counts > 0, minlength=num_types)
+    return FeatureFrequencies(corpus_frequency.astype(np.int64),
+                              document_frequency.astype(np.int64), num_docs)
+
+
+def most_frequent(corpus_frequency, n):
+    """Returns the columns of the `n` most frequent types.
+
+    Types that do not occur are never returned; ties are broken by lower
+    token_id, like `pandas.Series.nlargest()` in `find_stopwords()`.
+
+    Args:
+        corpus_frequency (ndarray): e.g. `feature_frequencies().corpus_frequency`
+        n (int): Number of types.
+
+    Returns:
+        Array of column indices, most frequent first.
+    """
+    order = np.argsort(-corpus_frequency, kind='stable')[:n]
+    return order[corpus_frequency[order] > 0]
+
+
+def _threshold(value, num_docs):
+    """Document count for an absolute (int) or relative (float) threshold."""
+    if isinstance(value, float):
+        return value * num_docs
+    return value
+
+
+def select_features(sparse_bow, mfw=0, hapax=False, min_df=None, max_df=None, top_k=None,
+                    num_types=None):
+    """Selects the types to keep, in one pass over the matrix.
+
+    Args:
+        sparse_bow: Document-term matrix or DataFrame, see `feature_frequencies()`.
+        mfw (int): Remove the `mfw` most frequent types (stopwords).
+        hapax (bool): Remove hapax legomena, i.e. types occurring once.
+        min_df (int or float): Remove types occurring in fewer documents;
+            a float is a fraction of all documents.
+        max_df (int or float): Remove types occurring in more documents;
+            a float is a fraction of all documents.
+        top_k (int): Keep at most the `top_k` most frequent of the remaining
+            types.
+        num_types (int): see `feature_frequencies()`.
+
+    Returns:
+        Boolean NumPy array, True for the columns to keep. Types that do not
+        occur are never kept.
+
+    Example:
+        >>> matrix = sparse.csr_matrix([[5, 1, 2, 0], [4, 0, 2, 1]])
+        >>> select_features(matrix, mfw=1, hapax=True).tolist()
+        [False, False, True, False]
+    """
+    frequencies = feature_frequencies(sparse_bow, num_types)
+    corpus_frequency = frequencies.corpus_frequency
+    document_frequency = frequencies.document_frequency
+    keep = corpus_frequency > 0
+    if mfw:
+        keep[most_frequent(corpus_frequency, mfw)] = False
+    if hapax:
+        keep &= corpus_frequency != 1
+    if min_df is not None:
+        keep &= document_frequency >= _threshold(min_df, frequencies.num_docs)
+    if max_df is not None:
+        keep &= document_frequency <= _threshold(max_df, frequencies.num_docs)
+    if top_k is not None and keep.sum() > top_k:
+        kept = most_frequent(np.where(keep, corpus_frequency, 0), top_k)
+        keep[:] = False
+        keep[kept] = True
+    log.debug("Keeping %s of %s types.", keep.sum(), len(keep))
+    return keep
+
+
+def mask_to_types(mask, id_types):
+    """Returns the types of the True columns of `mask`.
+
+    Args:
+        mask (ndarray): Boolean array over columns, e.g. `~select_features(...)`
+            for the types to remove.
+        id_types (dict or Vocabulary): type : id pairs.
+
+    Returns:
+        List of types in token_id order, e.g. as `features` for
+        `remove_features()`.
+    """
+    try:
+        inverse = id_types.inverse
+    except AttributeError:
+        inverse = {value : key for key, value in id_types.items()}
+    return [inverse[column + 1] for column in np.flatnonzero(mask).tolist()
+            if column + 1 in inverse]
+
+
+def apply_feature_mask(matrix, keep, id_types):
+    """Removes the unselected columns from a document-term matrix.
+
+    Args:
+        matrix: scipy.sparse document-term matrix.
+        keep (ndarray): Boolean array over columns, from `select_features()`.
+        id_types (dict or Vocabulary): type : id pairs of `matrix`.
+
+    Note:
+        Columns are renumbered: the result has one column per kept type, and
+        the returned Vocabulary holds their new ids.
+
+    Returns:
+        Tuple of CSR matrix and Vocabulary.
+    """
+    matrix = sparse.csr_matrix(matrix)
+    keep = np.asarray(keep, dtype=bool)
+    keep = np.concatenate([keep[:matrix.shape[1]],
+                           np.zeros(max(0, matrix.shape[1] - len(keep)), dtype=bool)])
+    return matrix[:, keep], Vocabulary(mask_to_types(keep, id_types))
@@ -18,7 +18,11 @@ __email__ = "pielstroem@biozentrum.uni-wuerzburg.de"
 __version__ = "0.1"
 __date__ = "2017-01-20"
 
-from subprocess import Popen, call, PIPE
+from subprocess import Popen, call, PIPE, STDOUT, CalledProcessError, TimeoutExpired
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import gzip
 import numpy as np
 import itertools
 import operator
@@ -26,6 +30,10 @@ import logging
 from platform import system
 import os
 import pandas as pd
+import re
+from scipy import sparse
+import signal
+import threading
 
 log = logging.getLogger('mallet')
 log.addHandler(logging.NullHandler())
@@ -78,25 +86,95 @@ def create_mallet_model(outfolder, path_to_corpus = os.path.join(os.path.abspath
             param.append("--stoplist-file")
             param.append(stoplist)
             
-    log.debug(print(param))
-       
-    try:
-       log.info("Accessing Mallet ...")
-       p = Popen(param, stdout=PIPE, stderr=PIPE, shell=shell)
-       out = p.communicate()
-       log.debug(out)
-       log.debug("Mallet file available.")
-	   
-    except KeyboardInterrupt:
-       log.info("Ending mallet process ...")
-       p.terminate()
-       log.debug("Mallet terminated.")
-       
+    log.debug(param)
+
+    log.info("Accessing Mallet ...")
+    MalletJob(param, shell=shell).run_interruptible()
+    log.debug("Mallet file available.")
+
     return output
      
        
+_WHITESPACE_OR_COMMA = re.compile(r'[\s,]+')
+
+
+def _mallet_instances(labeled_docs):
+    """Lines of Mallets' one-instance-per-line format: `name label tokens`"""
+    for label, tokens in labeled_docs:
+        name = _WHITESPACE_OR_COMMA.sub('_', str(label)) or '_'
+        yield "{} X {}\n".format(name, ' '.join(tokens))
+
+
+def write_mallet_instances(labeled_docs, path):
+    """Write tokenized documents in the format of Mallets' import-file
+
+    Args:
+        labeled_docs (iterable): (label, tokens) pairs, e.g.
+                                 `zip(doc_labels, doc_tokens)`
+        path (str): Output file
+
+    Note: One document per line, `name X token token ...`. Whitespace and
+          commas in the label are replaced by `_`, as Mallet splits fields
+          on them.
+
+    Returns: path
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(_mallet_instances(labeled_docs))
+    return path
+
+
+def create_mallet_model_from_tokens(outfolder, labeled_docs, path_to_mallet="mallet",
+                                    outfile="malletModel.mallet", stoplist=None, pipe=True):
+    """Create a mallet binary file from tokenized documents
+
+    Args:
+        outfolder (str): Folder for Mallet output
+        labeled_docs (iterable): (label, tokens) pairs, e.g.
+                                 `zip(doc_labels, map(preprocessing.tokenize, texts))`
+        path_to_mallet (str): Path to mallet; default = mallet.
+        outfile (str): Name of the mallet file that will be generated, default = 'malletModel.mallet'
+        stoplist (str): Path to a stopword file Mallet should apply
+        pipe (bool): Stream the documents to Mallets' standard input; if
+                     False, they are written to `instances.txt` in outfolder
+                     first
+
+    Note: Unlike create_mallet_model(), which runs import-dir on a folder of
+          text files, Mallet keeps the tokens as given (`--token-regex` matches
+          any non-whitespace, case is preserved), so Mallet and gensim models
+          are trained on identical tokens. No stopwords are removed unless
+          stoplist is given.
+
+    Returns: Path to the mallet binary file
+    """
+    if not os.path.exists(outfolder):
+        log.info("Creating output folder ...")
+        os.makedirs(outfolder)
+
+    output = os.path.join(outfolder, outfile)
+    stdin = None
+    if pipe:
+        source = "-"
+        stdin = _mallet_instances(labeled_docs)
+    else:
+        source = write_mallet_instances(labeled_docs, os.path.join(outfolder, "instances.txt"))
+
+    shell = _shell()
+    param = [path_to_mallet, "import-file", "--input", source, "--output", output,
+             "--encoding", "UTF-8", "--keep-sequence", "--preserve-case",
+             "--token-regex", "\\S+"]
+    if stoplist is not None:
+        param += ["--stoplist-file", stoplist]
+    log.debug(param)
+
+    log.info("Accessing Mallet ...")
+    MalletJob(param, shell=shell, stdin=stdin).run_interruptible()
+    log.debug("Mallet file available.")
+    return output
+
+
 def create_mallet_output(path_to_malletModel, outfolder, path_to_mallet="mallet",  num_topics = "10", 
-                         num_top_words = "10", num_iterations="20"):
+                         num_top_words = "10", num_iterations="20", config=None, **kwargs):
     """Create mallet model
 
     Args:
@@ -107,66 +185,455 @@ def create_mallet_output(path_to_malletModel, outfolder, path_to_mallet="mallet"
         num_topics(str): Number of Topics that should be created
         num_interations(str): Number of Iterations
         num_top_words(str): Number of keywords for each topic
+        config (TrainTopicsConfig): Complete train-topics configuration; if
+                                    given, num_topics, num_top_words and
+                                    num_iterations are ignored
+        **kwargs: Further TrainTopicsConfig options, e.g. num_threads=4,
+                  random_seed=42 or topic_word_weights=True
         
     Note: Use create_mallet_model() to generate path_to_malletModel
-        
-    ToDo: **kwargs() for individual params
+
+    Returns: Dictionary of output name : path pairs, see TrainTopicsConfig.output_files()
     """
-    outfolder = doc_topics = os.path.join(os.path.abspath('.'), outfolder)
-    
-    param = []
-    param.append(path_to_mallet)
-    param.append("train-topics")
-    param.append("--input")
-    param.append(path_to_malletModel)
-    param.append("--num-topics")
-    param.append(num_topics)
-    param.append("--num-iterations")
-    param.append(num_iterations)
-    param.append("--num-top-words")
-    param.append(num_top_words)
-    
-    sys = system()
-    if sys == 'Windows':
-        log.debug(outfolder)
-        shell = True
-    else:
-        log.debug(outfolder)
-        shell = False
-        
-    doc_topics = os.path.join(outfolder, "doc_topics.txt")
-    topic_keys = os.path.join(outfolder, "topic_keys.txt") 
-    state = os.path.join(outfolder, "state.gz")
-    word_topics_counts = os.path.join(outfolder, "word_topic_counts.txt") 
-    word_topics_weights = os.path.join(outfolder, "word_topic_weights.txt")
-        
-    param.append("--output-doc-topics")
-    param.append(doc_topics)
-    param.append("--output-state")
-    param.append(state)
-    param.append("--output-topic-keys")
-    param.append(topic_keys)
-#    param.append("--word-topic-counts-file")
-#    param.append(word_topic_counts)
-#    param.append("--topic-word-weights-file")
-#    param.append(word_topics_weights)
-    
-    log.debug(print(param))
+    if config is None:
+        config = TrainTopicsConfig(num_topics=int(num_topics), num_top_words=int(num_top_words),
+                                   num_iterations=int(num_iterations))
+    config = config.replace(**kwargs)
+    outfolder = os.path.join(os.path.abspath('.'), outfolder)
+    param = config.param(path_to_malletModel, outfolder, path_to_mallet)
+
+    log.info("Accessing Mallet ...")
+    MalletJob(param, shell=_shell()).run_interruptible()
+    log.debug("Mallet file available.")
+    return config.output_files(outfolder)
 
+
+def _shell():
+    """Mallet is called through the shell on Windows"""
+    return system() == 'Windows'
+
+
+def _check_int(name, value, minimum):
     try:
-       log.info("Accessing Mallet ...")
-       p = Popen(param, stdout=PIPE, stderr=PIPE, shell=shell)
-       out = p.communicate()
-       #log.debug(out)
-       log.debug("Mallet file available.")
+        if isinstance(value, bool):
+            raise TypeError
+        value = operator.index(value)
+    except TypeError:
+        raise TypeError("%s must be an integer, not %r" % (name, value)) from None
+    if value < minimum:
+        raise ValueError("%s must be at least %d, got %d" % (name, minimum, value))
+    return value
+
+
+def _check_float(name, value):
+    if isinstance(value, (bool, str)):
+        raise TypeError("%s must be a number, not %r" % (name, value))
+    value = float(value)
+    if not value > 0:
+        raise ValueError("%s must be positive, got %r" % (name, value))
+    return value
+
+
+# (option, train-topics argument, file name)
+_TRAIN_TOPICS_OUTPUTS = [
+    ('doc_topics', '--output-doc-topics', 'doc_topics.txt'),
+    ('topic_keys', '--output-topic-keys', 'topic_keys.txt'),
+    ('state', '--output-state', 'state.gz'),
+    ('word_topic_counts', '--word-topic-counts-file', 'word_topic_counts.txt'),
+    ('topic_word_weights', '--topic-word-weights-file', 'topic_word_weights.txt'),
+    ('inferencer', '--inferencer-filename', 'inferencer.mallet'),
+    ('evaluator', '--evaluator-filename', 'evaluator.mallet'),
+    ('model', '--output-model', 'model.mallet'),
+]
+
+
+class TrainTopicsConfig:
+    """Validated options for Mallets' train-topics
 
+    Args:
+        num_topics (int): Number of topics, default 10
+        num_iterations (int): Number of Gibbs sampling iterations, default 20
+        num_top_words (int): Number of keywords per topic in topic_keys, default 10
+        num_threads (int): Threads for Gibbs sampling; None uses all CPUs,
+                           default 1
+        optimize_interval (int): Optimize hyperparameters every n iterations;
+                                 0 (default) keeps alpha and beta fixed
+        optimize_burn_in (int): Iterations before the first optimization;
+                                None uses Mallet's default (200)
+        random_seed (int): Seed (at least 1) for reproducible runs; None uses
+                           Mallet's default (seeded from the clock)
+        alpha (float): Sum over topics of the document-topic prior; None uses
+                       Mallet's default (5.0)
+        beta (float): Topic-word prior; None uses Mallet's default (0.01)
+        doc_topics, topic_keys, state (bool): Write doc_topics.txt,
+            topic_keys.txt and state.gz, default True
+        word_topic_counts, topic_word_weights (bool): Write
+            word_topic_counts.txt and topic_word_weights.txt, default False
+        inferencer, evaluator, model (bool): Write inferencer.mallet,
+            evaluator.mallet and model.mallet, default False
+
+    Raises:
+        TypeError: if a count is not an integer or a prior not a number
+        ValueError: if a value is out of range
+
+    Example:
+        >>> config = TrainTopicsConfig(num_topics=20, random_seed=42)
+        >>> config.param('model.mallet', 'out')[:4]
+        ['mallet', 'train-topics', '--input', 'model.mallet']
+        >>> config.replace(num_topics=30).num_topics
+        30
+    """
 
-    except KeyboardInterrupt:
-       log.info("Ending mallet process ...")
-       p.terminate()
-       log.debug("Mallet terminated.")
+    def __init__(self, num_topics=10, num_iterations=20, num_top_words=10, num_threads=1,
+                 optimize_interval=0, optimize_burn_in=None, random_seed=None, alpha=None,
+                 beta=None, doc_topics=True, topic_keys=True, state=True,
+                 word_topic_counts=False, topic_word_weights=False, inferencer=False,
+                 evaluator=False, model=False):
+        self.num_topics = _check_int('num_topics', num_topics, 1)
+        self.num_iterations = _check_int('num_iterations', num_iterations, 0)
+        self.num_top_words = _check_int('num_top_words', num_top_words, 1)
+        if num_threads is not None:
+            num_threads = _check_int('num_threads', num_threads, 1)
+        self.num_threads = num_threads
+        self.optimize_interval = _check_int('optimize_interval', optimize_interval, 0)
+        if optimize_burn_in is not None:
+            optimize_burn_in = _check_int('optimize_burn_in', optimize_burn_in, 0)
+        self.optimize_burn_in = optimize_burn_in
+        if random_seed is not None:
+            random_seed = _check_int('random_seed', random_seed, 0)
+            if random_seed == 0:
+                raise ValueError("random_seed must be at least 1; Mallet seeds a run "
+                                 "with --random-seed 0 from the clock, use None for that")
+        self.random_seed = random_seed
+        self.alpha = None if alpha is None else _check_float('alpha', alpha)
+        self.beta = None if beta is None else _check_float('beta', beta)
+        self.doc_topics = bool(doc_topics)
+        self.topic_keys = bool(topic_keys)
+        self.state = bool(state)
+        self.word_topic_counts = bool(word_topic_counts)
+        self.topic_word_weights = bool(topic_word_weights)
+        self.inferencer = bool(inferencer)
+        self.evaluator = bool(evaluator)
+        self.model = bool(model)
+
+    def replace(self, **changes):
+        """Return a copy with some options changed (and validated)"""
+        options = vars(self).copy()
+        options.update(changes)
+        return TrainTopicsConfig(**options)
+
+    @property
+    def threads(self):
+        """Number of sampling threads Mallet will use"""
+        return self.num_threads or os.cpu_count() or 1
+
+    def output_files(self, outfolder):
+        """Dictionary of output name : path pairs of the enabled outputs"""
+        return {name: os.path.join(outfolder, filename)
+                for name, _, filename in _TRAIN_TOPICS_OUTPUTS if getattr(self, name)}
+
+    def param(self, path_to_malletModel, outfolder, path_to_mallet="mallet"):
+        """Build the argument list for train-topics
+
+        Args:
+            path_to_malletModel(str): Path to mallet model
+            outfolder (str): Folder for Mallet output
+            path_to_mallet(str): Path to mallet
+
+        Returns: List of arguments for MalletJob
+        """
+        param = [path_to_mallet, "train-topics", "--input", path_to_malletModel,
+                 "--num-topics", str(self.num_topics),
+                 "--num-iterations", str(self.num_iterations),
+                 "--num-top-words", str(self.num_top_words),
+                 "--num-threads", str(self.threads)]
+        if self.optimize_interval:
+            param += ["--optimize-interval", str(self.optimize_interval)]
+            if self.optimize_burn_in is not None:
+                param += ["--optimize-burn-in", str(self.optimize_burn_in)]
+        for option, argument in (('random_seed', "--random-seed"), ('alpha', "--alpha"),
+                                 ('beta', "--beta")):
+            value = getattr(self, option)
+            if value is not None:
+                param += [argument, str(value)]
+        files = self.output_files(outfolder)
+        for name, argument, _ in _TRAIN_TOPICS_OUTPUTS:
+            if name in files:
+                param += [argument, files[name]]
+        log.debug(param)
+        return param
+
+    def __eq__(self, other):
+        return isinstance(other, TrainTopicsConfig) and vars(self) == vars(other)
+
+    def __repr__(self):
+        return "TrainTopicsConfig(%s)" % ", ".join(
+            "%s=%r" % item for item in sorted(vars(self).items()))
+
+
+MalletProgress = namedtuple('MalletProgress', ['iteration', 'log_likelihood'])
+MalletProgress.__doc__ = """Progress event parsed from a `<iteration> LL/token: value` line"""
+
+_PROGRESS_PATTERN = re.compile(r'<(\d+)>\s+LL/token:\s+(\S+)')
+
+
+class MalletCancelled(Exception):
+    """Raised by `MalletJob.run()` if the job was cancelled"""
+
+
+class MalletJob:
+    """Mallet command running as managed subprocess
+
+    Args:
+        param (list): Argument list, e.g. from create_mallet_model()
+        timeout (float): Seconds after which the job is cancelled
+        progress (callable): Called with each `MalletProgress` event
+        shell (bool): Run through the shell; defaults to True on Windows
+        stdin (iterable): Lines (str) fed to Mallet's standard input, e.g.
+                          for `import-file --input -`
+
+    Note: Mallet's output (stdout and stderr) is collected in `output`, the
+          parsed progress events in `events`. Use MalletRunner to run several
+          jobs concurrently.
+    """
+
+    def __init__(self, param, timeout=None, progress=None, shell=None, stdin=None):
+        self.param = param
+        self.timeout = timeout
+        self.progress = progress
+        self.shell = _shell() if shell is None else shell
+        self.stdin = stdin
+        self.output = []
+        self.events = []
+        self.returncode = None
+        self.timed_out = False
+        self.feed_error = None
+        self._process = None
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def run(self):
+        """Run Mallet and block until it exits
+
+        Raises:
+            MalletCancelled: if cancel() was called or the timeout expired
+            CalledProcessError: if Mallet exits with a non-zero status
+            Exception: raised while iterating over `stdin` or by `progress`
+                       (Mallet is cancelled)
+        Returns: self
+        """
+        with self._lock:
+            if self.cancelled:
+                raise MalletCancelled(self.param)
+            log.debug("Starting %s ...", self.param)
+            # own process group, so cancel() also reaches the java process
+            # started by Mallet's launcher script
+            self._process = Popen(self.param, stdout=PIPE, stderr=STDOUT, shell=self.shell,
+                                  stdin=None if self.stdin is None else PIPE,
+                                  start_new_session=(os.name == 'posix'))
+        feeder = None
+        if self.stdin is not None:
+            feeder = threading.Thread(target=self._feed, args=(self._process.stdin,))
+            feeder.daemon = True
+            feeder.start()
+        timer = None
+        if self.timeout is not None:
+            timer = threading.Timer(self.timeout, self._expire)
+            timer.daemon = True
+            timer.start()
+        try:
+            for line in iter(self._process.stdout.readline, b''):
+                line = line.decode('utf-8', 'replace')
+                self.output.append(line)
+                match = _PROGRESS_PATTERN.search(line)
+                if match:
+                    event = MalletProgress(int(match.group(1)), float(match.group(2)))
+                    self.events.append(event)
+                    if self.progress is not None:
+                        self.progress(event)
+            self.returncode = self._process.wait()
+            if feeder is not None:
+                feeder.join()
+        except BaseException:
+            # e.g. raised by the progress callback; don't leave Mallet running
+            self.cancel()
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+            self._process.stdout.close()
+        if self.feed_error is not None:
+            # failed while producing input; Mallet was cancelled
+            raise self.feed_error
+
+        if self.cancelled:
+            raise MalletCancelled(self.param)
+        if self.returncode != 0:
+            log.error("Mallet failed: %s", ''.join(self.output[-20:]))
+            raise CalledProcessError(self.returncode, self.param, output=''.join(self.output))
+        return self
+
+    def _feed(self, pipe):
+        """Write `stdin` to Mallet; runs in its own thread"""
+        try:
+            for line in self.stdin:
+                pipe.write(line.encode('utf-8'))
+        except (BrokenPipeError, ValueError):
+            # Mallet exited or was cancelled; reported through its status
+            pass
+        except Exception as err:
+            self.feed_error = err
+            self.cancel()
+        finally:
+            try:
+                pipe.close()
+            except BrokenPipeError:
+                pass
+
+    def run_interruptible(self):
+        """Run Mallet, terminating it on KeyboardInterrupt
+
+        Raises:
+            CalledProcessError: if Mallet exits with a non-zero status; its
+                                output (including stderr) is in `output`
+        """
+        try:
+            return self.run()
+        except KeyboardInterrupt:
+            log.info("Ending mallet process ...")
+            self.cancel()
+            log.debug("Mallet terminated.")
+
+    def _expire(self):
+        self.timed_out = True
+        self.cancel()
+
+    def cancel(self, grace=5):
+        """Terminate Mallet (or prevent it from starting)
+
+        Args:
+            grace (float): Seconds to wait after terminating before killing
+        """
+        self._cancelled.set()
+        with self._lock:
+            process = self._process
+        if process is not None and process.poll() is None:
+            self._signal(process, signal.SIGTERM)
+            try:
+                process.wait(grace)
+            except TimeoutExpired:
+                self._signal(process, getattr(signal, 'SIGKILL', signal.SIGTERM))
+
+    @staticmethod
+    def _signal(process, signum):
+        try:
+            if os.name == 'posix':
+                os.killpg(process.pid, signum)
+            else:
+                process.terminate()
+        except ProcessLookupError:
+            pass
+
+
+class MalletRunner:
+    """Run several Mallet jobs concurrently
+
+    Args:
+        max_jobs (int): Maximum number of Mallet processes at the same time;
+                        defaults to the number of CPUs
+
+    Example:
+        >>> with MalletRunner(max_jobs=2) as runner:             # doctest: +SKIP
+        ...     futures = [runner.submit(param) for param in params]
+        ...     jobs = [future.result() for future in futures]
+    """
+
+    def __init__(self, max_jobs=None):
+        self._executor = ThreadPoolExecutor(max_jobs or os.cpu_count() or 1)
+        self.jobs = []
+
+    def submit(self, param, timeout=None, progress=None, shell=None):
+        """Queue a Mallet command
+
+        Args: see MalletJob
+        Returns: concurrent.futures.Future resolving to the finished MalletJob;
+                 the job itself is available as `future.job`
+        """
+        job = MalletJob(param, timeout=timeout, progress=progress, shell=shell)
+        self.jobs.append(job)
+        future = self._executor.submit(job.run)
+        future.job = job
+        return future
+
+    def cancel(self):
+        """Cancel all queued and running jobs"""
+        for job in self.jobs:
+            job.cancel()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.cancel()
+        self.shutdown()
+
+
+def run_mallet_trainings(path_to_malletModel, outfolder, num_topics=(10,), seeds=(None,),
+                         path_to_mallet="mallet", max_jobs=None, timeout=None, progress=None,
+                         config=None, **kwargs):
+    """Train several Mallet models concurrently
+
+    Args:
+        path_to_malletModel(str): Path to mallet model, see create_mallet_model()
+        outfolder (str): Folder for Mallet output; each training writes to
+                         the subfolder `topics<num_topics>_seed<seed>`
+        num_topics (list): Numbers of topics to train
+        seeds (list): Random seeds to train each number of topics with
+        path_to_mallet(str): Path to mallet
+        max_jobs (int): Maximum number of concurrent Mallet processes;
+                        defaults to the number of CPUs divided by the
+                        sampling threads per training
+        timeout (float): Seconds after which a training is cancelled
+        progress (callable): Called with (num_topics, seed, MalletProgress)
+        config (TrainTopicsConfig): Options shared by all trainings
+        **kwargs: Further TrainTopicsConfig options, e.g. num_iterations
+
+    Returns: Dictionary of (num_topics, seed) : output folder pairs of the
+             successful trainings
+    """
+    config = (config or TrainTopicsConfig()).replace(**kwargs)
+    if max_jobs is None:
+        max_jobs = max(1, (os.cpu_count() or 1) // config.threads)
+    futures = {}
+    with MalletRunner(max_jobs) as runner:
+        for topics, seed in itertools.product(num_topics, seeds):
+            folder = os.path.join(os.path.abspath(outfolder),
+                                  "topics{}_seed{}".format(topics, seed))
+            os.makedirs(folder, exist_ok=True)
+            param = config.replace(num_topics=topics, random_seed=seed).param(
+                path_to_malletModel, folder, path_to_mallet)
+            callback = None
+            if progress is not None:
+                callback = functools.partial(progress, topics, seed)
+            futures[(topics, seed)] = (folder, runner.submit(param, timeout=timeout,
+                                                             progress=callback))
+        results = {}
+        for key, (folder, future) in futures.items():
+            try:
+                future.result()
+                results[key] = folder
+            except (MalletCancelled, CalledProcessError) as err:
+                log.error("Training %s failed: %s", key, err)
+    return results
 
-       
 
 def grouper(n, iterable, fillvalue=None):
     """Collect data into fixed-length chunks or blocks
@@ -182,105 +649,215 @@ def grouper(n, iterable, fillvalue=None):
     return itertools.zip_longest(*args, fillvalue=fillvalue)
     
 
-def show_docTopicMatrix(output_folder, docTopicsFile = "doc_topics.txt"):
-    """Show document-topic-mapping
+def _topic_labels(path_to_topic_keys):
+    """Creates list of topic labels consisting of the 3 most weighed keys"""
+    df = pd.read_csv(path_to_topic_keys, sep='\t', header=None, encoding='utf-8')
+    return [' '.join(keys.split()[:3]) for keys in df[2]]
+
+
+def read_doc_topics(path_to_doc_topics, num_topics=None):
+    """Read Mallets' doc_topics file into a NumPy array
 
     Args:
-        outfolder (str): Folder for Mallet output, default = 'tutorial_supplementals/mallet_output'
-        docTopicsFile (str): Name of Mallets' doc_topic file, default doc_topics.txt
+        path_to_doc_topics (str): Path to Mallets' doc_topics file
+        num_topics (int): Number of topics; if None, taken from the file
         
-    Note: Based on DARIAH-Tutorial -> https://de.dariah.eu/tatom/topic_model_mallet.html#topic-model-mallet
+    Note: Handles both formats of `--output-doc-topics`: one proportion per
+          topic (Mallet >= 2.0.8), read with pandas' C parser, and the older
+          sparse `#doc name topic proportion ...` format, read line by line
+          into a row per document name (sorted by name, like before).
         
-    ToDo: Prettify docnames
+    Returns: Tuple of document-topic array (one row per document) and list
+             of document names
     """
-    
-    doc_topics = os.path.join(output_folder, docTopicsFile)
-    assert doc_topics
-    
-    topic_keys = os.path.join(output_folder, "topic_keys.txt")
-    assert topic_keys
-    
-    doctopic_triples = []
-    mallet_docnames = []
-    topics = []
-    
-    df = pd.read_csv(topic_keys, sep='\t', header=None, encoding='utf-8')
-    labels=[]
-    for index, item in df.iterrows():
-        label= ' '.join(item[2].split()[:3])
-        labels.append(label)
-        
-    easy_file_format = False
+    with open(path_to_doc_topics, encoding='utf-8') as f:
+        sparse_format = f.readline().lstrip().startswith('#')
+
+    if not sparse_format:
+        df = pd.read_csv(path_to_doc_topics, sep='\t', header=None,
+                         encoding='utf-8', quoting=3)
+        data = df.iloc[:, 2:].dropna(axis=1, how='all').to_numpy(dtype=float)
+        if num_topics is not None:
+            data = data[:, :num_topics]
+        return data, df[1].tolist()
+
+    docnames = []
+    topic_shares = []
+    with open(path_to_doc_topics, encoding='utf-8') as f:
+        for line in f:
+            if line.lstrip().startswith('#') or not line.strip():
+                continue
+            docnum, docname, *values = line.rstrip().split('\t')
+            docnames.append(docname)
+            topic_shares.append(np.array(values, dtype=float).reshape(-1, 2))
+
+    mallet_docnames = sorted(set(docnames))
+    rows = {docname: row for row, docname in enumerate(mallet_docnames)}
+    if num_topics is None:
+        num_topics = 1 + max((int(shares[:, 0].max()) for shares in topic_shares
+                              if len(shares)), default=-1)
+    data = np.zeros((len(mallet_docnames), num_topics))
+    for docname, shares in zip(docnames, topic_shares):
+        data[rows[docname], shares[:, 0].astype(int)] = shares[:, 1]
+    return data, mallet_docnames
+
+
+MalletState = namedtuple('MalletState', ['doc_topics', 'topic_words', 'docnames', 'types',
+                                         'alpha', 'beta'])
+MalletState.__doc__ = """Topic assignment counts aggregated from Mallets' state file
+
+    doc_topics: sparse document-topic count matrix (one row per Mallet doc)
+    topic_words: sparse topic-word count matrix (one column per typeindex)
+    docnames: source of each document (None for documents without tokens)
+    types: word of each typeindex
+    alpha: array of the document-topic priors, one per topic
+    beta: topic-word prior
+"""
+
+
+def _add_counts(total, rows, cols):
+    """Add one per (row, col) pair to the sparse matrix total, growing it"""
+    shape = (max(total.shape[0], int(rows.max()) + 1), max(total.shape[1], int(cols.max()) + 1))
+    counts = sparse.csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, cols)), shape=shape)
+    total.resize(shape)
+    return total + counts
+
+
+def _extend_names(names, indices, values):
+    """Record values at indices without a name yet (first occurrences in order)"""
+    for index, value in zip(indices, values):
+        if index >= len(names):
+            names.extend([None] * (index - len(names)))
+            names.append(value)
+        elif names[index] is None:
+            names[index] = value
 
-    with open(doc_topics, encoding='utf-8') as f:
+
+def read_state(path_to_state, chunksize=1000000):
+    """Aggregate Mallets' state.gz into sparse count matrices
+
+    Args:
+        path_to_state (str): Path to the state file written by `--output-state`
+        chunksize (int): Number of token lines parsed at once
+
+    Note: The file is decompressed on the fly and parsed chunk by chunk with
+          pandas' C parser; memory depends on chunksize and the number of
+          non-zero counts, not on the size of the file. Fields are separated
+          by single spaces, so sources must not contain spaces (Mallet writes
+          URIs or `NA`).
+
+    Returns: MalletState
+    """
+    alpha = None
+    beta = None
+    header_lines = 0
+    with gzip.open(path_to_state, 'rt', encoding='utf-8') as f:
         for line in f:
-            li=line.lstrip()
-            if li.startswith("#"):
-                lines = f.readlines()
-                for line in lines:
-                    docnum, docname, *values = line.rstrip().split('\t')
-                    mallet_docnames.append(docname)
-                    for topic, share in grouper(2, values):
-                        triple = (docname, int(topic), float(share))
-                        topics.append(int(topic))
-                        doctopic_triples.append(triple)
-            else:
-                easy_file_format = True
+            if not line.startswith('#'):
                 break
+            header_lines += 1
+            if line.startswith('#alpha :'):
+                alpha = np.array(line.split(':', 1)[1].split(), dtype=float)
+            elif line.startswith('#beta :'):
+                beta = float(line.split(':', 1)[1])
+
+    num_topics = 0 if alpha is None else len(alpha)
+    doc_topics = sparse.csr_matrix((0, num_topics), dtype=np.int64)
+    topic_words = sparse.csr_matrix((num_topics, 0), dtype=np.int64)
+    docnames = []
+    types = []
+    reader = pd.read_csv(path_to_state, sep=' ', header=None, skiprows=header_lines,
+                         names=['doc', 'source', 'pos', 'typeindex', 'type', 'topic'],
+                         usecols=['doc', 'source', 'typeindex', 'type', 'topic'],
+                         dtype={'doc': np.int64, 'source': str, 'typeindex': np.int64,
+                                'type': str, 'topic': np.int64},
+                         compression='gzip', encoding='utf-8', quoting=3, na_filter=False,
+                         chunksize=chunksize)
+    for chunk in reader:
+        if chunk.empty:
+            continue
+        doc = chunk['doc'].to_numpy()
+        typeindex = chunk['typeindex'].to_numpy()
+        topic = chunk['topic'].to_numpy()
+        doc_topics = _add_counts(doc_topics, doc, topic)
+        topic_words = _add_counts(topic_words, topic, typeindex)
+        first = chunk.drop_duplicates('doc')
+        _extend_names(docnames, first['doc'], first['source'])
+        first = chunk.drop_duplicates('typeindex').sort_values('typeindex')
+        _extend_names(types, first['typeindex'], first['type'])
+    log.debug("Read %d tokens from %s", doc_topics.sum(), path_to_state)
+    return MalletState(doc_topics, topic_words, docnames, types, alpha, beta)
+
+
+def state_doc_topics(state, num_docs=None):
+    """Document-topic proportions from a MalletState
+
+    Args:
+        state (MalletState): see read_state()
+        num_docs (int): Number of documents in the model; defaults to the
+                        documents seen in the state
 
+    Note: Smoothed with alpha like Mallets' doc_topics output. Documents
+          without tokens after the last one with tokens do not appear in the
+          state, so the result only has the rows of read_doc_topics() of the
+          same run if num_docs is given.
 
-    if(easy_file_format == True):
-        newindex=[]
-        docTopicMatrix = pd.read_csv(doc_topics, sep='\t', names=labels[0:], encoding='utf-8')
-        #print(list(docTopicMatrix.index))
-        for eins, zwei in docTopicMatrix.index:
-            newindex.append(os.path.basename(zwei))
-        docTopicMatrix.index = newindex
-        
-    else:
-        # sort the triples
-        # triple is (docname, topicnum, share) so sort(key=operator.itemgetter(0,1))
-        # sorts on (docname, topicnum) which is what we want
-        doctopic_triples = sorted(doctopic_triples, key=operator.itemgetter(0,1))
+    Returns: NumPy array with one row per document
+    """
+    counts = state.doc_topics.toarray().astype(float)
+    if num_docs is not None:
+        if num_docs < len(counts):
+            raise ValueError("num_docs is %d, but the state has %d documents"
+                             % (num_docs, len(counts)))
+        counts = np.vstack([counts, np.zeros((num_docs - len(counts), counts.shape[1]))])
+    alpha = state.alpha if state.alpha is not None else 0
+    counts += alpha
+    return counts / counts.sum(axis=1, keepdims=True)
 
-        # sort the document names rather than relying on MALLET's ordering
-        mallet_docnames = sorted(mallet_docnames)
 
-        # collect into a document-term matrix
-        num_docs = len(mallet_docnames) 
+def state_topic_keys(state, num_top_words=10):
+    """Most frequent words of each topic from a MalletState
 
-        num_topics = max(topics) + 1
+    Args:
+        state (MalletState): see read_state()
+        num_top_words (int): Number of words per topic
 
-        # the following works because we know that the triples are in sequential order
-        data = np.zeros((num_docs, num_topics))
+    Note: Use `preprocessing` dictionaries to map the words to term ids,
+          e.g. for `evaluation.topic_coherence()`.
 
-        for triple in doctopic_triples:
-            docname, topic, share = triple
-            row_num = mallet_docnames.index(docname)
-            data[row_num, topic] = share
-        
-        topicLabels = []
-    
-        #creates list of topic lables consisting of the 3 most weighed topics
-        df = pd.read_csv('tutorial_supplementals/mallet_output/topic_keys.txt', sep='\t', header=None, encoding='utf-8')
-        labels=[]
-        for index, item in df.iterrows():
+    Returns: List with one list of words per topic, most frequent first
+    """
+    keys = []
+    for topic in range(state.topic_words.shape[0]):
+        row = state.topic_words.getrow(topic)
+        order = np.lexsort((row.indices, -row.data))[:num_top_words]
+        keys.append([state.types[typeindex] for typeindex in row.indices[order]])
+    return keys
 
-            topicLabel= ' '.join(item[2].split()[:3])
-            topicLabels.append(topicLabel)
+
+def show_docTopicMatrix(output_folder, docTopicsFile = "doc_topics.txt"):
+    """Show document-topic-mapping
+
+    Args:
+        outfolder (str): Folder for Mallet output, default = 'tutorial_supplementals/mallet_output'
+        docTopicsFile (str): Name of Mallets' doc_topic file, default doc_topics.txt
         
-        shortened_docnames=[]
-        for item in mallet_docnames:
-            shortened_docnames.append(os.path.basename(item))
-
-        '''
-        for topic in range(max(topics)+1):
-        topicLabels.append("Topic_" + str(topic))
-        '''                   
-        docTopicMatrix = pd.DataFrame(data=data[0:,0:],
-                  index=shortened_docnames[0:],
-                  columns=topicLabels[0:])
+    Note: Based on DARIAH-Tutorial -> https://de.dariah.eu/tatom/topic_model_mallet.html#topic-model-mallet
+          Use read_doc_topics() to get a plain NumPy array.
         
+    ToDo: Prettify docnames
+    """
+    
+    doc_topics = os.path.join(output_folder, docTopicsFile)
+    topic_keys = os.path.join(output_folder, "topic_keys.txt")
+
+    topicLabels = _topic_labels(topic_keys)
+    data, mallet_docnames = read_doc_topics(doc_topics, num_topics=len(topicLabels))
+
+    shortened_docnames = [os.path.basename(docname) for docname in mallet_docnames]
+    docTopicMatrix = pd.DataFrame(data=data,
+                                  index=shortened_docnames,
+                                  columns=topicLabels[:data.shape[1]])
     return docTopicMatrix.T
 
 def show_topics_keys(output_folder, topicsKeyFile = "topic_keys.txt", num_topics=10):
@@ -13,6 +13,7 @@ import logging
 import numpy as np
 import matplotlib.pyplot as plt
 from gensim import corpora, models, similarities
+from dariah_topics import preprocessing
 
 __author__ = "DARIAH-DE"
 __authors__ = "Steffen Pielstroem"
@@ -164,19 +165,18 @@ def gensim_to_dtm(model, corpus, no_of_topics):
         dictionary: Dictionary created by :func:`gensimModel`.
         no_of_topics (Optional[int]): Number of topics. Defaults by 10.
 
+    Raises:
+        ValueError: if no_of_topics differs from the model's number of topics.
+
     Author:
         DARIAH-DE
     """
 
-    no_of_docs = len(corpus)
-    doc_topic = np.zeros((no_of_docs, no_of_topics))
-    for doc, i in zip(corpus, range(no_of_docs)):
-        # to get topic distribution from model
-        topic_dist = model.__getitem__(doc)
-        # topic_dist is a list of tuples (topic_id, topic_prob)
-        for topic in topic_dist:
-            doc_topic[i][topic[0]] = topic[1]   # save topic probability
-    return doc_topic
+    if no_of_topics != model.num_topics:
+        raise ValueError("no_of_topics is %s, but the model has %s topics"
+                         % (no_of_topics, model.num_topics))
+    # batched inference, see preprocessing.infer_doc_topics()
+    return preprocessing.infer_doc_topics(model, corpus, len(corpus))
 
 ########################################################################
 # Topic visualization
@@ -19,14 +19,19 @@ __date__ = "2017-01-20"
 
 import glob
 import os
-from collections import Counter, defaultdict
+from array import array
+from collections import Counter, defaultdict, namedtuple
 import csv
 import logging
+import multiprocessing
+from functools import lru_cache, partial
 from lxml import etree
+from dariah_topics import feature_selection
 import numpy as np
 import pandas as pd
 import regex
-from itertools import chain
+from itertools import chain, islice
+from scipy import sparse
 
 
 log = logging.getLogger('preprocessing')
@@ -54,12 +59,131 @@ def create_document_list(path, ext='txt'):
         raise FileNotFoundError("The pattern %s does not match any files." % pattern)
     return doclist
 
-def read_from_tei(doclist):
-    ns = dict(tei="http://www.tei-c.org/ns/1.0")
-    for file in doclist:
-        tree = etree.parse(file)
-        text_el = tree.xpath('//tei:text', namespaces=ns)[0]
-        yield "".join(text_el.xpath('.//text()'))
+TEI_NAMESPACE = "http://www.tei-c.org/ns/1.0"
+
+TEIMetadata = namedtuple('TEIMetadata', ['title', 'author', 'date'])
+TEIMetadata.__doc__ = """Metadata from a teiHeader; missing values are None
+
+    title: first title of fileDesc/titleStmt
+    author: first author of fileDesc/titleStmt
+    date: date of profileDesc/creation, else the first date in the header;
+          its @when, its text or "notBefore-notAfter"
+"""
+
+def _tei_string(element):
+    if element is None:
+        return None
+    return " ".join(element.xpath('string()').split()) or None
+
+def _tei_date(element):
+    if element is None:
+        return None
+    if element.get('when'):
+        return element.get('when')
+    text = _tei_string(element)
+    if text is None and element.get('notBefore') and element.get('notAfter'):
+        return "{}-{}".format(element.get('notBefore'), element.get('notAfter'))
+    return text or element.get('notBefore') or element.get('notAfter')
+
+def _tei_metadata(header):
+    """Extracts TEIMetadata from a parsed teiHeader element."""
+    def first(path):
+        found = header.xpath(path, namespaces=dict(tei=TEI_NAMESPACE))
+        return found[0] if found else None
+    date = first('tei:profileDesc/tei:creation//tei:date')
+    if date is None:
+        date = first('.//tei:date')
+    return TEIMetadata(_tei_string(first('tei:fileDesc/tei:titleStmt/tei:title')),
+                       _tei_string(first('tei:fileDesc/tei:titleStmt/tei:author')),
+                       _tei_date(date))
+
+def read_tei(file, metadata=False):
+    """Extracts the text of a TEI document with `iterparse`.
+
+    Note:
+        Returns the same text as joining all text nodes of the first
+        `tei:text` element. Elements are cleared as soon as their text is
+        collected, so memory stays bounded by the depth of the document
+        rather than its size. Parsing stops at the end of `tei:text`.
+
+    Args:
+        file: Path to a TEI XML file or a binary file object.
+        metadata (bool): Also return the TEIMetadata of the teiHeader,
+            extracted in the same pass.
+
+    Raises:
+        ValueError: if the document has no `tei:text` element.
+
+    Returns:
+        Text of the document, or tuple of text and TEIMetadata.
+    """
+    text_tag = '{%s}text' % TEI_NAMESPACE
+    header_tag = '{%s}teiHeader' % TEI_NAMESPACE
+    header = TEIMetadata(None, None, None)
+    # one list of collected strings per open element below tei:text
+    stack = None
+    for event, element in etree.iterparse(file, events=('start', 'end'),
+                                          remove_comments=True, remove_pis=True):
+        if stack is None:
+            if event == 'start' and element.tag == text_tag:
+                stack = [[]]
+            elif event == 'end' and element.tag == header_tag:
+                if metadata:
+                    header = _tei_metadata(element)
+                element.clear(keep_tail=True)
+            continue
+        if event == 'start':
+            stack.append([])
+            continue
+        # the element's text, its children's text and their tails are complete
+        # now; only the last child's tail has not been collected yet
+        parts = stack.pop()
+        last_tail = element[-1].tail if len(element) else None
+        content = ''.join([element.text or ''] + parts + [last_tail or ''])
+        if not stack:
+            return (content, header) if metadata else content
+        previous = element.getprevious()
+        if previous is not None:
+            stack[-1].append(previous.tail or '')
+            element.getparent().remove(previous)
+        stack[-1].append(content)
+        element.clear(keep_tail=True)
+    raise ValueError("No tei:text element in %s." % getattr(file, 'name', file))
+
+def read_from_tei(doclist, metadata=False, workers=1, chunksize=None):
+    """Extracts the texts of TEI documents in parallel.
+
+    Note:
+        Use `create_document_list()` with `ext='xml'` or a document list to
+        create `doclist`. Results keep the order of `doclist`.
+
+    Args:
+        doclist (list[str]): List of all documents in the corpus.
+        metadata (bool): Also yield the TEIMetadata of each document, see
+            `read_tei()`.
+        workers (int): Number of worker processes. None uses all CPUs; with
+            1, documents are parsed serially in the current process.
+        chunksize (int): Number of documents sent to a worker at once.
+            Defaults to about four chunks per worker.
+
+    Yields:
+        Text of each document, or tuples of text and TEIMetadata.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    doclist = list(doclist)
+    workers = min(workers, len(doclist))
+    if workers <= 1:
+        for file in doclist:
+            log.debug("Accessing TEI document %s ...", file)
+            yield read_tei(file, metadata)
+        return
+
+    if chunksize is None:
+        chunksize = max(1, len(doclist) // (workers * 4))
+    log.info("Reading %s TEI documents with %s processes ...", len(doclist), workers)
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap(partial(read_tei, metadata=metadata), doclist, chunksize)
 
 def read_from_txt(doclist):
     """Opens files using a list of paths or one single path.
@@ -135,29 +259,91 @@ def get_labels(doclist):
     log.debug("Document labels available")
 
 
-def segmenter(doc_txt, length=1000):
-    """Segments documents.
+def stream_tokens(file, paragraphs=False, blocksize=2**20, **kwargs):
+    """Reads and tokenizes a TXT file block by block.
 
     Note:
-        Use `read_from_txt()` to create `doc_txt`.
+        Only about `blocksize` characters are held in memory, so documents of
+        any size can be streamed into `segmenter()`. Blocks end at line
+        breaks; the result equals `tokenize()` on the whole document for
+        expressions that do not match across lines, like the default one.
 
     Args:
-        doc_txt (str): Document as iterable.
-        length (int): Target size of segments. Defaults to '1000'.
+        file (str): Path to TXT file.
+        paragraphs (bool): Yield one list of tokens per paragraph (lines
+            separated by empty lines) instead of single tokens, e.g. as
+            chunks for `segmenter()` with `tolerance`.
+        blocksize (int): Approximate number of characters read at once.
+        **kwargs: Passed on to `get_tokenizer()`.
 
     Yields:
-        Document slizes with length words.
+        Tokens, or lists of tokens with `paragraphs`.
+    """
+    tokenizer = get_tokenizer(**kwargs)
+    with open(file, 'r', encoding='utf-8') as f:
+        log.debug("Streaming TXT document %s ...", file)
+        if not paragraphs:
+            for lines in iter(partial(f.readlines, blocksize), []):
+                yield from tokenizer.tokenize(''.join(lines))
+            return
+        paragraph = []
+        for line in chain(f, ['']):
+            if line.strip():
+                paragraph.append(line)
+            elif paragraph:
+                yield tokenizer.tokenize(''.join(paragraph))
+                paragraph = []
+
+def _fixed_segments(tokens, length):
+    """Yields lists of `length` tokens, the last one possibly shorter."""
+    tokens = iter(tokens)
+    while True:
+        segment = list(islice(tokens, length))
+        if not segment:
+            return
+        yield segment
+
+def _document_segments(document, length, tolerance):
+    if isinstance(document, str):
+        raise TypeError("segmenter() expects tokens, not text; use e.g. tokenize() first.")
+    if tolerance is None:
+        return _fixed_segments(document, length)
+    return map(list, map(chain.from_iterable, segment_fuzzy(document, length, tolerance)))
+
+def segmenter(doc_tokens, length=1000, tolerance=None, doclist=None):
+    """Segments a stream of documents into segments of `length` tokens.
 
-    Todo:
-        * Implement fuzzy option to consider paragraph breaks.
+    Note:
+        Segments are produced lazily, so neither the corpus nor a whole
+        document has to be in memory if the documents are iterators, e.g.
+        from `stream_tokens()`. Segments never span two documents.
+
+    Args:
+        doc_tokens (Iterable): Documents, each an iterable of tokens. With
+            `tolerance`, each document is an iterable of chunks (e.g.
+            paragraphs), each chunk a list of tokens.
+        length (int): Target size of segments in tokens. Defaults to '1000'.
+        tolerance (Number): If given, prefer to keep chunks together as long
+            as segments deviate by no more than `tolerance` tokens (or this
+            fraction of `length`), see `segment_fuzzy()`. Otherwise, segments
+            have exactly `length` tokens, except the last of each document.
+        doclist (BaseDocList): If given, the number of segments of each
+            document is recorded with `doclist.flatten_segments()`, e.g. for
+            `doclist.segment_filenames()`.
+
+    Yields:
+        Segments as lists of tokens, document by document.
+
+    Example:
+        >>> list(segmenter([['a', 'b', 'c'], ['d']], length=2))
+        [['a', 'b'], ['c'], ['d']]
     """
-    doc = next(doc_txt)
-    log.info("Segmenting document ...")
-    for i, word in enumerate(doc):
-        if i % length == 0:
-            log.debug("Segment has a length of %s characters.", length)
-            segment = doc[i : i + length]
-            yield segment
+    log.info("Segmenting documents ...")
+    segmented_docs = (_document_segments(document, length, tolerance)
+                      for document in doc_tokens)
+    if doclist is not None:
+        return doclist.flatten_segments(segmented_docs)
+    return chain.from_iterable(segmented_docs)
 
 def split_paragraphs(doc_txt, sep=regex.compile('\n')):
     """
@@ -191,6 +377,8 @@ def segment_fuzzy(document, segment_size=5000, tolerance=0.05):
             the segment_size? If 0 < tolerance < 1, this is interpreted as a
             fraction of the segment_size, otherwise it is interpreted as an
             absolute number. If tolerance < 0, chunks are never split apart.
+            A chunk that is not split and does not fit into a segment with
+            other chunks becomes a segment of its own.
 
     Yields:
         Segments. Each segment is a list of chunks, each chunk is a list of
@@ -219,7 +407,8 @@ def segment_fuzzy(document, segment_size=5000, tolerance=0.05):
                     chunk_part0 = chunk[:-too_long]
                     carry = chunk[-too_long:]
                     current_segment[-1] = chunk_part0
-                elif too_long >= too_short:
+                elif too_long >= too_short and len(current_segment) > 1:
+                    # an oversized chunk on its own stays a segment
                     carry = current_segment.pop()
                 yield current_segment
                 current_segment = []
@@ -232,6 +421,113 @@ def segment_fuzzy(document, segment_size=5000, tolerance=0.05):
         yield current_segment
 
 
+def chunk_array(document, type_dictionary=None):
+    """
+    Converts a chunked document into one token array and chunk boundaries.
+
+    Args:
+        document: Iterable of chunks, each an iterable of tokens, as for
+            `segment_fuzzy()`.
+        type_dictionary (dict): If given, tokens are replaced by their ids.
+
+    Returns:
+        Tuple of a NumPy array of all tokens (or token ids) and an array of
+        chunk boundaries, i.e. chunk `i` is `tokens[bounds[i]:bounds[i + 1]]`.
+    """
+    lengths = [0]
+    tokens = []
+    for chunk in document:
+        before = len(tokens)
+        tokens.extend(chunk)
+        lengths.append(len(tokens) - before)
+    if type_dictionary is not None:
+        tokens = np.array([type_dictionary[token] for token in tokens], dtype=np.int64)
+    else:
+        tokens = np.array(tokens, dtype=object)
+    return tokens, np.cumsum(lengths, dtype=np.int64)
+
+def segment_bounds(chunk_bounds, segment_size=5000, tolerance=0.05):
+    """
+    Segments a document given by chunk boundaries, like `segment_fuzzy()`.
+
+    Description:
+        Only the boundaries are computed, one step per chunk, so no token is
+        copied. The segments are the same `segment_fuzzy()` yields, flattened.
+
+    Args:
+        chunk_bounds: Offsets of the chunks in the document's token array,
+            starting with 0 and ending with the number of tokens, e.g. from
+            `chunk_array()`.
+        segment_size (int): The target length of each segment in tokens.
+        tolerance (Number): see `segment_fuzzy()`.
+
+    Returns:
+        NumPy array of segment boundaries: segment `i` is
+        `tokens[bounds[i]:bounds[i + 1]]`.
+
+    Example:
+        >>> segment_bounds([0, 5, 10, 15], segment_size=4).tolist()
+        [0, 4, 8, 12, 15]
+    """
+    if tolerance > 0 and tolerance < 1:
+        tolerance = round(segment_size * tolerance)
+
+    chunk_bounds = np.asarray(chunk_bounds, dtype=np.int64).tolist()
+    chunk_start = chunk_bounds[0]
+    bounds = [chunk_start]
+    current_size = 0
+    current_chunks = 0
+    i = 1
+
+    while i < len(chunk_bounds):
+        chunk_end = chunk_bounds[i]
+        length = chunk_end - chunk_start
+        current_chunks += 1
+        current_size += length
+
+        if current_size >= segment_size:
+            too_long = current_size - segment_size
+            too_short = segment_size - (current_size - length)
+
+            if tolerance >= 0 and min(too_long, too_short) > tolerance:
+                # split the chunk, the rest is the next segment's first chunk
+                chunk_start = chunk_end - too_long
+            elif too_long >= too_short and current_chunks > 1:
+                # carry the whole chunk over to the next segment
+                pass
+            else:
+                chunk_start = chunk_end
+                i += 1
+            bounds.append(chunk_start)
+            current_size = 0
+            current_chunks = 0
+        else:
+            chunk_start = chunk_end
+            i += 1
+
+    # handle leftovers
+    if current_chunks:
+        bounds.append(chunk_start)
+    return np.array(bounds, dtype=np.int64)
+
+def segment_array(tokens, chunk_bounds, segment_size=5000, tolerance=0.05):
+    """
+    Segments a token array, tolerating existing chunks (like paragraphs).
+
+    Args:
+        tokens (ndarray): All tokens (or token ids) of the document, e.g.
+            from `chunk_array()`.
+        chunk_bounds: Chunk offsets into `tokens`, see `segment_bounds()`.
+        segment_size (int): The target length of each segment in tokens.
+        tolerance (Number): see `segment_fuzzy()`.
+
+    Returns:
+        List of segments, each a view of `tokens`.
+    """
+    bounds = segment_bounds(chunk_bounds, segment_size, tolerance).tolist()
+    return [tokens[start:stop] for start, stop in zip(bounds, bounds[1:])]
+
+
 def segment(document, segment_size=1000, tolerance=0, chunker=None,
             tokenizer=None, flatten_chunks=False, materialize=False):
     """
@@ -270,9 +566,61 @@ def segment(document, segment_size=1000, tolerance=0, chunker=None,
 
 
 
+class Tokenizer:
+    """Reusable tokenizer with a precompiled Unicode Regular Expression.
+
+    Normalization removes periods and replaces the dashes ‒, –, — and ― with
+    spaces as listed in `normalization`. Each entry is applied with
+    `str.replace()`, which copies the document only if the character occurs
+    (`str.translate()` is much slower on non-ASCII text). Use
+    `get_tokenizer()` to share instances.
+
+    Args:
+        expression (str): Regular expression to find tokens.
+        lower (boolean): If True, lowers all words. Defaults to True.
+        simple (boolean): Uses simple regular expression (r'\\w+'). Defaults to False.
+            If set to True, argument `expression` will be ignored.
+
+    Example:
+        >>> Tokenizer().tokenize("This is one example—text.")
+        ['this', 'is', 'one', 'example', 'text']
+    """
+    normalization = (('.', ''), ('‒', ' '), ('–', ' '), ('—', ' '), ('―', ' '))
+
+    def __init__(self, expression=regular_expression, lower=True, simple=False):
+        if simple:
+            expression = r'\w+'
+        self.lower = lower
+        self.pattern = regex.compile(expression)
+
+    def normalize(self, doc_txt):
+        """Returns the lowered document without periods and dashes."""
+        if self.lower:
+            doc_txt = doc_txt.lower()
+        for old, new in self.normalization:
+            doc_txt = doc_txt.replace(old, new)
+        return doc_txt
+
+    def tokenize(self, doc_txt):
+        """Returns a list of the tokens in `doc_txt`."""
+        doc_txt = self.normalize(doc_txt)
+        if self.pattern.groups:
+            return [match.group() for match in self.pattern.finditer(doc_txt)]
+        return self.pattern.findall(doc_txt)
+
+    __call__ = tokenize
+
+@lru_cache(maxsize=32)
+def get_tokenizer(expression=regular_expression, lower=True, simple=False):
+    """Returns a cached `Tokenizer` for the given arguments."""
+    return Tokenizer(expression, lower, simple)
+
 def tokenize(doc_txt, expression=regular_expression, lower=True, simple=False):
     """Tokenizes with Unicode Regular Expressions.
 
+    Note:
+        Uses a cached `Tokenizer`, so the expression is compiled only once.
+
     Args:
         doc_txt (str): Document as string.
         expression (str): Regular expression to find tokens.
@@ -287,20 +635,49 @@ def tokenize(doc_txt, expression=regular_expression, lower=True, simple=False):
         >>> list(tokenize("This is one example text."))
         ['this', 'is', 'one', 'example', 'text']
     """
-    if lower:
-        doc_txt = doc_txt.lower()
-    if simple:
-        pattern = regex.compile(r'\w+')
-    else:
-        pattern = regex.compile(expression)
-    doc_txt = regex.sub("\.", "", doc_txt)
-    doc_txt = regex.sub("‒", " ", doc_txt)
-    doc_txt = regex.sub("–", " ", doc_txt)
-    doc_txt = regex.sub("—", " ", doc_txt)
-    doc_txt = regex.sub("―", " ", doc_txt)
-    tokens = pattern.finditer(doc_txt)
-    for match in tokens:
-        yield match.group()
+    yield from get_tokenizer(expression, lower, simple).tokenize(doc_txt)
+
+def _read_and_tokenize(file, **kwargs):
+    """Reads one TXT file and returns its tokens as list (process pool worker)."""
+    with open(file, 'r', encoding='utf-8') as f:
+        return get_tokenizer(**kwargs).tokenize(f.read())
+
+def tokenize_corpus(doclist, workers=None, chunksize=None, **kwargs):
+    """Reads and tokenizes TXT files in parallel.
+
+    Note:
+        Use `create_document_list()` or a `PathDocList` to create `doclist`.
+        Results keep the order of `doclist`, so they line up with the labels
+        from `get_labels()`.
+
+    Args:
+        doclist (list[str]): List of all documents in the corpus.
+        workers (int): Number of worker processes. Defaults to the number of
+            CPUs. With 1 worker, documents are read and tokenized serially in
+            the current process.
+        chunksize (int): Number of documents sent to a worker at once.
+            Defaults to about four chunks per worker.
+        **kwargs: Passed on to `tokenize()`, e.g. `lower` or `expression`.
+
+    Yields:
+        List of tokens for each document.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(doclist))
+    if workers <= 1:
+        log.info("Tokenizing %s documents serially ...", len(doclist))
+        tokenizer = get_tokenizer(**kwargs)
+        for doc_txt in read_from_txt(list(doclist)):
+            yield tokenizer.tokenize(doc_txt)
+        return
+
+    if chunksize is None:
+        chunksize = max(1, len(doclist) // (workers * 4))
+    log.info("Tokenizing %s documents with %s processes ...", len(doclist), workers)
+    with multiprocessing.Pool(workers) as pool:
+        yield from pool.imap(partial(_read_and_tokenize, **kwargs), doclist, chunksize)
+    log.debug("Documents tokenized.")
 
 def filter_POS_tags(doc_csv, pos_tags=['ADJ', 'V', 'NN']):
     """Gets lemmas by selected POS-tags from DKPro-Wrapper output.
@@ -324,24 +701,34 @@ def filter_POS_tags(doc_csv, pos_tags=['ADJ', 'V', 'NN']):
         yield lemma
 
 
+def _inverse(id_types):
+    """Returns the id : type mapping of a dictionary or `Vocabulary`."""
+    try:
+        return id_types.inverse
+    except AttributeError:
+        return {value : key for key, value in id_types.items()}
+
 def find_stopwords(sparse_bow, id_types, mfw = 200):
     """Creates a stopword list.
 
     Note:
         Use `create_TF_matrix` to create `docterm_matrix`.
+        Corpus frequencies are counted with `numpy.bincount()`; see
+        `feature_selection.select_features()` to combine several criteria.
 
     Args:
         docterm_matrix (DataFrame): DataFrame with term and term frequency by document.
+            A sparse matrix from `create_sparse_bow()` works as well.
         mfw (int): Target size of most frequent words to be considered.
 
     Returns:
         Most frequent words in DataFrame.
     """
     log.info("Finding stopwords ...")
-    type2id = {value : key for key, value in id_types.items()}
-    sparse_bow_collapsed = sparse_bow.groupby(sparse_bow.index.get_level_values('token_id')).sum()
-    sparse_bow_stopwords = sparse_bow_collapsed[0].nlargest(mfw)
-    stopwords = [type2id[key] for key in sparse_bow_stopwords.index.get_level_values('token_id')]
+    type2id = _inverse(id_types)
+    corpus_frequency = feature_selection.feature_frequencies(sparse_bow).corpus_frequency
+    columns = feature_selection.most_frequent(corpus_frequency, mfw)
+    stopwords = [type2id[column + 1] for column in columns.tolist()]
     log.debug("%s stopwords found.", len(stopwords))
     return stopwords
 
@@ -353,16 +740,16 @@ def find_hapax(sparse_bow, id_types):
 
     Args:
         docterm_matrix (DataFrame): DataFrame with term and term frequency by document.
+            A sparse matrix from `create_sparse_bow()` works as well.
 
     Returns:
         Hapax legomena in Series.
     """
     log.info("Find hapax legomena ...")
 
-    type2id = {value : key for key, value in id_types.items()}
-    sparse_bow_collapsed = sparse_bow.groupby(sparse_bow.index.get_level_values('token_id')).sum()
-    sparse_bow_hapax = sparse_bow_collapsed.loc[sparse_bow_collapsed[0] == 1]
-    hapax = [type2id[key] for key in sparse_bow_hapax.index.get_level_values('token_id')]
+    type2id = _inverse(id_types)
+    corpus_frequency = feature_selection.feature_frequencies(sparse_bow).corpus_frequency
+    hapax = [type2id[column + 1] for column in np.flatnonzero(corpus_frequency == 1).tolist()]
 
     log.debug("%s hapax legomena found.", len(hapax))
     return hapax
@@ -372,6 +759,7 @@ def remove_features(mm, id_types, features):
 
     Note:
         Use `find_stopwords()` or `find_hapax()` to create `features`.
+        For sparse matrices, use `feature_selection.apply_feature_mask()`.
 
     Args:
         docterm_matrix (DataFrame): DataFrame with term and term frequency by document.
@@ -386,13 +774,7 @@ def remove_features(mm, id_types, features):
     """
     log.info("Removing features ...")
 
-    if type(features) == set:
-
-        stoplist_applied = [word for word in set(id_types.keys()) if word in features]
-
-        clean_term_frequency = mm.drop([id_types[word] for word in stoplist_applied], level="token_id")
-
-    else:
+    if type(features) != set:
 
         try:
 
@@ -402,9 +784,10 @@ def remove_features(mm, id_types, features):
 
             log.debug("features must be set or convertible to set")
 
-        stoplist_applied = [word for word in set(id_types.keys()) if word in features]
-
-        clean_term_frequency = mm.drop([id_types[word] for word in stoplist_applied], level="token_id")
+    # look up the features rather than scanning the whole vocabulary
+    token_ids = [id_types[word] for word in features if word in id_types]
+    removed = mm.index.get_level_values("token_id").isin(token_ids)
+    clean_term_frequency = mm[~removed]
 
     total = len(features)
 
@@ -420,6 +803,8 @@ def create_dictionaries(doc_labels, doc_tokens):
         Use get_labels to create doc_labels and use tokenize to create doc_tokens.
         Creates two dictionaries. One with keys = token : value = id pairs. And one with
         keys = document label : value = id pairs.
+        This reads the corpus twice (here and in create_mm()); use stream_bow()
+        or create_sparse_bow() to build ids and counts in a single pass.
 
     Args:
         doc_labels(list): List of doc labels as string.
@@ -447,7 +832,8 @@ def create_dictionaries(doc_labels, doc_tokens):
 
         typeset.update(tempset)
 
-    type_dictionary = { v : k for k, v in enumerate(typeset, 1) }
+    # sorted, as set order varies between runs (string hashing is randomized)
+    type_dictionary = { v : k for k, v in enumerate(sorted(typeset), 1) }
     doc_ids = { doc : id_num for id_num, doc in enumerate(doc_labels, 1) }
 
 
@@ -480,45 +866,41 @@ def _create_large_counter(doc_labels, doc_tokens, type_dictionary):
 
     return largecounter
 
-def _create_sparse_index(largecounter):
+def _counter_arrays(largecounter):
     """create_large_TF_matrix
 
     Note:
-        The main function is create_mm(). This creates a pandas multiindex out of tuples.
-        The Multiindex represents document id to token ids relations.
+        The main function is create_mm(). Flattens the counters into NumPy
+        arrays in one pass, keeping the order of documents (by id) and of
+        tokens within each document (first occurrence). Empty documents get
+        a `(doc_id, 0)` entry with count 0.
 
     Args:
-        largecounter(dict of counters): Dictionary of document : counter pairs. With counter
-                                        being token id : count pairs.
+        largecounter(dict of counters): Dictionary of document id : counter pairs,
+                                        with ids 1, 2, ..., len(largecounter).
 
     Returns:
-        Pandas Multiindex with document id to token id relations.
-    ToDo:
+        Three NumPy arrays: doc_id, token_id and count of each entry.
     """
-    
-    tuples = []
-
-    for key in range(1, len(largecounter)+1):
-
-        if len(largecounter[key]) == 0:
-            tuples.append((key, 0))
-    
-        for value in largecounter[key]:
-
-            tuples.append((key, value))
-
-    sparse_index = pd.MultiIndex.from_tuples(tuples, names = ["doc_id", "token_id"])
-
-    return sparse_index
-
+    counters = [largecounter[key] for key in range(1, len(largecounter) + 1)]
+    lengths = np.array([max(len(counter), 1) for counter in counters], dtype=np.int64)
+    total = int(lengths.sum())
+    doc_id = np.repeat(np.arange(1, len(counters) + 1, dtype=np.int64), lengths)
+    token_id = np.fromiter(chain.from_iterable(counter.keys() or (0,) for counter in counters),
+                           dtype=np.int64, count=total)
+    counts = np.fromiter(chain.from_iterable(counter.values() or (0,) for counter in counters),
+                         dtype=np.int64, count=total)
+    return doc_id, token_id, counts
 
 def create_mm(doc_labels, doc_tokens, type_dictionary, doc_ids):
     """create_large_TF_matrix
 
     Note:
-        Main funktion that incorporates _create_large_counter() and _create_sparse_index().
+        Main funktion that incorporates _create_large_counter() and _counter_arrays().
         Creates Pandas DataFrame out of Pandas Multiindex with document id - token id - count data.
         The output has one column representing the counts of tokens for each token in each document.
+        Documents without any token get a `(doc_id, 0)` entry with count 0.
+        For large corpora, create_sparse_bow() and sparse_bow_to_mm() need less memory.
 
     Args:
         doc_labels(list): List of doc labels as string.
@@ -528,29 +910,198 @@ def create_mm(doc_labels, doc_tokens, type_dictionary, doc_ids):
 
     Returns:
         Multiindexed Pandas DataFrame with document id - token id - count data.
-
-    ToDo:
-        Test if it's necessary to build sparse_df_filled with int8 zeroes instead of int64.
     """
 
     temp_counter = _create_large_counter(doc_labels, doc_tokens, type_dictionary)
 
     largecounter = {doc_ids[key] : value for key, value in temp_counter.items()}
 
-    sparse_index = _create_sparse_index(largecounter)
+    doc_id, token_id, counts = _counter_arrays(largecounter)
 
-    sparse_df_filled = pd.DataFrame(np.zeros((len(sparse_index), 1), dtype = int), index = sparse_index)
+    sparse_index = pd.MultiIndex.from_arrays([doc_id, token_id], names=["doc_id", "token_id"])
 
+    return pd.DataFrame(counts, index=sparse_index)
+    
+def stream_bow(labeled_docs, type_dictionary, fixed_types=False):
+    """Counts tokens document by document, consuming the corpus exactly once.
 
-    index_iterator = sparse_index.groupby(sparse_index.get_level_values('doc_id'))
+    Note:
+        Type ids are assigned incrementally while streaming, so no document
+        has to be kept in memory and the memory needed is bounded by the size
+        of the vocabulary. To feed it from the file system, use e.g.
+        `zip(get_labels(doclist), map(tokenize, read_from_txt(doclist)))`.
 
-    for doc_id in range(1, len(sparse_index.levels[0])+1):
-        for token_id in [val[1] for val in index_iterator[doc_id]]:
+    Args:
+        labeled_docs(Iterable): Iterable of (label, tokens) pairs, with
+                                tokens being an iterable of strings.
+        type_dictionary(dict): Dictionary with key = token : value = id pairs.
+                               Unknown tokens are added in place with the next
+                               free id, so pass an empty dictionary to build
+                               the vocabulary from scratch.
+        fixed_types(bool): If True, ignore tokens missing from
+                           `type_dictionary` instead of adding them.
 
-            sparse_df_filled.set_value((doc_id, token_id), 0, int(largecounter[doc_id][token_id]))
+    Yields:
+        Three-tuples of label, NumPy array of sorted token ids and NumPy array
+        of the corresponding counts.
+
+    Example:
+        >>> types = {}
+        >>> for label, ids, counts in stream_bow([('a', ['x', 'y', 'x'])], types):
+        ...     print(label, ids.tolist(), counts.tolist())
+        a [1, 2] [2, 1]
+        >>> types
+        {'x': 1, 'y': 2}
+    """
+    next_id = max(type_dictionary.values(), default=0) + 1
+    for label, tokens in labeled_docs:
+        counter = Counter(tokens)
+        token_ids = array('q')
+        counts = array('q')
+        for token, count in counter.items():
+            token_id = type_dictionary.get(token)
+            if token_id is None:
+                if fixed_types:
+                    continue
+                token_id = type_dictionary[token] = next_id
+                next_id += 1
+            token_ids.append(token_id)
+            counts.append(count)
+        token_ids = np.frombuffer(token_ids, dtype=np.int64)
+        counts = np.frombuffer(counts, dtype=np.int64)
+        order = np.argsort(token_ids, kind='mergesort')
+        yield label, token_ids[order], counts[order]
+
+def create_sparse_bow(doc_labels, doc_tokens, type_dictionary=None, doc_ids=None):
+    """Creates a sparse document-term matrix in one pass over the token streams.
+
+    Note:
+        Faster replacement for create_dictionaries() and create_mm(), with
+        counting done by stream_bow(). Use sparse_bow_to_mm() if you need the
+        Multiindexed DataFrame instead.
+        Row `i` of the matrix holds the document with doc_id `i + 1`, column
+        `j` the type with token_id `j + 1`, just like in the Matrix Market
+        file written by save_bow_mm().
+
+    Args:
+        doc_labels(list): List of doc labels as string.
+        doc_tokens(list): Iterable of token iterables, one for each document.
+        type_dictionary(dict): Dictionary with key = token : value = id pairs.
+                               If None, ids are assigned in order of first
+                               occurrence, starting with 1. Otherwise tokens
+                               missing from the dictionary are ignored.
+        doc_ids(dict): Dictionary with keys = document label : value = id pairs.
+                       If None, ids are assigned in order of doc_labels,
+                       starting with 1.
+
+    Returns:
+        Three-tuple of scipy.sparse.csr_matrix with the token counts,
+        type_dictionary and doc_ids.
+
+    Example:
+        >>> matrix, types, docs = create_sparse_bow(['a', 'b'], [['x', 'y', 'x'], ['y']])
+        >>> matrix.toarray().tolist()
+        [[2, 1], [0, 1]]
+        >>> sorted(types.items()), docs
+        ([('x', 1), ('y', 2)], {'a': 1, 'b': 2})
+    """
+    log.info("Creating sparse bag-of-words matrix ...")
+    grow_types = type_dictionary is None
+    if grow_types:
+        type_dictionary = {}
+
+    labels = []
+    indptr = [0]
+    indices = [np.zeros(0, dtype=np.int64)]
+    data = [np.zeros(0, dtype=np.int64)]
+
+    for label, token_ids, counts in stream_bow(zip(doc_labels, doc_tokens),
+                                               type_dictionary,
+                                               fixed_types=not grow_types):
+        labels.append(label)
+        indices.append(token_ids - 1)
+        data.append(counts)
+        indptr.append(indptr[-1] + len(token_ids))
+
+    num_types = max(type_dictionary.values(), default=0)
+    matrix = sparse.csr_matrix((np.concatenate(data),
+                                np.concatenate(indices),
+                                np.array(indptr, dtype=np.int64)),
+                               shape=(len(labels), num_types))
+
+    if doc_ids is None:
+        doc_ids = {label : id_num for id_num, label in enumerate(labels, 1)}
+    else:
+        rows = np.array([doc_ids[label] - 1 for label in labels], dtype=np.int64)
+        if not np.array_equal(rows, np.arange(len(labels))):
+            coo = matrix.tocoo()
+            matrix = sparse.csr_matrix((coo.data, (rows[coo.row], coo.col)),
+                                       shape=(max(doc_ids.values()), num_types))
+
+    matrix.sort_indices()
+    log.debug("%s documents and %s types in sparse matrix.", *matrix.shape)
+    return matrix, type_dictionary, doc_ids
+
+def sparse_bow_to_mm(matrix):
+    """Converts a sparse document-term matrix into the Multiindexed DataFrame.
+
+    Note:
+        Use create_sparse_bow() to create `matrix`. The result is the same
+        structure create_mm() returns and can be used with find_stopwords(),
+        find_hapax(), remove_features() and save_bow_mm(). Documents without
+        any token get a `(doc_id, 0)` entry with count 0.
+
+    Args:
+        matrix(scipy.sparse matrix): Document-term matrix with one row per
+                                     document and one column per type.
+
+    Returns:
+        Multiindexed Pandas DataFrame with document id - token id - count data.
+    """
+    matrix = sparse.csr_matrix(matrix)
+    matrix.sort_indices()
+    row_lengths = np.diff(matrix.indptr)
+    doc_id = np.repeat(np.arange(1, matrix.shape[0] + 1), row_lengths)
+    token_id = matrix.indices.astype(np.int64) + 1
+    counts = matrix.data.astype(np.int64)
+
+    empty = np.flatnonzero(row_lengths == 0)
+    if len(empty):
+        doc_id = np.concatenate([doc_id, empty + 1])
+        token_id = np.concatenate([token_id, np.zeros(len(empty), dtype=np.int64)])
+        counts = np.concatenate([counts, np.zeros(len(empty), dtype=np.int64)])
+        order = np.lexsort((token_id, doc_id))
+        doc_id, token_id, counts = doc_id[order], token_id[order], counts[order]
+
+    sparse_index = pd.MultiIndex.from_arrays([doc_id, token_id],
+                                             names=["doc_id", "token_id"])
+    return pd.DataFrame(counts, index=sparse_index)
+
+def mm_to_sparse_bow(sparse_bow):
+    """Converts the Multiindexed DataFrame into a sparse document-term matrix.
+
+    Note:
+        Inverse of sparse_bow_to_mm(). Entries with token_id 0 (empty
+        documents) are skipped.
+
+    Args:
+        sparse_bow(Pandas DataFrame): Multiindexed Pandas DataFrame with
+                                      document id - token id - count data.
+
+    Returns:
+        scipy.sparse.csr_matrix with one row per doc_id and one column per
+        token_id.
+    """
+    doc_id = sparse_bow.index.get_level_values("doc_id").to_numpy(dtype=np.int64)
+    token_id = sparse_bow.index.get_level_values("token_id").to_numpy(dtype=np.int64)
+    counts = sparse_bow[0].to_numpy(dtype=np.int64)
+    shape = (doc_id.max(initial=0), token_id.max(initial=0))
+    keep = token_id > 0
+    matrix = sparse.csr_matrix((counts[keep], (doc_id[keep] - 1, token_id[keep] - 1)),
+                               shape=shape)
+    matrix.sort_indices()
+    return matrix
 
-    return sparse_df_filled
-    
 def make_doc2bow_list(sparse_bow):
     """Creates doc2bow_list as input for gensim model.get_document_topics(doc2bow_list[idx])
 
@@ -570,6 +1121,87 @@ def make_doc2bow_list(sparse_bow):
 
     return doc2bow_list
     
+_worker_model = None
+
+def _init_inference_worker(model):
+    global _worker_model
+    _worker_model = model
+
+def _infer_chunk(model, chunk, minimum_probability):
+    """Returns the document-topic array for a list of bag-of-words documents."""
+    if hasattr(model, 'inference'):
+        gamma = model.inference(chunk)
+        if isinstance(gamma, tuple):
+            gamma = gamma[0]
+        doc_topic = gamma / gamma.sum(axis=1, keepdims=True)
+    else:
+        doc_topic = np.zeros((len(chunk), model.num_topics))
+        for row, topic_dist in zip(doc_topic, model[chunk]):
+            if topic_dist:
+                topics, probabilities = zip(*topic_dist)
+                row[list(topics)] = probabilities
+    doc_topic[doc_topic < minimum_probability] = 0
+    return doc_topic
+
+def _infer_chunk_in_worker(chunk, minimum_probability):
+    return _infer_chunk(_worker_model, chunk, minimum_probability)
+
+def _chunks(corpus, num_docs, chunksize):
+    corpus = iter(corpus)
+    for start in range(0, num_docs, chunksize):
+        chunk = list(islice(corpus, min(chunksize, num_docs - start)))
+        if not chunk:
+            return
+        yield chunk
+
+def infer_doc_topics(model, corpus, num_docs=None, chunksize=2000, workers=1,
+                     minimum_probability=None):
+    """Infers the topic distribution of each document in batches.
+
+    Note:
+        Documents are passed to the model `chunksize` at a time, using the
+        bulk `inference()` of gensim's LdaModel where available and
+        `model[chunk]` otherwise. Like `model[doc]`, topic probabilities
+        below the model's `minimum_probability` are set to 0.
+
+    Args:
+        model: Gensim topic model.
+        corpus: Gensim corpus, e.g. `MmapCorpus` or a list of doc2bow lists.
+        num_docs (int): Number of documents to process. Defaults to
+            `len(corpus)`.
+        chunksize (int): Number of documents inferred at once.
+        workers (int): Number of processes. With more than 1, chunks are
+            inferred in a process pool, each worker holding a copy of `model`.
+        minimum_probability (float): Threshold for topic probabilities.
+            Defaults to the model's `minimum_probability` or 0.
+
+    Returns:
+        NumPy array with one row per document and one column per topic.
+    """
+    if num_docs is None:
+        num_docs = len(corpus)
+    if minimum_probability is None:
+        minimum_probability = getattr(model, 'minimum_probability', 0)
+    doc_topic = np.zeros((num_docs, model.num_topics))
+    chunks = _chunks(corpus, num_docs, chunksize)
+
+    log.info("Inferring topics of %s documents ...", num_docs)
+    if workers > 1:
+        with multiprocessing.Pool(workers, _init_inference_worker, (model,)) as pool:
+            results = pool.imap(partial(_infer_chunk_in_worker,
+                                        minimum_probability=minimum_probability), chunks)
+            start = 0
+            for result in results:
+                doc_topic[start:start + len(result)] = result
+                start += len(result)
+    else:
+        start = 0
+        for chunk in chunks:
+            doc_topic[start:start + len(chunk)] = _infer_chunk(model, chunk, minimum_probability)
+            start += len(chunk)
+    log.debug("Document-topic matrix available.")
+    return doc_topic
+
 def make_doc_topic_matrix(model, doc2bow_list, doc2id):
     """Use only for testing purposes, not working properly
 
@@ -610,32 +1242,119 @@ def gensim2dataframe(model):
     topics_df.columns=['Key ' + str(x+1) for x in range(10)]
     return topics_df
     
-def save_bow_mm(sparse_bow, output_path):
+def save_bow_mm(sparse_bow, output_path, chunksize=1000000):
     """Save bag-of-word model as market matrix
 
     Note:
         Create sparse_bow with create_mm() or take output from remove_features().
-        Ouput Path gives name of new local file.
+        Ouput Path gives name of new local file. Lines are formatted in bulk,
+        `chunksize` entries at a time.
 
     Args:
         sparse_bow(Pandas DataFrame):  Multiindexed Pandas DataFrame with 
                                         document id - token id - count data.
+        sparse_bow(scipy.sparse matrix): Document-term matrix, e.g. from
+                                         create_sparse_bow().
         output_path(str): Path to output file.
+        chunksize(int): Number of entries formatted at once.
     Returns:
         None. Creates file with sparse_bow in market matrix format.
 
     ToDo:
     """
-    num_docs = max(sparse_bow.index.get_level_values("doc_id"))
-    num_types = max(sparse_bow.index.get_level_values("token_id"))
-    sum_counts = sum(sparse_bow[0])
+    if isinstance(sparse_bow, pd.DataFrame):
+        sparse_bow = mm_to_sparse_bow(sparse_bow)
+    coo = sparse.csr_matrix(sparse_bow).tocoo()
+    num_docs, num_types = coo.shape
 
-    header_string = str(num_docs) + " " + str(num_types) + " " + str(sum_counts) + "\n"
+    header_string = str(num_docs) + " " + str(num_types) + " " + str(coo.nnz) + "\n"
 
     with open('.'.join([output_path, 'mm']), 'w', encoding = "utf-8") as f:
-        pass
-
-    with open('.'.join([output_path, 'mm']), 'a', encoding = "utf-8") as f:
         f.write("%%MatrixMarket matrix coordinate real general\n")
         f.write(header_string)
-        sparse_bow.to_csv( f, sep = ' ', header = None)
+        for start in range(0, coo.nnz, chunksize):
+            end = start + chunksize
+            lines = map("{} {} {}\n".format,
+                        (coo.row[start:end] + 1).tolist(),
+                        (coo.col[start:end] + 1).tolist(),
+                        coo.data[start:end].tolist())
+            f.write("".join(lines))
+
+_BOW_ARRAYS = ('data', 'indices', 'indptr', 'shape')
+
+def save_bow_npy(sparse_bow, output_path):
+    """Save bag-of-word model as binary NumPy arrays
+
+    Note:
+        Creates a folder with the CSR arrays `data.npy`, `indices.npy`,
+        `indptr.npy` and `shape.npy`. Use load_bow_npy() or MmapCorpus to
+        access them without parsing any text.
+
+    Args:
+        sparse_bow(Pandas DataFrame or scipy.sparse matrix): Output of
+            create_mm(), create_sparse_bow() or remove_features().
+        output_path(str): Path to output folder.
+
+    Returns:
+        None.
+    """
+    if isinstance(sparse_bow, pd.DataFrame):
+        sparse_bow = mm_to_sparse_bow(sparse_bow)
+    matrix = sparse.csr_matrix(sparse_bow)
+    matrix.sort_indices()
+    os.makedirs(output_path, exist_ok=True)
+    arrays = dict(data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+                  shape=np.array(matrix.shape, dtype=np.int64))
+    for name in _BOW_ARRAYS:
+        np.save(os.path.join(output_path, name + '.npy'), arrays[name])
+    log.debug("Bag-of-words with %s entries saved to %s.", matrix.nnz, output_path)
+
+def load_bow_npy(path, mmap_mode='r'):
+    """Load bag-of-word model saved by save_bow_npy()
+
+    Args:
+        path(str): Path to folder created by save_bow_npy().
+        mmap_mode(str): Passed on to `numpy.load()`. With the default 'r',
+                        the arrays are memory-mapped read-only rather than
+                        read into memory. None loads them.
+
+    Returns:
+        scipy.sparse.csr_matrix backed by the (memory-mapped) arrays.
+    """
+    arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+              for name in _BOW_ARRAYS}
+    return sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                             shape=tuple(arrays['shape']), copy=False)
+
+class MmapCorpus:
+    """Gensim compatible corpus over a bag-of-words saved by save_bow_npy().
+
+    Iterating yields one list of `(token_id, count)` tuples per document with
+    the zero-based ids gensim expects, i.e. `token_id` is the matrix column
+    and `token_id + 1` the id from `type_dictionary`. Documents are read from
+    the memory-mapped arrays on demand, so the corpus can be passed to e.g.
+    `gensim.models.LdaModel` directly.
+
+    Args:
+        path(str): Path to folder created by save_bow_npy().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        matrix = load_bow_npy(path)
+        self.data = matrix.data
+        self.indices = matrix.indices
+        self.indptr = matrix.indptr
+        self.num_docs, self.num_terms = matrix.shape
+        self.num_nnz = matrix.nnz
+
+    def __len__(self):
+        return self.num_docs
+
+    def __getitem__(self, docno):
+        start, end = self.indptr[docno], self.indptr[docno + 1]
+        return list(zip(self.indices[start:end].tolist(), self.data[start:end].tolist()))
+
+    def __iter__(self):
+        for docno in range(self.num_docs):
+            yield self[docno]
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Topic Number Sweep.
+
+This module trains gensim LDA models for a grid of topic numbers, passes and
+seeds in parallel and scores them by coherence, provided by `DARIAH-DE`_.
+
+The bag-of-words and vocabulary are written once to the sweep folder; every
+worker process memory-maps them instead of receiving a pickled copy. Each
+finished model adds a row to `results.csv`, so an interrupted sweep resumes
+with the models still missing. Only the best models are kept on disk.
+
+To compare topic numbers with Mallet, see `mallet.run_mallet_trainings()`.
+
+.. _DARIAH-DE:
+    https://de.dariah.eu
+    https://github.com/DARIAH-DE
+"""
+
+__author__ = "DARIAH-DE"
+__authors__ = "Steffen Pielstroem, Philip Duerholt, Sina Bock, Severin Simmler"
+__email__ = "pielstroem@biozentrum.uni-wuerzburg.de"
+__version__ = "0.1"
+__date__ = "2017-03-01"
+
+from dariah_topics import evaluation
+from dariah_topics import preprocessing as pre
+from dariah_topics.vocabulary import Vocabulary
+from functools import partial
+from gensim.models import LdaModel
+import csv
+import itertools
+import logging
+import multiprocessing
+import os
+import pandas as pd
+import shutil
+import time
+
+log = logging.getLogger('sweep')
+log.addHandler(logging.NullHandler())
+
+RESULT_COLUMNS = ['name', 'num_topics', 'passes', 'seed', 'umass', 'uci', 'npmi', 'seconds']
+
+
+def prepare_sweep(sparse_bow, id_types, folder):
+    """Writes the corpus of a sweep.
+
+    Args:
+        sparse_bow: Document-term matrix from `create_sparse_bow()` or the
+            DataFrame from `create_mm()` / `remove_features()`.
+        id_types (dict or Vocabulary): type : id pairs; ids must be
+            consecutive from 1.
+        folder (str): Sweep folder, created if necessary.
+
+    Returns:
+        folder
+    """
+    if not isinstance(id_types, Vocabulary):
+        id_types = Vocabulary.from_dictionary(id_types)
+    os.makedirs(folder, exist_ok=True)
+    pre.save_bow_npy(sparse_bow, os.path.join(folder, 'bow'))
+    id_types.save(os.path.join(folder, 'vocabulary'))
+    return folder
+
+
+def _run_name(num_topics, passes, seed):
+    return "topics{}_passes{}_seed{}".format(num_topics, passes, seed)
+
+
+def train_and_score(folder, num_topics, passes, seed, top_words=10, **kwargs):
+    """Trains one model of a sweep and saves it (process pool worker).
+
+    Args:
+        folder (str): Sweep folder written by `prepare_sweep()`.
+        num_topics (int): Number of topics.
+        passes (int): Passes over the corpus.
+        seed (int): Random state of the model.
+        top_words (int): Number of words per topic to score coherence on.
+        **kwargs: Passed on to `gensim.models.LdaModel`, e.g. `iterations`.
+
+    Returns:
+        Dictionary with the RESULT_COLUMNS.
+    """
+    start = time.perf_counter()
+    name = _run_name(num_topics, passes, seed)
+    corpus = pre.MmapCorpus(os.path.join(folder, 'bow'))
+    vocabulary = Vocabulary.load(os.path.join(folder, 'vocabulary'))
+    model = LdaModel(corpus, id2word=vocabulary.id2word(), num_topics=num_topics,
+                     passes=passes, random_state=seed, **kwargs)
+    topic_terms = evaluation.top_term_ids(model, num_topics, top_words)
+    doc_term_matrix = pre.load_bow_npy(os.path.join(folder, 'bow'))
+    per_topic, overall = evaluation.topic_coherence(doc_term_matrix, topic_terms)
+
+    model_folder = os.path.join(folder, 'models', name)
+    os.makedirs(model_folder, exist_ok=True)
+    model.id2word = None    # the vocabulary is stored once for the sweep
+    model.save(os.path.join(model_folder, 'model'))
+    result = dict(name=name, num_topics=num_topics, passes=passes, seed=seed,
+                  seconds=time.perf_counter() - start, **overall)
+    log.info("%s: %s", name, overall)
+    return result
+
+
+def _train_params(folder, params, **kwargs):
+    return train_and_score(folder, *params, **kwargs)
+
+
+def read_results(folder):
+    """Results of all finished models of a sweep as DataFrame."""
+    path = os.path.join(folder, 'results.csv')
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    return pd.read_csv(path, encoding='utf-8')
+
+
+def _prune_models(folder, results, measure, keep_best):
+    """Deletes the saved models not among the `keep_best` best."""
+    best = set(results.nlargest(keep_best, measure)['name'])
+    models = os.path.join(folder, 'models')
+    for name in os.listdir(models) if os.path.isdir(models) else []:
+        if name not in best:
+            shutil.rmtree(os.path.join(models, name), ignore_errors=True)
+
+
+def load_model(folder, name):
+    """Loads a model saved by a sweep, with its vocabulary.
+
+    Args:
+        folder (str): Sweep folder.
+        name (str): Value of the `name` column in the results.
+    """
+    model = LdaModel.load(os.path.join(folder, 'models', name, 'model'))
+    model.id2word = Vocabulary.load(os.path.join(folder, 'vocabulary')).id2word()
+    return model
+
+
+def sweep(folder, num_topics=(10, 20, 30), passes=(1,), seeds=(0,), workers=None,
+          measure='npmi', keep_best=1, top_words=10, **kwargs):
+    """Trains and scores a model for every combination of parameters.
+
+    Args:
+        folder (str): Sweep folder written by `prepare_sweep()`.
+        num_topics (list): Numbers of topics.
+        passes (list): Numbers of passes.
+        seeds (list): Random states; several seeds show the variance.
+        workers (int): Number of processes; defaults to the number of CPUs.
+            With 1, models are trained in the current process.
+        measure (str): Coherence measure ranking the models: 'umass',
+            'uci' or 'npmi' (higher is better).
+        keep_best (int): Number of best models to keep in `models/`.
+        top_words (int): Number of words per topic to score coherence on.
+        **kwargs: Passed on to `gensim.models.LdaModel`, e.g. `iterations`.
+
+    Note:
+        Models already listed in `results.csv` are not trained again, so
+        calling sweep() again after an interruption, or with a larger grid,
+        only trains the missing ones.
+
+    Returns:
+        DataFrame with one row per model (see RESULT_COLUMNS), best first.
+
+    Example:
+        >>> prepare_sweep(matrix, id_types, 'sweep')          # doctest: +SKIP
+        >>> results = sweep('sweep', num_topics=range(10, 101, 10))  # doctest: +SKIP
+        >>> model = load_model('sweep', results['name'][0])  # doctest: +SKIP
+    """
+    if measure not in ('umass', 'uci', 'npmi'):
+        raise ValueError("Unknown coherence measure %r." % measure)
+    results = read_results(folder)
+    done = set(results['name'])
+    grid = [params for params in itertools.product(num_topics, passes, seeds)
+            if _run_name(*params) not in done]
+    log.info("Training %s models, %s already done ...", len(grid), len(done))
+
+    path = os.path.join(folder, 'results.csv')
+    train = partial(_train_params, folder, top_words=top_words, **kwargs)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(grid))
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        finished = pool.imap_unordered(train, grid) if pool else map(train, grid)
+        for result in finished:
+            new_file = not os.path.exists(path)
+            with open(path, 'a', encoding='utf-8', newline='') as f:
+                writer = csv.DictWriter(f, RESULT_COLUMNS)
+                if new_file:
+                    writer.writeheader()
+                writer.writerow(result)
+            results = read_results(folder)
+            _prune_models(folder, results, measure, keep_best)
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+    return results.sort_values(measure, ascending=False).reset_index(drop=True)
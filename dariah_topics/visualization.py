@@ -19,6 +19,7 @@ __version__ = "0.1"
 __date__ = "2017-01-20"
 
 
+from dariah_topics import preprocessing
 import logging
 import matplotlib.pyplot as plt
 import numpy as np
@@ -116,13 +117,9 @@ class Visualization:
         """
         no_of_topics = self.model.num_topics
         no_of_docs = len(self.doc_labels)
-        doc_topic = np.zeros((no_of_docs, no_of_topics))
 
         log.info("Accessing topic distribution and topic probability ...")
-        for doc, i in zip(self.corpus, range(no_of_docs)):
-            topic_dist = self.model.__getitem__(doc)
-            for topic in topic_dist: # topic_dist is a list of tuples (topic_id, topic_prob)
-                doc_topic[i][topic[0]] = topic[1]
+        doc_topic = preprocessing.infer_doc_topics(self.model, self.corpus, no_of_docs)
         log.debug("Topic distribution and topic probability available.")
 
         log.info("Accessing plot labels ...")
@@ -222,6 +219,10 @@ def create_doc_topic(corpus, model, doc_labels):
     # Adapted from cody by Stefan Pernes
     """Creates a document-topic data frame.
 
+    Note:
+        Topic distributions are inferred in batches by
+        `preprocessing.infer_doc_topics()`.
+
     Args:
         Gensim corpus.
         Gensim model object.
@@ -232,12 +233,7 @@ def create_doc_topic(corpus, model, doc_labels):
     """
     no_of_topics = model.num_topics
     no_of_docs = len(doc_labels)
-    doc_topic = np.zeros((no_of_docs, no_of_topics))
-
-    for doc, i in zip(corpus, range(no_of_docs)):       # use document bow from corpus
-        topic_dist = model.__getitem__(doc)             # to get topic distribution froom model
-        for topic in topic_dist:                        # topic_dist is a list of tuples
-            doc_topic[i][topic[0]] = topic[1]           # save topic probability
+    doc_topic = preprocessing.infer_doc_topics(model, corpus, no_of_docs)
 
     topic_labels = []
     for i in range(no_of_topics):
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Vocabulary.
+
+This module provides a compact, bidirectional mapping between types and
+their ids, provided by `DARIAH-DE`_.
+
+A `Vocabulary` behaves like the `id_types` dictionaries (type : id pairs,
+ids starting with 1) used throughout `dariah_topics.preprocessing`, but keeps
+all types in one UTF-8 buffer with an array of offsets and finds ids through
+an open-addressing hash table of integers. It needs a fraction of the memory
+of two dictionaries of Python strings, can be memory-mapped from disk and
+serves gensim as `id2word` without building an inverse dictionary.
+
+.. _DARIAH-DE:
+    https://de.dariah.eu
+    https://github.com/DARIAH-DE
+"""
+
+__author__ = "DARIAH-DE"
+__authors__ = "Steffen Pielstroem, Philip Duerholt, Sina Bock, Severin Simmler"
+__email__ = "pielstroem@biozentrum.uni-wuerzburg.de"
+__version__ = "0.1"
+__date__ = "2017-03-01"
+
+from array import array
+from collections.abc import Mapping
+import logging
+import numpy as np
+import os
+import zlib
+
+log = logging.getLogger('vocabulary')
+log.addHandler(logging.NullHandler())
+
+_ARRAYS = ('buffer', 'offsets', 'hashes', 'table')
+
+
+def _hash(data):
+    """Stable hash of bytes (Python's `hash()` varies between runs)."""
+    return zlib.crc32(data)
+
+
+class Vocabulary(Mapping):
+    """Mapping of type : id pairs with ids 1, 2, 3, ... in insertion order.
+
+    Args:
+        tokens (iterable): Types to add, in id order. Duplicates are skipped.
+
+    Note:
+        Supports everything `stream_bow()`, `create_sparse_bow()`,
+        `find_stopwords()` etc. do with an `id_types` dictionary, including
+        `vocabulary[token] = len(vocabulary) + 1` to append a type. Other
+        assignments raise ValueError, as ids never change.
+
+    Example:
+        >>> vocabulary = Vocabulary(['kaffee', 'tee'])
+        >>> vocabulary['tee'], vocabulary.token(1), vocabulary.add('kuchen')
+        (2, 'kaffee', 3)
+        >>> vocabulary.id2word()[0]
+        'kaffee'
+        >>> vocabulary == {'kaffee': 1, 'tee': 2, 'kuchen': 3}
+        True
+    """
+
+    def __init__(self, tokens=()):
+        self._buffer = bytearray()
+        self._offsets = array('q', [0])
+        self._hashes = array('q')
+        self._table = np.zeros(8, dtype=np.int32)
+        self.update(tokens)
+
+    @classmethod
+    def from_dictionary(cls, id_types):
+        """Creates a Vocabulary from a dictionary of type : id pairs.
+
+        Args:
+            id_types (dict): e.g. from `create_dictionaries()`; ids must be
+                1, 2, ..., len(id_types).
+
+        Raises:
+            ValueError: if ids are not consecutive from 1.
+        """
+        tokens = sorted(id_types, key=id_types.get)
+        if [id_types[token] for token in tokens] != list(range(1, len(tokens) + 1)):
+            raise ValueError("Type ids must be 1, 2, ..., %d." % len(tokens))
+        return cls(tokens)
+
+    @classmethod
+    def from_documents(cls, doc_tokens, sort=False):
+        """Creates a Vocabulary of all types in `doc_tokens`.
+
+        Args:
+            doc_tokens (iterable): Iterable of token iterables.
+            sort (bool): Number types alphabetically instead of in order of
+                first occurrence. Both are deterministic.
+        """
+        types = {}
+        for tokens in doc_tokens:
+            types.update(dict.fromkeys(tokens))
+        return cls(sorted(types) if sort else types)
+
+    def _find(self, data, hash_value):
+        """Returns the table slot of `data` or the empty slot to put it in."""
+        mask = len(self._table) - 1
+        slot = hash_value & mask
+        while True:
+            token_id = int(self._table[slot])
+            if token_id == 0:
+                return slot
+            if self._hashes[token_id - 1] == hash_value and \
+                    self._bytes(token_id) == data:
+                return slot
+            slot = (slot + 1) & mask
+
+    def _bytes(self, token_id):
+        return bytes(self._buffer[self._offsets[token_id - 1]:self._offsets[token_id]])
+
+    def _make_writable(self):
+        if not isinstance(self._buffer, bytearray):
+            self._buffer = bytearray(self._buffer)
+            self._offsets = array('q', self._offsets)
+            self._hashes = array('q', self._hashes)
+            self._table = np.array(self._table)
+
+    def _build_table(self, size):
+        """Inserts all types into a new table of `size` slots at once.
+
+        Each round puts the lowest pending id of every contested free slot
+        there and moves the others one slot on, so every type ends up on the
+        linear probing path from its hash without gaps.
+        """
+        table = np.zeros(size, dtype=np.int32)
+        mask = size - 1
+        pending = np.arange(len(self._hashes), dtype=np.int64)
+        slots = np.asarray(self._hashes, dtype=np.int64) & mask
+        while len(pending):
+            free = table[slots] == 0
+            unique_slots, first = np.unique(slots[free], return_index=True)
+            table[unique_slots] = pending[free][first] + 1
+            placed = np.zeros(len(pending), dtype=bool)
+            placed[np.flatnonzero(free)[first]] = True
+            pending = pending[~placed]
+            slots = (slots[~placed] + 1) & mask
+        self._table = table
+
+    def update(self, tokens):
+        """Adds all new types in `tokens`, in order."""
+        new = dict.fromkeys(token for token in tokens if not len(self) or token not in self)
+        if not new:
+            return
+        self._make_writable()
+        data = [token.encode('utf-8') for token in new]
+        offsets = np.cumsum([len(item) for item in data]) + len(self._buffer)
+        self._buffer += b''.join(data)
+        self._offsets.extend(offsets.tolist())
+        self._hashes.extend(_hash(item) for item in data)
+        size = len(self._table)
+        while 2 * len(self) > size:
+            size *= 2
+        self._build_table(size)
+
+    def add(self, token):
+        """Adds `token` if it is new.
+
+        Returns:
+            The id of `token`.
+        """
+        data = token.encode('utf-8')
+        hash_value = _hash(data)
+        slot = self._find(data, hash_value)
+        if self._table[slot]:
+            return int(self._table[slot])
+        self._make_writable()
+        self._buffer += data
+        self._offsets.append(len(self._buffer))
+        self._hashes.append(hash_value)
+        token_id = len(self._hashes)
+        if 2 * token_id > len(self._table):
+            self._build_table(2 * len(self._table))
+        else:
+            self._table[slot] = token_id
+        return token_id
+
+    def __setitem__(self, token, token_id):
+        if token_id != len(self) + 1 or token in self:
+            raise ValueError("Vocabulary ids are fixed; %r can only be added with id %d."
+                             % (token, len(self) + 1))
+        self.add(token)
+
+    def __getitem__(self, token):
+        if not isinstance(token, str):
+            raise KeyError(token)
+        data = token.encode('utf-8')
+        token_id = int(self._table[self._find(data, _hash(data))])
+        if not token_id:
+            raise KeyError(token)
+        return token_id
+
+    def __contains__(self, token):
+        return self.get(token) is not None
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def __iter__(self):
+        """Iterates over the types in id order."""
+        return (self.token(token_id) for token_id in range(1, len(self) + 1))
+
+    def values(self):
+        return range(1, len(self) + 1)
+
+    def items(self):
+        return zip(self, self.values())
+
+    def token(self, token_id):
+        """Returns the type with id `token_id` (starting with 1)."""
+        if not 0 < token_id <= len(self):
+            raise KeyError(token_id)
+        return self._bytes(token_id).decode('utf-8')
+
+    @property
+    def inverse(self):
+        """Mapping of id : type pairs, like `{v: k for k, v in id_types.items()}`."""
+        return _Inverse(self, 1)
+
+    def id2word(self):
+        """Mapping of gensim term id : type pairs, e.g. for `LdaModel`.
+
+        Gensim term ids start with 0, i.e. they are the columns of the
+        document-term matrix (token_id - 1).
+        """
+        return _Inverse(self, 0)
+
+    def save(self, path):
+        """Saves the vocabulary as NumPy arrays in the folder `path`."""
+        os.makedirs(path, exist_ok=True)
+        arrays = dict(buffer=np.frombuffer(bytes(self._buffer), dtype=np.uint8),
+                      offsets=np.asarray(self._offsets, dtype=np.int64),
+                      hashes=np.asarray(self._hashes, dtype=np.int64),
+                      table=self._table)
+        for name in _ARRAYS:
+            np.save(os.path.join(path, name + '.npy'), arrays[name])
+        log.debug("Vocabulary of %s types saved to %s.", len(self), path)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Loads a vocabulary saved by `save()`.
+
+        Args:
+            path (str): Folder written by `save()`.
+            mmap_mode (str): Passed on to `numpy.load()`. With the default
+                'r', the arrays are memory-mapped read-only; adding a type
+                copies them into memory first.
+        """
+        vocabulary = cls.__new__(cls)
+        arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+                  for name in _ARRAYS}
+        vocabulary._buffer = arrays['buffer']
+        vocabulary._offsets = arrays['offsets']
+        vocabulary._hashes = arrays['hashes']
+        vocabulary._table = arrays['table']
+        if mmap_mode is None:
+            vocabulary._make_writable()
+        return vocabulary
+
+    def __repr__(self):
+        return "<Vocabulary of %d types>" % len(self)
+
+
+class _Inverse(Mapping):
+    """Read-only id : type view of a Vocabulary, ids starting with `start`."""
+
+    def __init__(self, vocabulary, start):
+        self._vocabulary = vocabulary
+        self._start = start
+
+    def __getitem__(self, token_id):
+        try:
+            return self._vocabulary.token(token_id - self._start + 1)
+        except TypeError:
+            raise KeyError(token_id)
+
+    def __len__(self):
+        return len(self._vocabulary)
+
+    def __iter__(self):
+        return iter(range(self._start, self._start + len(self._vocabulary)))
+
+    def keys(self):
+        return range(self._start, self._start + len(self._vocabulary))
@@ -18,14 +18,14 @@ matplotlib.use('Agg')
 from dariah_topics import preprocessing
 from dariah_topics import visualization
 from dariah_topics import mallet
+from dariah_topics.vocabulary import Vocabulary
 from flask import Flask, request, render_template, send_file
 from gensim.models import LdaModel
-from gensim.corpora import MmCorpus
-from lxml import etree
 import matplotlib.pyplot as plt
 import os
 import pandas as pd
 import shutil
+import tempfile
 import threading
 import webbrowser
 import matplotlib.pyplot as plt
@@ -52,58 +52,53 @@ def upload_file():
     num_iterations = int(request.form['number_iterations'])
     threshold = int(request.form['mfws'])
     
-    if 'gensim' in lda:
-        corpus = pd.Series()
+    corpus = pd.Series(dtype=object)
 
     print("Accessing and tokenizing files ...")
     for file in files:
         filename, extension = os.path.splitext(secure_filename(file.filename))
-        
-        if 'mallet' in lda:
-            os.makedirs('./tmp_files', exist_ok=True)
-            if extension == '.txt':
-                file.save('./tmp_files/' + secure_filename(file.filename))
-            elif extension == '.xml':
-                ns = dict(tei="http://www.tei-c.org/ns/1.0")
-                text = etree.parse(file)
-                text = text.xpath('//tei:text', namespaces=ns)[0]
-                text = "".join(text.xpath('.//text()'))
-                with open('./tmp_files/' + secure_filename(file.filename), 'w+', encoding='utf-8') as f:
-                    f.writelines(text)
-            
-        
-        elif 'gensim' in lda:
-            if extension == '.txt':
-                text = file.read().decode('utf-8')
-            elif extension == '.xml':
-                ns = dict(tei="http://www.tei-c.org/ns/1.0")
-                text = etree.parse(file)
-                text = text.xpath('//tei:text', namespaces=ns)[0]
-                text = "".join(text.xpath('.//text()'))
-            else:
-                print("Error: File format is not supported.")
-            tokens = list(preprocessing.tokenize(text))
-            label = filename
-            corpus[label] = tokens
+        if extension == '.txt':
+            text = file.read().decode('utf-8')
+        elif extension == '.xml':
+            text = preprocessing.read_tei(file.stream)
+        else:
+            print("Error: File format is not supported.")
+            continue
+        tokens = list(preprocessing.tokenize(text))
+        label = filename
+        corpus[label] = tokens
         file.flush()
 
     if 'mallet' in lda:
-        print("Creating MALLET binary ...")
+        labels = corpus.index.tolist()
+        tokens = corpus.tolist()
+        id_types, doc_ids = preprocessing.create_dictionaries(labels, tokens)
+        id_types = Vocabulary.from_dictionary(id_types)
+        sparse_bow = preprocessing.create_mm(labels, tokens, id_types, doc_ids)
+
+        # same features as in the gensim branch
         if request.files.get('stoplist', None):
-            os.makedirs('./stopwordlist', exist_ok=True)
+            print("Accessing external stopword list and cleaning corpus ...")
             stopwords = request.files['stoplist']
-            stopwords.save('./stopwordlist/' + secure_filename(stopwords.filename))
-            try:
-                mallet.create_mallet_model("./mallet_output", "./tmp_files", 'mallet', stoplist='./stopwordlist/' + secure_filename(stopwords.filename))
-            except:
-                mallet.create_mallet_model("./mallet_output", "./tmp_files", './mallet/bin/mallet', stoplist='./stopwordlist/' + secure_filename(stopwords.filename))
-            shutil.rmtree('./stopwordlist')
+            words = stopwords.read().decode('utf-8')
+            words = set(preprocessing.tokenize(words))
+            hapax = preprocessing.find_hapax(sparse_bow, id_types)
+            feature_list = words.union(hapax)
+            stopwords.flush()
         else:
-            try:
-                mallet.create_mallet_model("./mallet_output", "./tmp_files", 'mallet')
-            except:
-                mallet.create_mallet_model("./mallet_output", "./tmp_files", './mallet/bin/mallet')
-            
+            print("Accessing", threshold, "most frequent words and cleaning corpus ...")
+            stopwords = preprocessing.find_stopwords(sparse_bow, id_types, threshold)
+            hapax = preprocessing.find_hapax(sparse_bow, id_types)
+            feature_list = set(stopwords).union(hapax)
+
+        print("Creating MALLET binary ...")
+        labeled_docs = [(label, [token for token in doc if token not in feature_list])
+                        for label, doc in zip(labels, tokens)]
+        try:
+            mallet.create_mallet_model_from_tokens("./mallet_output", labeled_docs, 'mallet')
+        except:
+            mallet.create_mallet_model_from_tokens("./mallet_output", labeled_docs, './mallet/bin/mallet')
+
         print("Training MALLET LDA model ...")
         try:
             mallet.create_mallet_output('./mallet_output/malletModel.mallet', './mallet_output', 'mallet', num_topics=str(num_topics), num_iterations=str(num_iterations))
@@ -123,7 +118,6 @@ def upload_file():
             plt.axis("off")
             plt.savefig('./static/cloud.png')
             plt.close()
-        shutil.rmtree('./tmp_files')
         shutil.rmtree('./mallet_output')
         print("Rendering result.hml ...")
         return render_template('result.html', tables=[df.to_html(classes='df')])
@@ -133,6 +127,7 @@ def upload_file():
         tokens = corpus.tolist()
         print("Creating bag-of-words model ...")
         id_types, doc_ids = preprocessing.create_dictionaries(labels, tokens)
+        id_types = Vocabulary.from_dictionary(id_types)
         sparse_bow = preprocessing.create_mm(labels, tokens, id_types, doc_ids)
 
         if request.files.get('stoplist', None):
@@ -151,12 +146,13 @@ def upload_file():
             feature_list = set(stopwords).union(hapax)
             sparse_bow = preprocessing.remove_features(sparse_bow, id_types, feature_list)
     
-        print("Creating matrix market model ...")
-        preprocessing.save_bow_mm(sparse_bow, 'matrixmarket')
+        print("Creating binary bag-of-words model ...")
+        bow_output = tempfile.mkdtemp()
+        preprocessing.save_bow_npy(sparse_bow, bow_output)
 
-        mm = MmCorpus('matrixmarket.mm')
+        mm = preprocessing.MmapCorpus(bow_output)
         doc2id = {value : key for key, value in doc_ids.items()}
-        type2id = {value : key for key, value in id_types.items()}
+        type2id = id_types.id2word()
 
         
         print("Training Gensim LDA with", num_topics, "topics ...")
@@ -167,6 +163,8 @@ def upload_file():
         heatmap = visualization.doc_topic_heatmap(doc_topic)
         heatmap.savefig('./static/heatmap.png')
         heatmap.close()
+        del mm
+        shutil.rmtree(bow_output)
 
         wordcloud = WordCloud(width=800, height=600, background_color='white').fit_words(model.show_topic(1,100))
         plt.imshow(wordcloud)
@@ -0,0 +1,85 @@
+from dariah_topics import cache
+from dariah_topics import preprocessing as pre
+from nose.tools import eq_
+import os
+import tempfile
+
+
+def _write(path, text, mtime=None):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_memoize():
+    calls = []
+    def square(x):
+        calls.append(x)
+        return x * x
+    with tempfile.TemporaryDirectory() as tmp:
+        store = cache.PipelineCache(tmp)
+        eq_(store.memoize('square', cache.digest('square', 3), square, 3), 9)
+        eq_(cache.PipelineCache(tmp).memoize('square', cache.digest('square', 3), square, 3), 9)
+        eq_(calls, [3])
+        eq_((store.hits, store.misses), (0, 1))
+
+
+def test_eviction():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = cache.PipelineCache(tmp)
+        for n in range(5):
+            store.put(str(n), 'x' * 1000)
+            os.utime(store._entry(str(n)), (n, n))
+        store.max_size = 3500
+        store.get('0')
+        store.put('5', 'x' * 1000)
+        assert store.size <= 3500
+        eq_(len(store), 3)
+        eq_(['0' in store, '1' in store, '4' in store, '5' in store], [True, False, True, True])
+        store.clear()
+        eq_(len(store), 0)
+
+
+def test_corrupt_entry():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = cache.PipelineCache(tmp)
+        _write(store._entry('broken'), '')
+        eq_(store.get('broken', 'default'), 'default')
+        assert 'broken' not in store
+
+
+def test_preprocess():
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = os.path.join(tmp, 'corpus')
+        os.makedirs(corpus)
+        doclist = [os.path.join(corpus, name) for name in ('a.txt', 'b.txt')]
+        _write(doclist[0], "Der Kaffee ist kalt. Der Tee ist heiß.", 1000)
+        _write(doclist[1], "Der Kaffee ist heiß und der Tee ist kalt.", 1000)
+        store = cache.PipelineCache(os.path.join(tmp, 'cache'))
+
+        sparse_bow, id_types, doc_ids = cache.preprocess(doclist, store, mfw=1, workers=1)
+        tokens = [list(pre.tokenize(text)) for text in pre.read_from_txt(doclist)]
+        expected = pre.sparse_bow_to_mm(pre.create_sparse_bow(['a', 'b'], tokens)[0])
+        features = set(pre.find_stopwords(expected, id_types, 1)) | \
+                   set(pre.find_hapax(expected, id_types))
+        expected = pre.remove_features(expected, id_types, features)
+        assert sparse_bow.equals(expected)
+        eq_(store.misses, 6)
+
+        store.hits = store.misses = 0
+        again = cache.preprocess(doclist, store, mfw=1, workers=1)
+        assert again[0].equals(sparse_bow)
+        eq_((store.hits, store.misses), (6, 0))
+
+        # changing one file re-tokenizes only that file
+        store.hits = store.misses = 0
+        _write(doclist[1], "Der Kaffee ist heiß.", 2000)
+        sparse_bow, id_types, doc_ids = cache.preprocess(doclist, store, mfw=1, workers=1)
+        eq_((store.hits, store.misses), (1, 5))
+        assert 'und' not in id_types
+
+        # other parameters are separate entries
+        store.hits = store.misses = 0
+        cache.preprocess(doclist, store, mfw=1, workers=1, lower=False)
+        eq_(store.hits, 0)
@@ -0,0 +1,80 @@
+from dariah_topics.corpusstore import CorpusStore
+from dariah_topics.doclist import PathDocList
+from dariah_topics import preprocessing as pre
+from nose.tools import eq_
+import os
+import tempfile
+
+
+def _write(path, text, mtime):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.utime(path, (mtime, mtime))
+
+
+def test_incremental_updates():
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = os.path.join(tmp, 'corpus')
+        os.makedirs(corpus)
+        _write(os.path.join(corpus, 'a.txt'), "Kaffee und Tee", 1000)
+        _write(os.path.join(corpus, 'b.txt'), "Tee und Kuchen", 1000)
+        store = CorpusStore(os.path.join(tmp, 'store'))
+        update = store.update(PathDocList(corpus, '*.txt'), workers=1)
+        eq_(sorted(update.added), [1, 2])
+        first_types = dict(store.id_types)
+        a_id = store.doc_ids['a']
+        store.save()
+
+        # nothing changed: nothing is counted
+        store = CorpusStore(os.path.join(tmp, 'store'))
+        eq_(store.update(PathDocList(corpus, '*.txt'), workers=1), ([], [], []))
+
+        _write(os.path.join(corpus, 'c.txt'), "Kaffee mit Milch", 2000)
+        _write(os.path.join(corpus, 'a.txt'), "Kaffee Kaffee", 2000)
+        os.remove(os.path.join(corpus, 'b.txt'))
+        update = store.update(PathDocList(corpus, '*.txt'), workers=1)
+        eq_(update.changed, [a_id])
+        eq_(update.added, [3])
+        eq_(update.deleted, [3 - a_id])
+        eq_({token: store.id_types[token] for token in first_types}, first_types)
+        eq_(store.doc_ids, {'a': a_id, 'c': 3})
+
+        matrix = store.matrix()
+        eq_(matrix.shape, (3, len(store.id_types)))
+        eq_(matrix[3 - a_id - 1].nnz, 0)
+        eq_(matrix[a_id - 1, store.id_types['kaffee'] - 1], 2)
+        eq_(matrix[a_id - 1].sum(), 2)
+        eq_(matrix[2, store.id_types['milch'] - 1], 1)
+        store.save()
+
+        reopened = CorpusStore(os.path.join(tmp, 'store'))
+        eq_((reopened.matrix() != matrix).nnz, 0)
+        eq_(reopened.doc_ids, store.doc_ids)
+        eq_(sorted(set(reopened.sparse_bow().index.get_level_values('doc_id'))), [a_id, 3])
+
+        # a re-added file gets a new id
+        _write(os.path.join(corpus, 'b.txt'), "Tee", 3000)
+        eq_(reopened.add([os.path.join(corpus, 'b.txt')], workers=1).added, [4])
+
+
+def test_same_counts_as_create_sparse_bow():
+    with tempfile.TemporaryDirectory() as tmp:
+        doclist = pre.create_document_list(os.path.join(os.path.dirname(__file__), '..',
+                                                        'corpus_txt'))[:3]
+        store = CorpusStore(os.path.join(tmp, 'store'))
+        store.add(doclist, workers=1)
+        tokens = [list(pre.tokenize(text)) for text in pre.read_from_txt(doclist)]
+        matrix, id_types, doc_ids = pre.create_sparse_bow(pre.get_labels(doclist), tokens)
+        eq_(store.id_types, id_types)
+        eq_((store.matrix() != matrix).nnz, 0)
+
+
+def test_tokenizer_mismatch():
+    with tempfile.TemporaryDirectory() as tmp:
+        CorpusStore(tmp, lower=False).save()
+        eq_(CorpusStore(tmp).tokenizer, {'lower': False})
+        try:
+            CorpusStore(tmp, lower=True)
+            assert False, "ValueError expected"
+        except ValueError:
+            pass
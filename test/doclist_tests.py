@@ -1,6 +1,10 @@
-from dariah_topics.doclist import PathDocList
+from dariah_topics.doclist import ManifestDocList, PathDocList, SegmentIndex
+from itertools import chain
 from pathlib import Path
 from nose.tools import eq_
+import pickle
+import shutil
+import tempfile
 
 project_path = Path(__file__).absolute().parent.parent
 
@@ -74,3 +78,97 @@ def test_with_segments():
     eq_(list(segmented),
         ['test/file1.0.txt', 'test/file1.1.txt', 'test/file2.0.txt',
          'test/file3.0.txt', 'test/file3.1.txt', 'test/file3.2.txt'])
+
+
+def test_segment_index():
+    """segments read from the index equal the segmenter's output"""
+    from dariah_topics import preprocessing as pre
+    folder = tempfile.mkdtemp()
+    try:
+        for name in ['Doyle_AScandalinBohemia.txt', 'Kipling_TheEndofthePassage.txt']:
+            shutil.copy(str(project_path.joinpath('corpus_txt', name)), folder)
+        Path(folder, 'empty.txt').write_text('\n\n', encoding='utf-8')
+        index_file = str(Path(folder, 'segments.tsv'))
+        corpus = PathDocList(folder, '*.txt')
+        index = corpus.segment_index(index_file, segment_size=500, tolerance=0.1)
+        expected = list(pre.segmenter((pre.stream_tokens(path, paragraphs=True)
+                                       for path in corpus), 500, 0.1))
+        eq_(list(index), expected)
+        eq_(corpus.segment_counts(), index.segment_counts())
+        eq_(index.read_segment(1, 2), expected[corpus.segment_counts()[0] + 2])
+        for document, segment_no in [(0, index.segment_counts()[0]), (1, -1), (3, 0)]:
+            try:
+                index.read_segment(document, segment_no)
+                assert False, "IndexError expected"
+            except IndexError:
+                pass
+        eq_(len(list(corpus.segments())), len(expected))
+
+        reloaded = PathDocList(folder, '*.txt').segment_index(index_file, 500, 0.1)
+        eq_(reloaded.offsets.tolist(), index.offsets.tolist())
+        eq_(len(SegmentIndex.load(index_file, corpus)), len(expected))
+
+        # changed files and parameters are re-segmented
+        with open(str(Path(folder, 'empty.txt')), 'a', encoding='utf-8') as f:
+            f.write('one more line\n')
+        index = corpus.segment_index(index_file, segment_size=500, tolerance=0.1)
+        position = [path.name for path in corpus.get_docs()].index('empty.txt')
+        eq_(index.segment_counts()[position], 1)
+        index = corpus.segment_index(index_file, segment_size=300)
+        eq_(list(index), list(pre.segmenter(map(pre.stream_tokens, corpus), 300)))
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_getitem():
+    """indexing a PathDocList returns full paths"""
+    eq_(docs[1], 'test/file2.txt')
+    eq_(docs[1:], ['test/file2.txt', 'test/subdir/file3.txt'])
+
+
+def test_manifest_doclist():
+    folder = tempfile.mkdtemp()
+    try:
+        for name in ['a.txt', 'b.txt', 'sub/c.txt', 'sub/deeper/d.txt', 'e.csv', '.hidden.txt']:
+            Path(folder, 'corpus', name).parent.mkdir(parents=True, exist_ok=True)
+            Path(folder, 'corpus', name).write_text(name, encoding='utf-8')
+        basepath = str(Path(folder, 'corpus'))
+        manifest = str(Path(folder, 'manifest'))
+        built = ManifestDocList.build(basepath, manifest, workers=2)
+        docs = ManifestDocList(manifest)
+        eq_(list(docs), [str(Path(basepath, name)) for name in
+                         ['a.txt', 'b.txt', 'sub/c.txt', 'sub/deeper/d.txt']])
+        eq_(list(docs), list(built))
+        eq_(list(docs.labels()), ['a', 'b', 'c', 'd'])
+        eq_(docs.labels(), [docs.label(doc) for doc in docs.get_docs()])
+        eq_(docs.sizes().tolist(), [5, 5, 9, 16])
+        eq_(docs[2], str(Path(basepath, 'sub/c.txt')))
+        eq_(docs[-1:], [str(Path(basepath, 'sub/deeper/d.txt'))])
+        eq_(len(ManifestDocList.build(basepath, manifest, recursive=False)), 2)
+
+        # symlinked folders are followed, loops are listed once
+        other = Path(folder, 'other')
+        other.mkdir()
+        Path(other, 'f.txt').write_text('f', encoding='utf-8')
+        Path(basepath, 'linked').symlink_to(other, target_is_directory=True)
+        Path(basepath, 'sub', 'loop').symlink_to(basepath, target_is_directory=True)
+        docs = ManifestDocList.build(basepath, manifest)
+        eq_(list(docs.labels()), ['a', 'b', 'f', 'c', 'd'])
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_manifest_shards():
+    folder = tempfile.mkdtemp()
+    try:
+        docs = ManifestDocList.build(str(project_path.joinpath('corpus_txt')), folder)
+        eq_(len(docs), 17)
+        shards = [docs.shard(i, 3) for i in range(3)]
+        eq_([len(shard) for shard in shards], [5, 6, 6])
+        eq_(list(chain.from_iterable(shards)), list(docs))
+        eq_(list(shards[1].labels()), docs.labels()[5:11])
+        unpickled = pickle.loads(pickle.dumps(shards[2]))
+        eq_(list(unpickled), list(shards[2]))
+        eq_(list(docs.shard(1, 2).shard(0, 2)), list(docs)[8:12])
+    finally:
+        shutil.rmtree(folder)
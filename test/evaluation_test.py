@@ -0,0 +1,107 @@
+from dariah_topics import evaluation
+from dariah_topics import preprocessing as pre
+from nose.tools import eq_
+from pathlib import Path
+import itertools
+import os
+import tempfile
+
+project_path = Path(__file__).absolute().parent.parent
+
+corpus = [['apple', 'banana', 'cherry'],
+          ['apple', 'banana'],
+          ['banana', 'date'],
+          []]
+segmented_topics = [list(itertools.combinations(['apple', 'banana', 'date'], 2))]
+
+
+def test_inverted_index_postings():
+    index = evaluation.token_probability(corpus, segmented_topics)
+    eq_(len(index), 4)
+    eq_(index['banana'], {0, 1, 2})
+    eq_(index['cherry'], set())
+    eq_(index.posting('apple').tolist(), [0, 1])
+
+
+def test_pair_counts():
+    index = evaluation.InvertedIndex.from_documents(corpus)
+    df1, df2, both = index.pair_counts(['apple', 'apple', 'date'],
+                                       ['banana', 'date', 'missing'])
+    eq_(df1.tolist(), [2, 2, 1])
+    eq_(df2.tolist(), [3, 1, 0])
+    eq_(both.tolist(), [2, 0, 0])
+
+
+def test_index_from_sparse_bow():
+    matrix, id_types, doc_ids = pre.create_sparse_bow(range(len(corpus)), corpus)
+    index = evaluation.InvertedIndex.from_sparse_bow(matrix, id_types)
+    expected = evaluation.InvertedIndex.from_documents(corpus)
+    for token in ['apple', 'banana', 'cherry', 'date']:
+        eq_(index[token], expected[token])
+
+
+def test_umass_matches_set_intersection():
+    index = evaluation.token_probability(corpus, segmented_topics)
+    umass = evaluation.calculate_umass(segmented_topics, index, corpus,
+                                       num_topics=1, top_words=3)
+    # (apple, banana): log((2/4 + 0.1) / (3/4)), (apple, date): log(0.1 / (1/4)),
+    # (banana, date): log((1/4 + 0.1) / (1/4)); normalized by 2/(3*2)
+    eq_(round(umass, 6), -0.267654)
+
+
+def test_pmi_continues_after_zero_division():
+    topics = [[('apple', 'cherry'), ('missing', 'banana'), ('apple', 'banana')]]
+    index = evaluation.token_probability(corpus, topics)
+    pmi = evaluation.calculate_pointwise_mutual_information(topics, corpus, index)
+    eq_(len(pmi), 3)
+    eq_(pmi[1], 0)
+
+
+def test_topic_coherence_matches_pairwise():
+    matrix, id_types, doc_ids = pre.create_sparse_bow(range(len(corpus)), corpus)
+    words = ['apple', 'banana', 'date']
+    topic_terms = [[id_types[word] - 1 for word in words]]
+    per_topic, overall = evaluation.topic_coherence(matrix, topic_terms)
+    index = evaluation.token_probability(corpus, segmented_topics)
+    pmi = evaluation.calculate_pointwise_mutual_information(segmented_topics, corpus, index)
+    npmi = evaluation.calculate_pointwise_mutual_information(segmented_topics, corpus, index,
+                                                             normalize=True)
+    eq_(round(per_topic['uci'][0], 6), round(sum(pmi) / 3, 6))
+    eq_(round(per_topic['npmi'][0], 6), round(sum(npmi) / 3, 6))
+    eq_(round(per_topic['umass'][0], 6), -0.267654)
+    eq_(overall['uci'], per_topic['uci'][0])
+
+
+def test_topic_coherence_ignores_undefined_pairs():
+    matrix, id_types, doc_ids = pre.create_sparse_bow(range(len(corpus)), corpus)
+    matrix.resize((matrix.shape[0], matrix.shape[1] + 1))
+    unseen = matrix.shape[1] - 1
+    per_topic, overall = evaluation.topic_coherence(
+        matrix, [[id_types['apple'] - 1, id_types['banana'] - 1, unseen],
+                 [unseen, unseen, unseen]])
+    expected, _ = evaluation.topic_coherence(
+        matrix, [[id_types['apple'] - 1, id_types['banana'] - 1]])
+    eq_(per_topic['uci'][0], expected['uci'][0])
+    assert per_topic['uci'][1] != per_topic['uci'][1]  # NaN
+    eq_(overall['uci'], expected['uci'][0])
+
+
+def test_reference_corpus_roundtrip():
+    doclist = pre.create_document_list(str(project_path.joinpath('corpus_txt')))[:3]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'reference')
+        built = evaluation.reference_corpus(doclist, path, workers=1)
+        written = os.stat(os.path.join(path, 'tokens.txt')).st_mtime_ns
+        loaded = evaluation.reference_corpus(list(reversed(doclist)), path)
+        eq_(os.stat(os.path.join(path, 'tokens.txt')).st_mtime_ns, written)
+        eq_(len(loaded), 3)
+        eq_(loaded.columns, built.columns)
+        topics = [[('the', 'and'), ('holmes', 'watson')]]
+        eq_(evaluation.calculate_pointwise_mutual_information(topics, loaded, loaded),
+            evaluation.calculate_pointwise_mutual_information(topics, built, built))
+        # other documents or tokenizer options rebuild the index
+        lowered = evaluation.reference_corpus(doclist[:2], path, workers=1)
+        eq_(len(lowered), 2)
+        rebuilt = evaluation.reference_corpus(doclist[:2], path, workers=1, lower=False)
+        assert any(token != token.lower() for token in rebuilt.columns)
+        assert all(token == token.lower() for token in lowered.columns)
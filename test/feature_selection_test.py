@@ -0,0 +1,47 @@
+from dariah_topics import feature_selection as fs
+from dariah_topics import preprocessing as pre
+from nose.tools import eq_
+import numpy as np
+
+doc_tokens = [['a', 'a', 'a', 'b', 'c', 'd'],
+              ['a', 'a', 'b', 'b', 'e'],
+              ['a', 'b', 'c', 'f', 'f']]
+matrix, id_types, doc_ids = pre.create_sparse_bow(['x', 'y', 'z'], doc_tokens)
+
+
+def test_feature_frequencies():
+    frequencies = fs.feature_frequencies(matrix)
+    eq_(frequencies.corpus_frequency.tolist(), [6, 4, 2, 1, 1, 2])
+    eq_(frequencies.document_frequency.tolist(), [3, 3, 2, 1, 1, 1])
+    eq_(frequencies.num_docs, 3)
+    from_dataframe = fs.feature_frequencies(pre.sparse_bow_to_mm(matrix))
+    eq_(from_dataframe.corpus_frequency.tolist(), frequencies.corpus_frequency.tolist())
+    eq_(from_dataframe.document_frequency.tolist(), frequencies.document_frequency.tolist())
+
+
+def test_select_features():
+    eq_(fs.mask_to_types(~fs.select_features(matrix, mfw=1, hapax=True), id_types),
+        ['a', 'd', 'e'])
+    eq_(fs.mask_to_types(fs.select_features(matrix, min_df=2, max_df=0.9), id_types), ['c'])
+    eq_(fs.mask_to_types(fs.select_features(matrix, top_k=3), id_types), ['a', 'b', 'c'])
+    eq_(fs.select_features(matrix, num_types=8).tolist()[6:], [False, False])
+
+
+def test_same_as_find_functions():
+    sparse_bow = pre.sparse_bow_to_mm(matrix)
+    eq_(pre.find_stopwords(sparse_bow, id_types, 2), ['a', 'b'])
+    eq_(pre.find_hapax(sparse_bow, id_types), ['d', 'e'])
+    eq_(pre.find_hapax(matrix, id_types), ['d', 'e'])
+    removed = fs.mask_to_types(~fs.select_features(sparse_bow, mfw=2, hapax=True), id_types)
+    eq_(set(removed), set(pre.find_stopwords(sparse_bow, id_types, 2) +
+                          pre.find_hapax(sparse_bow, id_types)))
+
+
+def test_apply_feature_mask():
+    keep = fs.select_features(matrix, mfw=1, hapax=True)
+    reduced, vocabulary = fs.apply_feature_mask(matrix, keep, id_types)
+    eq_(dict(vocabulary), {'b': 1, 'c': 2, 'f': 3})
+    eq_(reduced.toarray().tolist(), [[1, 1, 0], [2, 0, 0], [1, 1, 2]])
+    dataframe = pre.remove_features(pre.sparse_bow_to_mm(matrix), id_types,
+                                    fs.mask_to_types(~keep, id_types))
+    assert np.array_equal(pre.mm_to_sparse_bow(dataframe).toarray()[:, keep], reduced.toarray())
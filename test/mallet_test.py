@@ -0,0 +1,282 @@
+from dariah_topics import mallet
+from nose.tools import eq_
+from pathlib import Path
+import gzip
+import json
+import numpy as np
+import os
+import pandas as pd
+import tempfile
+import time
+
+project_path = Path(__file__).absolute().parent.parent
+mallet_output = str(project_path.joinpath('tutorial_supplementals', 'mallet_output'))
+
+
+def test_read_doc_topics_dense():
+    data, docnames = mallet.read_doc_topics(os.path.join(mallet_output, 'doc_topics.txt'))
+    eq_(data.shape, (17, 10))
+    assert np.allclose(data.sum(axis=1), 1)
+    assert docnames[0].endswith('Doyle_AScandalinBohemia.txt')
+
+
+def test_read_doc_topics_sparse():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'doc_topics.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('#doc name topic proportion ...\n'
+                    '0\tb.txt\t2\t0.75\t0\t0.25\n'
+                    '1\ta.txt\t1\t1.0\n')
+        data, docnames = mallet.read_doc_topics(path)
+    eq_(docnames, ['a.txt', 'b.txt'])
+    eq_(data.tolist(), [[0, 1.0, 0], [0.25, 0, 0.75]])
+
+
+def test_show_doc_topic_matrix():
+    doc_topic = mallet.show_docTopicMatrix(mallet_output)
+    eq_(doc_topic.shape, (10, 17))
+    eq_(list(doc_topic.index)[0], 'conan knew black')
+    eq_(list(doc_topic.columns)[0], 'Doyle_AScandalinBohemia.txt')
+
+
+fake_mallet = str(project_path.joinpath('test', 'fake_mallet'))
+corpus_txt = str(project_path.joinpath('corpus_txt'))
+
+
+def _import(tmp):
+    return mallet.create_mallet_model(tmp, corpus_txt, path_to_mallet=fake_mallet)
+
+
+def test_mallet_job_progress():
+    with tempfile.TemporaryDirectory() as tmp:
+        model = _import(tmp)
+        events = []
+        param = mallet.TrainTopicsConfig(num_topics=5, num_iterations=30,
+                                          random_seed=1).param(model, tmp, fake_mallet)
+        job = mallet.MalletJob(param, progress=events.append).run()
+        eq_(job.returncode, 0)
+        eq_([event.iteration for event in events], [10, 20, 30])
+        eq_(job.events, events)
+        data, docnames = mallet.read_doc_topics(os.path.join(tmp, 'doc_topics.txt'))
+        eq_(data.shape, (len(os.listdir(corpus_txt)), 5))
+
+
+def test_mallet_job_failure():
+    with tempfile.TemporaryDirectory() as tmp:
+        model = _import(tmp)
+        param = mallet.TrainTopicsConfig(num_iterations=10).param(model, tmp, fake_mallet)
+        os.environ['FAKE_MALLET_FAIL'] = '1'
+        try:
+            mallet.MalletJob(param).run()
+            assert False, "CalledProcessError expected"
+        except mallet.CalledProcessError as err:
+            assert 'OutOfMemoryError' in err.output
+        finally:
+            del os.environ['FAKE_MALLET_FAIL']
+
+
+def test_create_mallet_output_failure():
+    with tempfile.TemporaryDirectory() as tmp:
+        model = _import(tmp)
+        os.environ['FAKE_MALLET_FAIL'] = '1'
+        try:
+            mallet.create_mallet_output(model, tmp, fake_mallet, num_iterations=10)
+            assert False, "CalledProcessError expected"
+        except mallet.CalledProcessError as err:
+            assert 'OutOfMemoryError' in err.output
+        finally:
+            del os.environ['FAKE_MALLET_FAIL']
+
+
+def test_mallet_job_progress_error():
+    def progress(event):
+        raise RuntimeError("broken callback")
+    with tempfile.TemporaryDirectory() as tmp:
+        model = _import(tmp)
+        param = mallet.TrainTopicsConfig(num_iterations=1000).param(model, tmp, fake_mallet)
+        os.environ['FAKE_MALLET_DELAY'] = '0.5'
+        try:
+            job = mallet.MalletJob(param, progress=progress)
+            job.run()
+            assert False, "RuntimeError expected"
+        except RuntimeError:
+            assert job.cancelled
+            assert job._process.poll() is not None
+        finally:
+            del os.environ['FAKE_MALLET_DELAY']
+
+
+def test_mallet_job_timeout():
+    with tempfile.TemporaryDirectory() as tmp:
+        model = _import(tmp)
+        param = mallet.TrainTopicsConfig(num_iterations=1000).param(model, tmp, fake_mallet)
+        os.environ['FAKE_MALLET_DELAY'] = '0.5'
+        try:
+            job = mallet.MalletJob(param, timeout=1)
+            start = time.time()
+            job.run()
+            assert False, "MalletCancelled expected"
+        except mallet.MalletCancelled:
+            assert job.timed_out
+            assert time.time() - start < 10
+            assert not os.path.exists(os.path.join(tmp, 'doc_topics.txt'))
+        finally:
+            del os.environ['FAKE_MALLET_DELAY']
+
+
+def test_mallet_job_cancel_before_start():
+    job = mallet.MalletJob([fake_mallet, 'train-topics'])
+    job.cancel()
+    try:
+        job.run()
+        assert False, "MalletCancelled expected"
+    except mallet.MalletCancelled:
+        eq_(job.returncode, None)
+
+
+def test_run_mallet_trainings():
+    with tempfile.TemporaryDirectory() as tmp:
+        model = _import(tmp)
+        events = []
+        folders = mallet.run_mallet_trainings(model, tmp, num_topics=(3, 4), seeds=(1, 2),
+                                              path_to_mallet=fake_mallet, max_jobs=2,
+                                              num_iterations=20,
+                                              progress=lambda *event: events.append(event))
+        eq_(sorted(folders), [(3, 1), (3, 2), (4, 1), (4, 2)])
+        eq_(len(events), 8)
+        for (num_topics, seed), folder in folders.items():
+            data, docnames = mallet.read_doc_topics(os.path.join(folder, 'doc_topics.txt'))
+            eq_(data.shape[1], num_topics)
+
+
+def test_train_topics_config_param():
+    config = mallet.TrainTopicsConfig(num_topics=20, num_threads=4, optimize_interval=10,
+                                      random_seed=42, alpha=50, beta=0.1,
+                                      topic_word_weights=True, state=False)
+    param = config.param('model.mallet', 'out', 'mallet')
+    eq_(param[:12], ['mallet', 'train-topics', '--input', 'model.mallet',
+                     '--num-topics', '20', '--num-iterations', '20',
+                     '--num-top-words', '10', '--num-threads', '4'])
+    for option, value in [('--optimize-interval', '10'), ('--random-seed', '42'),
+                          ('--alpha', '50.0'), ('--beta', '0.1'),
+                          ('--topic-word-weights-file', os.path.join('out', 'topic_word_weights.txt'))]:
+        eq_(param[param.index(option) + 1], value)
+    assert '--output-state' not in param
+    assert '--optimize-burn-in' not in param
+    eq_(config.replace(num_topics=30), mallet.TrainTopicsConfig(
+        num_topics=30, num_threads=4, optimize_interval=10, random_seed=42, alpha=50,
+        beta=0.1, topic_word_weights=True, state=False))
+
+
+def test_train_topics_config_validation():
+    for options, error in [({'num_topics': 0}, ValueError), ({'num_topics': '10'}, TypeError),
+                           ({'num_threads': 2.5}, TypeError), ({'random_seed': -1}, ValueError),
+                           ({'random_seed': 0}, ValueError),
+                           ({'alpha': 0}, ValueError), ({'beta': '0.1'}, TypeError)]:
+        try:
+            mallet.TrainTopicsConfig(**options)
+            assert False, "%s expected for %r" % (error.__name__, options)
+        except error:
+            pass
+    try:
+        mallet.TrainTopicsConfig().replace(num_passes=3)
+        assert False, "TypeError expected"
+    except TypeError:
+        pass
+
+
+def test_create_mallet_output_config():
+    with tempfile.TemporaryDirectory() as tmp:
+        model = _import(tmp)
+        files = mallet.create_mallet_output(model, tmp, fake_mallet, num_topics=4,
+                                            num_threads=2, random_seed=7,
+                                            word_topic_counts=True, topic_word_weights=True)
+        eq_(sorted(files), ['doc_topics', 'state', 'topic_keys', 'topic_word_weights',
+                            'word_topic_counts'])
+        assert all(os.path.exists(path) for path in files.values())
+        with open(files['doc_topics'], encoding='utf-8') as f:
+            first = f.read()
+        mallet.create_mallet_output(model, tmp, fake_mallet,
+                                    config=mallet.TrainTopicsConfig(num_topics=4, random_seed=7))
+        with open(files['doc_topics'], encoding='utf-8') as f:
+            eq_(f.read(), first)
+
+
+def _instances(path):
+    # fake_mallet stores instances as JSON
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['instances']
+
+
+def test_create_mallet_model_from_tokens():
+    labeled_docs = [('first doc', ['Ein', 'Text', 'über', 'Kaffee']),
+                    ('second,doc', ['noch', 'ein', 'text']),
+                    ('empty', [])]
+    with tempfile.TemporaryDirectory() as tmp:
+        piped = mallet.create_mallet_model_from_tokens(tmp, iter(labeled_docs), fake_mallet,
+                                                      outfile='piped.mallet')
+        bulk = mallet.create_mallet_model_from_tokens(tmp, labeled_docs, fake_mallet,
+                                                     outfile='bulk.mallet', pipe=False)
+        eq_(_instances(piped), [['first_doc', ['Ein', 'Text', 'über', 'Kaffee']],
+                                ['second_doc', ['noch', 'ein', 'text']],
+                                ['empty', []]])
+        eq_(_instances(bulk), _instances(piped))
+        with open(os.path.join(tmp, 'instances.txt'), encoding='utf-8') as f:
+            eq_(f.readline(), 'first_doc X Ein Text über Kaffee\n')
+
+
+def test_mallet_job_stdin_error():
+    def lines():
+        yield 'a X b\n'
+        raise RuntimeError("broken corpus")
+    with tempfile.TemporaryDirectory() as tmp:
+        param = [fake_mallet, 'import-file', '--input', '-',
+                 '--output', os.path.join(tmp, 'model.mallet')]
+        try:
+            mallet.MalletJob(param, stdin=lines()).run()
+            assert False, "RuntimeError expected"
+        except RuntimeError:
+            pass
+
+
+def test_read_state():
+    with tempfile.TemporaryDirectory() as tmp:
+        labeled_docs = [('a', ['x', 'y', 'x']), ('empty', []), ('b', ['y', 'z', 'z', 'z'])]
+        model = mallet.create_mallet_model_from_tokens(tmp, labeled_docs, fake_mallet)
+        files = mallet.create_mallet_output(model, tmp, fake_mallet, num_topics=3,
+                                            random_seed=3, topic_word_weights=True)
+        state = mallet.read_state(files['state'], chunksize=2)
+        eq_(state.doc_topics.shape, (3, 3))
+        eq_(state.doc_topics.sum(axis=1).A1.tolist(), [3, 0, 4])
+        eq_(state.docnames, ['a', None, 'b'])
+        eq_(state.types, ['x', 'y', 'z'])
+        eq_(state.beta, 0.01)
+        data, docnames = mallet.read_doc_topics(files['doc_topics'])
+        assert np.allclose(mallet.state_doc_topics(state), data)
+        weights = pd.read_csv(files['topic_word_weights'], sep='\t', header=None)
+        counts = state.topic_words.toarray()
+        for topic, word, weight in weights.itertuples(index=False):
+            assert np.isclose(counts[topic, state.types.index(word)] + state.beta, weight)
+        for topic, keys in enumerate(mallet.state_topic_keys(state, 2)):
+            eq_(keys, [state.types[i] for i in np.argsort(-counts[topic], kind='stable')
+                       if counts[topic, i]][:2])
+
+
+def test_read_state_out_of_order():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'state.gz')
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            f.write("#doc source pos typeindex type topic\n"
+                    "#alpha : 0.5 0.5 \n"
+                    "#beta : 0.01\n"
+                    "0 a 0 0 x 0\n"
+                    "2 c 0 2 z 1\n"
+                    "1 b 0 1 y 1\n"
+                    "1 b 1 2 z 0\n")
+        state = mallet.read_state(path, chunksize=2)
+        eq_(state.docnames, ['a', 'b', 'c'])
+        eq_(state.types, ['x', 'y', 'z'])
+        eq_(state.doc_topics.toarray().tolist(), [[1, 0], [1, 1], [0, 1]])
+        doc_topics = mallet.state_doc_topics(state, num_docs=4)
+        eq_(doc_topics.shape, (4, 2))
+        assert np.allclose(doc_topics[3], [0.5, 0.5])
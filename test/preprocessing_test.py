@@ -1,5 +1,8 @@
 from dariah_topics import preprocessing as pre
 from pathlib import Path
+import tempfile
+import os
+import numpy as np
 
 project_path = Path(__file__).absolute().parent.parent
 
@@ -19,3 +22,150 @@ def test_document_labels():
     doclist = test_document_list()
     labels = pre.get_labels(doclist)
     assert len(list(labels)) == len(doclist)
+
+def test_create_sparse_bow():
+    doc_tokens = [['a', 'b', 'a'], [], ['c', 'a']]
+    matrix, id_types, doc_ids = pre.create_sparse_bow(['x', 'y', 'z'], doc_tokens)
+    assert matrix.shape == (3, 3)
+    assert doc_ids == {'x': 1, 'y': 2, 'z': 3}
+    assert matrix[0, id_types['a'] - 1] == 2
+    assert matrix[2, id_types['c'] - 1] == 1
+    assert matrix.sum() == 5
+
+def test_sparse_bow_to_mm():
+    doc_tokens = [['a', 'b', 'a'], [], ['c', 'a']]
+    matrix, id_types, doc_ids = pre.create_sparse_bow(['x', 'y', 'z'], doc_tokens)
+    mm = pre.sparse_bow_to_mm(matrix)
+    assert list(mm.index.names) == ['doc_id', 'token_id']
+    assert mm.loc[(1, id_types['a']), 0] == 2
+    assert mm.loc[(2, 0), 0] == 0
+    assert pre.find_stopwords(mm, id_types, 1) == ['a']
+
+def _legacy_create_mm(doc_labels, doc_tokens, type_dictionary, doc_ids):
+    """create_mm() as it was before MultiIndex.from_arrays, with .at for set_value"""
+    from collections import Counter
+    import pandas as pd
+    largecounter = {doc_ids[doc]: Counter(type_dictionary[token] for token in tokens)
+                    for doc, tokens in zip(doc_labels, doc_tokens)}
+    tuples = []
+    for key in range(1, len(largecounter) + 1):
+        if len(largecounter[key]) == 0:
+            tuples.append((key, 0))
+        for value in largecounter[key]:
+            tuples.append((key, value))
+    sparse_index = pd.MultiIndex.from_tuples(tuples, names=["doc_id", "token_id"])
+    sparse_df_filled = pd.DataFrame(np.zeros((len(sparse_index), 1), dtype=int),
+                                    index=sparse_index)
+    for doc_id, token_id in tuples:
+        if token_id:
+            sparse_df_filled.at[(doc_id, token_id), 0] = largecounter[doc_id][token_id]
+    return sparse_df_filled
+
+def test_create_mm_regression():
+    import pandas as pd
+    doclist = test_document_list()
+    labels = list(pre.get_labels(doclist)) + ['empty']
+    doc_tokens = [list(pre.tokenize(text)) for text in pre.read_from_txt(doclist)] + [[]]
+    id_types, doc_ids = pre.create_dictionaries(labels, doc_tokens)
+    mm = pre.create_mm(labels, doc_tokens, id_types, doc_ids)
+    pd.testing.assert_frame_equal(mm, _legacy_create_mm(labels, doc_tokens, id_types, doc_ids))
+    assert mm.loc[(len(labels), 0), 0] == 0
+    assert mm[0].sum() == sum(len(tokens) for tokens in doc_tokens)
+
+def test_stream_bow_consumes_once():
+    doclist = test_document_list()
+    labeled_docs = zip(pre.get_labels(doclist),
+                       map(pre.tokenize, pre.read_from_txt(doclist)))
+    id_types = {}
+    totals = [counts.sum() for label, ids, counts in pre.stream_bow(labeled_docs, id_types)]
+    assert len(totals) == 17
+    assert next(labeled_docs, None) is None
+    assert sorted(id_types.values()) == list(range(1, len(id_types) + 1))
+
+def test_stream_bow_fixed_types():
+    result = list(pre.stream_bow([('x', ['a', 'b', 'a'])], {'a': 3}, fixed_types=True))
+    label, ids, counts = result[0]
+    assert list(ids) == [3] and list(counts) == [2]
+
+def test_tokenize_corpus_parallel():
+    doclist = test_document_list()[:4]
+    serial = list(pre.tokenize_corpus(doclist, workers=1))
+    parallel = list(pre.tokenize_corpus(doclist, workers=2, chunksize=1))
+    assert parallel == serial
+    assert serial[0] == list(pre.tokenize(next(pre.read_from_txt(doclist[0]))))
+
+def test_tokenizer_normalization():
+    tokenizer = pre.Tokenizer()
+    assert tokenizer.tokenize("Mr. Holmes—the detective―arrived") == \
+        ['mr', 'holmes', 'the', 'detective', 'arrived']
+    assert pre.get_tokenizer() is pre.get_tokenizer()
+    assert list(pre.tokenize("A b.c", simple=True, lower=False)) == ['A', 'bc']
+
+def test_save_bow_npy_mmap_corpus():
+    matrix, id_types, doc_ids = pre.create_sparse_bow(['x', 'y'], [['a', 'b', 'a'], ['b']])
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bow')
+        pre.save_bow_npy(pre.sparse_bow_to_mm(matrix), path)
+        loaded = pre.load_bow_npy(path)
+        assert (loaded != matrix).nnz == 0
+        corpus = pre.MmapCorpus(path)
+        assert len(corpus) == 2
+        assert list(corpus) == [[(id_types['a'] - 1, 2), (id_types['b'] - 1, 1)],
+                                [(id_types['b'] - 1, 1)]]
+
+def test_save_bow_mm():
+    matrix, id_types, doc_ids = pre.create_sparse_bow(['x', 'y', 'z'], [['a', 'b', 'a'], [], ['b']])
+    with tempfile.TemporaryDirectory() as tmp:
+        pre.save_bow_mm(matrix, os.path.join(tmp, 'csr'))
+        pre.save_bow_mm(pre.sparse_bow_to_mm(matrix), os.path.join(tmp, 'df'), chunksize=1)
+        with open(os.path.join(tmp, 'csr.mm')) as f:
+            csr_lines = f.read().splitlines()
+        with open(os.path.join(tmp, 'df.mm')) as f:
+            df_lines = f.read().splitlines()
+    assert csr_lines == df_lines
+    assert csr_lines[1:] == ['3 2 3', '1 1 2', '1 2 1', '3 2 1']
+
+class _FakeModel:
+    """Topic model stub: one topic per token id."""
+    num_topics = 3
+    minimum_probability = 0.01
+
+    def __getitem__(self, chunk):
+        return [[(token_id, 1.0)] for token_id, count in (doc[0] for doc in chunk)]
+
+class _FakeLdaModel(_FakeModel):
+    def inference(self, chunk):
+        gamma = np.full((len(chunk), self.num_topics), 0.001)
+        for row, doc in zip(gamma, chunk):
+            row[doc[0][0]] = 1.0
+        return gamma, None
+
+def test_infer_doc_topics():
+    corpus = [[(0, 1)], [(2, 4)], [(1, 1)], [(2, 1)]]
+    expected = np.zeros((3, 3))
+    expected[[0, 1, 2], [0, 2, 1]] = 1.0
+    for model in _FakeModel(), _FakeLdaModel():
+        doc_topic = pre.infer_doc_topics(model, corpus, num_docs=3, chunksize=2)
+        assert np.allclose(doc_topic, expected, atol=0.01)
+        assert (doc_topic[expected == 0] == 0).all()
+
+def test_read_from_tei():
+    from lxml import etree
+    doclist = pre.create_document_list(str(Path(project_path, 'corpus_tei')), 'xml')
+    ns = dict(tei=pre.TEI_NAMESPACE)
+    expected = ["".join(etree.parse(file).xpath('//tei:text', namespaces=ns)[0]
+                        .xpath('.//text()')) for file in doclist]
+    assert list(pre.read_from_tei(doclist)) == expected
+    with_metadata = list(pre.read_from_tei(doclist, metadata=True, workers=2))
+    assert [text for text, metadata in with_metadata] == expected
+    amerika = [metadata for text, metadata in with_metadata if metadata.title == 'Amerika']
+    assert amerika == [pre.TEIMetadata('Amerika', 'Schnitzler, Arthur', '1862-1931')]
+
+def test_read_tei_nested():
+    from io import BytesIO
+    xml = ('<TEI xmlns="http://www.tei-c.org/ns/1.0"><teiHeader><fileDesc><titleStmt>'
+           '<title> A  title </title></titleStmt></fileDesc></teiHeader>'
+           '<text>a<body>b<p>c<hi>d</hi>e<!-- x -->f</p>g<p/>h</body>i</text>j</TEI>')
+    text, metadata = pre.read_tei(BytesIO(xml.encode('utf-8')), metadata=True)
+    assert text == 'abcdefghi'
+    assert metadata == pre.TEIMetadata('A title', None, None)
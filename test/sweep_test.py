@@ -0,0 +1,58 @@
+from dariah_topics import preprocessing as pre
+from dariah_topics import sweep
+from nose.tools import eq_
+import os
+import shutil
+import tempfile
+
+doc_tokens = [['kaffee', 'tee', 'milch', 'zucker', 'kaffee'],
+              ['tee', 'zucker', 'kuchen', 'tee'],
+              ['hund', 'katze', 'maus', 'hund'],
+              ['katze', 'maus', 'vogel', 'katze'],
+              ['kaffee', 'kuchen', 'milch', 'katze']]
+matrix, id_types, doc_ids = pre.create_sparse_bow(['a', 'b', 'c', 'd', 'e'], doc_tokens)
+
+
+def _prepared():
+    folder = tempfile.mkdtemp()
+    sweep.prepare_sweep(matrix, id_types, folder)
+    return folder
+
+
+def test_sweep_writes_results_and_best_model():
+    folder = _prepared()
+    try:
+        results = sweep.sweep(folder, num_topics=(2, 3), seeds=(0, 1), workers=1,
+                              keep_best=2, iterations=5)
+        eq_(len(results), 4)
+        eq_(sorted(results.columns), sorted(sweep.RESULT_COLUMNS))
+        eq_(results['npmi'].tolist(), sorted(results['npmi'], reverse=True))
+        eq_(sorted(os.listdir(os.path.join(folder, 'models'))), sorted(results['name'][:2]))
+        model = sweep.load_model(folder, results['name'][0])
+        eq_(model.num_topics, results['num_topics'][0])
+        eq_(model.id2word[0], 'kaffee')
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_sweep_resumes():
+    folder = _prepared()
+    try:
+        sweep.sweep(folder, num_topics=(2,), workers=1, iterations=5)
+        first = sweep.read_results(folder)
+        results = sweep.sweep(folder, num_topics=(2, 3), workers=1, iterations=5)
+        eq_(len(results), 2)
+        # the finished model was not trained again
+        eq_(sweep.read_results(folder)['seconds'][0], first['seconds'][0])
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_sweep_process_pool():
+    folder = _prepared()
+    try:
+        results = sweep.sweep(folder, num_topics=(2, 3), workers=2, iterations=5)
+        eq_(sorted(results['num_topics']), [2, 3])
+        eq_(len(os.listdir(os.path.join(folder, 'models'))), 1)
+    finally:
+        shutil.rmtree(folder)
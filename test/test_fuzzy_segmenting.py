@@ -1,9 +1,12 @@
 from dariah_topics.preprocessing import segment_fuzzy, split_paragraphs, \
-    segment, tokenize
+    segment, tokenize, segmenter, stream_tokens, chunk_array, segment_array, \
+    segment_bounds
+from dariah_topics.doclist import PathDocList
 from functools import partial
 from nose.tools import eq_
 from itertools import chain
 from pathlib import Path
+import random
 import re
 
 
@@ -106,3 +109,78 @@ def test_segment():
     lengths = list(map(len, segments))
     assert min(lengths[:-1]) >= 950, "a segment is too short in " + str(segments)
     assert max(lengths) <= 1050, "a segment is too long in " + str(segments)
+
+
+def test_segmenter_fixed():
+    """fixed-size segments across a stream of documents"""
+    documents = iter([iter("a b c d e".split()), iter([]), iter("f g".split())])
+    eq_(list(segmenter(documents, length=2)),
+        [['a', 'b'], ['c', 'd'], ['e'], ['f', 'g']])
+
+
+def test_segmenter_records_counts():
+    """segment counts are recorded in the document list"""
+    docs = PathDocList('test', filenames=['file1.txt', 'file2.txt', 'file3.txt'])
+    documents = [list('abcdefghij'), [], list('abcd')]
+    segments = list(segmenter(documents, length=4, doclist=docs))
+    eq_(len(segments), 4)
+    eq_(docs.segment_counts(), [3, 0, 1])
+
+
+def test_segmenter_fuzzy():
+    """chunked documents are segmented like segment_fuzzy"""
+    path = project_path.joinpath('corpus_txt', 'Doyle_AStudyinScarlet.txt')
+    text = path.read_text(encoding='utf-8')
+    expected = segment(text, segment_size=1000, tolerance=0.05,
+                       chunker=partial(split_paragraphs, sep=re.compile(r'\n\s*\n')),
+                       tokenizer=tokenize, flatten_chunks=True)
+    chunks = stream_tokens(str(path), paragraphs=True)
+    eq_(list(segmenter([chunks], length=1000, tolerance=0.05)), list(expected))
+
+
+def test_segmenter_unsplit_chunks():
+    """with tolerance < 0, oversized chunks become segments of their own"""
+    documents = [[list('abcdefghij'), list('ab'), list('abc')]]
+    eq_(list(segmenter(documents, length=4, tolerance=-1)),
+        [list('abcdefghij'), list('ababc')])
+    eq_(list(segmenter(documents, length=4, tolerance=4)),
+        [list('abcdefghij'), list('ababc')])
+
+
+def test_stream_tokens():
+    path = project_path.joinpath('corpus_txt', 'Doyle_AStudyinScarlet.txt')
+    expected = list(tokenize(path.read_text(encoding='utf-8')))
+    eq_(list(stream_tokens(str(path), blocksize=100)), expected)
+    eq_(list(chain.from_iterable(stream_tokens(str(path), paragraphs=True))), expected)
+
+
+def _random_document(rng):
+    return [[str(rng.randrange(50)) for _ in range(rng.choice([0, 1, 3, 8, rng.randrange(40)]))]
+            for _ in range(rng.randrange(12))]
+
+
+def test_segment_array_matches_segment_fuzzy():
+    """segment_array yields the same segments as segment_fuzzy on random documents"""
+    rng = random.Random(42)
+    for case in range(2000):
+        document = _random_document(rng)
+        segment_size = rng.randrange(1, 30)
+        tolerance = rng.choice([0, 1, 2, 5, 40, -1, 0.05, 0.2, 0.5])
+        expected = [list(chain.from_iterable(seg))
+                    for seg in segment_fuzzy(document, segment_size, tolerance)]
+        tokens, bounds = chunk_array(document)
+        segments = segment_array(tokens, bounds, segment_size, tolerance)
+        eq_([seg.tolist() for seg in segments], expected,
+            msg=str((document, segment_size, tolerance)))
+
+
+def test_segment_array_views():
+    """segments are views of the token id array"""
+    document = [['a', 'b', 'c'], ['d', 'e'], ['a', 'b']]
+    id_types = {'a': 1, 'b': 2, 'c': 3, 'd': 4, 'e': 5}
+    token_ids, bounds = chunk_array(document, id_types)
+    eq_(bounds.tolist(), [0, 3, 5, 7])
+    segments = segment_array(token_ids, bounds, segment_size=4, tolerance=1)
+    eq_([seg.tolist() for seg in segments], [[1, 2, 3], [4, 5, 1, 2]])
+    assert all(seg.base is token_ids for seg in segments)
+    eq_(segment_bounds([0, 10], segment_size=4, tolerance=-1).tolist(), [0, 10])
@@ -0,0 +1,70 @@
+from dariah_topics.vocabulary import Vocabulary
+from dariah_topics import preprocessing as pre
+from gensim.models import LdaModel
+from nose.tools import eq_
+import os
+import tempfile
+
+
+def test_lookups():
+    tokens = ['w%d' % n for n in range(1000)] + ['kaffee', 'über', '']
+    vocabulary = Vocabulary(tokens + ['w5'])
+    eq_(len(vocabulary), len(tokens))
+    eq_([vocabulary[token] for token in tokens], list(range(1, len(tokens) + 1)))
+    eq_([vocabulary.token(n) for n in range(1, len(tokens) + 1)], tokens)
+    eq_(list(vocabulary), tokens)
+    eq_(dict(vocabulary), {token: n for n, token in enumerate(tokens, 1)})
+    assert 'tee' not in vocabulary
+    eq_(vocabulary.get('tee'), None)
+    eq_(vocabulary.inverse[1002], 'über')
+    eq_(vocabulary.id2word()[1001], 'über')
+
+
+def test_fixed_ids():
+    vocabulary = Vocabulary(['a'])
+    vocabulary['b'] = 2
+    for token, token_id in [('c', 5), ('a', 3)]:
+        try:
+            vocabulary[token] = token_id
+            assert False, "ValueError expected"
+        except ValueError:
+            pass
+    eq_(Vocabulary.from_dictionary({'b': 2, 'a': 1}), {'a': 1, 'b': 2})
+    eq_(Vocabulary.from_documents([['b', 'a'], ['c', 'a']]), {'b': 1, 'a': 2, 'c': 3})
+    eq_(Vocabulary.from_documents([['b', 'a'], ['c', 'a']], sort=True), {'a': 1, 'b': 2, 'c': 3})
+
+
+def test_save_load():
+    vocabulary = Vocabulary('t%d' % n for n in range(100))
+    with tempfile.TemporaryDirectory() as tmp:
+        vocabulary.save(os.path.join(tmp, 'vocabulary'))
+        loaded = Vocabulary.load(os.path.join(tmp, 'vocabulary'))
+        eq_(loaded, vocabulary)
+        eq_(loaded['t42'], 43)
+        eq_(loaded.add('neu'), 101)
+        eq_(loaded['neu'], 101)
+        eq_(Vocabulary.load(os.path.join(tmp, 'vocabulary'))['t99'], 100)
+        assert 'neu' not in Vocabulary.load(os.path.join(tmp, 'vocabulary'), mmap_mode=None)
+
+
+def test_preprocessing_with_vocabulary():
+    doc_tokens = [['a', 'b', 'a'], ['c', 'a', 'd']]
+    vocabulary = Vocabulary()
+    rows = list(pre.stream_bow(zip(['x', 'y'], doc_tokens), vocabulary))
+    eq_(dict(vocabulary), {'a': 1, 'b': 2, 'c': 3, 'd': 4})
+    matrix, id_types, doc_ids = pre.create_sparse_bow(['x', 'y'], doc_tokens, vocabulary)
+    eq_(matrix.toarray().tolist(), [[2, 1, 0, 0], [1, 0, 1, 1]])
+    sparse_bow = pre.sparse_bow_to_mm(matrix)
+    eq_(pre.find_stopwords(sparse_bow, vocabulary, 1), ['a'])
+    eq_(sorted(pre.find_hapax(sparse_bow, vocabulary)), ['b', 'c', 'd'])
+
+
+def test_gensim_id2word():
+    doc_tokens = [['kaffee', 'tee', 'kaffee'], ['tee', 'kuchen']]
+    matrix, id_types, doc_ids = pre.create_sparse_bow(['x', 'y'], doc_tokens)
+    vocabulary = Vocabulary.from_dictionary(id_types)
+    corpus = [list(zip(row.indices.tolist(), row.data.tolist())) for row in matrix]
+    model = LdaModel(corpus, id2word=vocabulary.id2word(), num_topics=2, random_state=1)
+    eq_(model.num_terms, 3)
+    eq_(sorted(word for word, probability in model.show_topic(0, 3)),
+        ['kaffee', 'kuchen', 'tee'])
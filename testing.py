@@ -5,7 +5,9 @@
 import logging
 logging.basicConfig(level=logging.INFO)
 
+from dariah_topics import cache
 from dariah_topics import preprocessing as pre
+from dariah_topics.vocabulary import Vocabulary
 import glob
 import os.path
 import pandas as pd
@@ -30,21 +32,13 @@ def gensim2dataframe(model):
 path_txt = "/mnt/data/corpora/grenzboten/txt"
 
 doclist_txt = pre.create_document_list(path_txt)
-doc_labels = list(pre.get_labels(doclist_txt))
 
-corpus_txt = pre.read_from_txt(doclist_txt)
-doc_tokens = [list(pre.tokenize(txt)) for txt in list(corpus_txt)]
-id_types, doc_ids = pre.create_dictionaries(doc_labels, doc_tokens)
-sparse_bow = pre.create_mm(doc_labels, doc_tokens, id_types, doc_ids)
+# tokens, bag-of-words, stopwords and hapax legomena are cached in
+# .dariah_cache and only recomputed for changed files
+pipeline_cache = cache.PipelineCache(".dariah_cache", max_size=4 * 2**30)
+sparse_bow_short, id_types, doc_ids = cache.preprocess(doclist_txt, pipeline_cache, mfw=200)
 doc2id = {value : key for key, value in doc_ids.items()}
-type2id = {value : key for key, value in id_types.items()}
-
-hapax_from_remove = pre.find_hapax(sparse_bow, id_types)
-stopwords_from_remove = set(pre.find_stopwords(sparse_bow, id_types))
-
-features_to_be_removed = hapax_from_remove.union(set(stopwords_from_remove))
-
-sparse_bow_short = pre.remove_features(sparse_bow, id_types,features_to_be_removed)
+type2id = Vocabulary.from_dictionary(id_types).id2word()
 
 pre.save_bow_mm(sparse_bow_short, "gensim_txt")
 